@@ -10,22 +10,40 @@ __version__ = '1.3.6'
 
 import os
 import time
-import zipfile
-import tempfile
 import shutil
 import mimetypes
 import json
 import warnings
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
+from requests.adapters import DEFAULT_POOLSIZE, DEFAULT_POOLBLOCK
 
 from requests_toolbelt import MultipartEncoder, MultipartEncoderMonitor
 from requests_oauthlib import OAuth2Session
 from oauthlib.oauth2 import LegacyApplicationClient, TokenExpiredError
 
+from .adapters import PoolingHTTPAdapter, PoolStatistics
 from .endpoints.resources import ResourceEndpoint, ResourceList
 from .exceptions import *
-from .generators import resultsListGenerator
+from .generators import resultsListGenerator, PaginationCursor
+from .records import ResourceSummary, ResourceFileInfo
+from .columnar import FILE_COLUMNS
+from .batch import BatchResult, executeBatch, DEFAULT_MAX_WORKERS
+from .retry import RetryPolicy
+from .tasks import TaskTracker
+from .downloads import segmentedDownload, resumableDownload, DEFAULT_SEGMENT_SIZE
+from .checksums import ChecksumWriter
+from .chunks import readChunks
+from .bags import BagStreamExtractor, BagDownload, extractBagFile
+from .uploads import UploadProgress, UploadStrategy, SinglePostUpload, ChunkedUpload, uploadSize, \
+    uploadItem
+from .sync import SyncIndex, SyncSummary, listedPath, localPath, removeLocalCopy
+from .compat import unquote, replace
+from .cache import ResponseCache, DiskResponseCache, NegativeCache, FileCache, cacheKey, resourceIdFromUrl, \
+    SAFE_METHODS
 
 
 STREAM_CHUNK_SIZE = 100 * 1024
@@ -55,6 +73,32 @@ class HydroShare(object):
         :param verify: Boolean, if True, security certificates will be verified
         :param auth: Concrete instance of AbstractHydroShareAuth (e.g. HydroShareAuthBasic)
         :param prompt_auth: Boolean, default True, prompts user/pass if no auth is given
+        :param pool_connections: Integer, number of per-host connection pools to cache
+        :param pool_maxsize: Integer, maximum number of connections kept open per host.  Should be at least
+            the number of threads sharing this object.  Raised to the number of workers of batch(), concurrent
+            listings and segmented downloads that need more, unless pool_block is True.
+        :param pool_block: Boolean, if True, requests wait for a pooled connection to become free instead
+            of opening a throwaway connection when all pool_maxsize connections are busy; pool_maxsize is then
+            a hard limit on the connections opened per host
+        :param keep_alive: Boolean, if False, connections are closed after every request
+        :param retry_policy: RetryPolicy deciding how failed requests are retried.  Defaults to RetryPolicy(),
+            which retries idempotent requests on connection errors and 429/502/503/504 responses.  Use
+            RetryPolicy(max_attempts=1) to disable retries.
+        :param cache: ResponseCache (or DiskResponseCache, which can be shared between processes) used to
+            revalidate, rather than download again, the responses of metadata requests (getSystemMetadata,
+            getScienceMetadata, getScienceMetadataRDF, getResourceMap, getResourceTypes and
+            getResourceFolderContents).  None (the default) disables caching.
+        :param negative_cache: NegativeCache remembering, for a short time, metadata and file requests that failed
+            with HydroShareNotFound or HydroShareNotAuthorized, so that repeating them raises again without a
+            round trip to the server.  None (the default) disables it.
+        :param file_cache: FileCache keeping the files downloaded by getResourceFile to a destination, which
+            serves them again without downloading them while they are unchanged.  None (the default) disables it.
+        :param upload_strategy: UploadStrategy (see hs_restclient.uploads) sending the files of addResourceFile and
+            createResource.  Defaults to SinglePostUpload(), a single multipart POST per file; ChunkedUpload()
+            sends large files in parts that are retried, and resumed by a later process, on their own.
+
+        The tasks attribute holds the TaskTracker (see hs_restclient.tasks) that waits for bags to be created,
+        polling with exponential backoff.  Replace it to change its intervals or to give all waits a deadline.
 
         :raises: HydroShareAuthenticationException if auth is not a known authentication type.
         :raises: HydroShareAuthenticationException if auth is specified by use_https is False.
@@ -66,11 +110,25 @@ class HydroShare(object):
 
 
     def __init__(self, hostname=DEFAULT_HOSTNAME, port=None, use_https=True, verify=True,
-                 auth=None, prompt_auth=True):
+                 auth=None, prompt_auth=True, pool_connections=DEFAULT_POOLSIZE, pool_maxsize=DEFAULT_POOLSIZE,
+                 pool_block=DEFAULT_POOLBLOCK, keep_alive=True, retry_policy=None, cache=None,
+                 negative_cache=None, file_cache=None, upload_strategy=None):
         self.hostname = hostname
         self.verify = verify
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self.cache = cache
+        self.negative_cache = negative_cache
+        self.file_cache = file_cache
+        self.upload_strategy = upload_strategy if upload_strategy is not None else SinglePostUpload()
+        self.tasks = TaskTracker(self)
 
         self.session = None
+        self._session_lock = threading.RLock()
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.pool_block = pool_block
+        self.keep_alive = keep_alive
+        self.pool_statistics = PoolStatistics()
         self.auth = None
         if auth:
             self.auth = auth
@@ -109,7 +167,7 @@ class HydroShare(object):
             resource_endpoint = ResourceEndpoint(self, kwargs.get('id', None))
             return resource_endpoint
 
-        return ResourceList(self, **kwargs).list
+        return ResourceList(self, **kwargs)
 
     @property
     def resource_types(self):
@@ -150,32 +208,177 @@ class HydroShare(object):
         else:
             raise HydroShareAuthenticationException("Unsupported authentication type '{0}'.".format(str(type(self.auth))))
 
-    def _request(self, method, url, params=None, data=None, json=None, files=None, headers=None, stream=False):
+        self._mountAdapters(self.session)
+
+    def _mountAdapters(self, session):
+        # Applies to both plain and OAuth2 sessions
+        adapter = PoolingHTTPAdapter(statistics=self.pool_statistics,
+                                     pool_connections=self.pool_connections,
+                                     pool_maxsize=self.pool_maxsize,
+                                     pool_block=self.pool_block)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        if not self.keep_alive:
+            session.headers['Connection'] = 'close'
+
+    def _ensurePoolSize(self, size):
+        # Each worker thread needs its own pooled connection, otherwise urllib3 discards
+        # connections beyond pool_maxsize and re-handshakes for every request.  With pool_block,
+        # pool_maxsize is a cap on connections the workers have to wait for, so it is left alone.
+        with self._session_lock:
+            if size > self.pool_maxsize and not self.pool_block:
+                self.pool_maxsize = size
+                replaced = self.session.get_adapter(self.url_base)
+                self._mountAdapters(self.session)
+                replaced.close()
+
+    def getPoolStatistics(self):
+        """ Get counters for the connection pools used by this object
+
+        :return: A dict with 'requests' sent, 'connections_created' and 'connections_reused'.  Every reused
+            connection is a TCP (and TLS) handshake saved.
+        """
+        return self.pool_statistics.asDict()
+
+    def getCacheStatistics(self):
+        """ Get counters for the response cache
+
+        :return: A dict with cache 'hits', 'misses' and 'revalidations', or None if no cache is configured.
+        """
+        if self.cache is None:
+            return None
+        return self.cache.statistics.asDict()
+
+    def _resetSession(self, failed_session):
+        # Several threads may hit the same dead connection; only rebuild the session once
+        with self._session_lock:
+            if self.session is failed_session:
+                self._initializeSession()
+            return self.session
+
+    def _request(self, method, url, params=None, data=None, json=None, files=None, headers=None, stream=False,
+                 retryable=None, endpoint=None, pid=None, use_cache=True):
+        """ Send a request, retrying according to self.retry_policy.
+
+        :param data: Request body, or a callable returning a fresh body for every attempt (needed for
+            streamed bodies such as a MultipartEncoderMonitor, which can only be sent once)
+        :param retryable: True or False to override whether the retry policy considers this request safe to
+            retry; by default only idempotent methods are retried
+        :param endpoint: Name of the metadata endpoint a GET request is for (e.g. 'sysmeta').  Only requests
+            naming an endpoint go through self.cache.
+        :param pid: The HydroShare ID of the resource the request is about, recorded with cached responses.
+            Methods other than GET, HEAD and OPTIONS invalidate the cached responses of this resource (taken from
+            the URL if not given).
+        :param use_cache: If False, make the request even if a cached (or negatively cached) response is
+            available; the caches are still updated with the result
+        """
+        cache = self.cache
+        negative_cache = self.negative_cache
+        if endpoint is None or method not in ('GET', 'HEAD'):
+            r = self._send(method, url, params=params, data=data, json=json, files=files, headers=headers,
+                           stream=stream, retryable=retryable)
+            if method not in SAFE_METHODS:
+                pid = pid or resourceIdFromUrl(url)
+                for c in (cache, negative_cache):
+                    if c is not None and pid is not None:
+                        c.invalidate(pid)
+            return r
+
+        key = cacheKey(url, params)
+        if use_cache and negative_cache is not None:
+            r = negative_cache.lookup(key)
+            if r is not None:
+                return r
+
+        if cache is not None and not stream and method == 'GET':
+            entry = None
+            if use_cache:
+                entry, headers, cached = cache.prepare(key, headers)
+                if cached is not None:
+                    return cached
+            r = self._send(method, url, params=params, headers=headers, retryable=retryable)
+            r = cache.update(key, entry, r, endpoint=endpoint, pid=pid)
+        else:
+            r = self._send(method, url, params=params, headers=headers, stream=stream, retryable=retryable)
+
+        if negative_cache is not None:
+            negative_cache.update(key, r, pid=pid)
+        return r
+
+    def _send(self, method, url, params=None, data=None, json=None, files=None, headers=None, stream=False,
+              retryable=None):
         if(data and json):
             raise Exception("Can't pass data and json at the same time")
 
         if(json):
             data = json
 
+        policy = self.retry_policy
+        if retryable is None:
+            retryable = policy.isRetryable(method)
+        if hasattr(data, 'read'):
+            # A stream (such as a MultipartEncoderMonitor) is read by the first attempt, leaving nothing to send
+            # again; a body that may be retried is given as a callable building it afresh
+            retryable = False
+
         r = None
+        session = self.session
+        started = time.time()
+        attempt = 1
 
-        try:
-            if(json):
-                r = self.session.request(method, url, params=params, json=data, files=files, headers=headers, stream=stream,
-                                         verify=self.verify)
+        while True:
+            body = data() if callable(data) else data
+            try:
+                if(json):
+                    r = session.request(method, url, params=params, json=body, files=files, headers=headers,
+                                        stream=stream, verify=self.verify)
+                else:
+                    r = session.request(method, url, params=params, data=body, files=files, headers=headers,
+                                        stream=stream, verify=self.verify)
+            except requests.ConnectionError:
+                delay = policy.nextDelay(attempt, started) if retryable else None
+                if delay is None:
+                    raise
+                # We might have gotten a connection error because the server we were talking to went down.
+                #  Re-initialize the session before trying again
+                session = self._resetSession(session)
             else:
-                r = self.session.request(method, url, params=params, data=data, files=files, headers=headers, stream=stream,
-                                         verify=self.verify)
-        except requests.ConnectionError:
-            # We might have gotten a connection error because the server we were talking to went down.
-            #  Re-initialize the session and try again
-            self._initializeSession()
-            r = self.session.request(method, url, params=params, data=data, files=files, headers=headers, stream=stream,
-                                     verify=self.verify)
+                delay = policy.nextDelay(attempt, started, r) if retryable else None
+                if delay is None:
+                    return r
+                r.close()
 
-        return r
+            policy.sleep(delay)
+            attempt += 1
+
+    def _multipartBody(self, params, progress_callback, retry):
+        """ Body, headers and retryable flag for a multipart upload of params, see _prepareFileForUpload.
 
-    def _prepareFileForUpload(self, request_params, resource_file, resource_filename=None):
+        When the upload may be retried (retry is True, or the retry policy retries POSTs) the body is returned
+        as a callable that rewinds the file and rebuilds the encoder, so _request can send it again.
+        """
+        if progress_callback is None:
+            progress_callback = default_progress_callback
+        boundary = uuid.uuid4().hex
+        headers = {'Content-Type': 'multipart/form-data; boundary={0}'.format(boundary)}
+
+        fd = params['file'][1] if 'file' in params else None
+        seekable = fd is None or (hasattr(fd, 'seekable') and fd.seekable())
+        if retry and not seekable:
+            raise HydroShareArgumentException("resource_file must be seekable when retry is True.")
+        if not seekable or not (retry or self.retry_policy.isRetryable('POST')):
+            return MultipartEncoderMonitor(MultipartEncoder(params, boundary=boundary), progress_callback), \
+                headers, False
+
+        start = fd.tell() if fd is not None else None
+
+        def body():
+            if fd is not None:
+                fd.seek(start)
+            return MultipartEncoderMonitor(MultipartEncoder(params, boundary=boundary), progress_callback)
+        return body, headers, True
+
+    def _prepareFileForUpload(self, request_params, resource_file, resource_filename=None, folder=None):
         fname = None
         close_fd = False
         if isinstance(resource_file, str):
@@ -201,17 +404,62 @@ class HydroShare(object):
         else:
             mime_type = mime_type[0]
         request_params['file'] = (fname, fd, mime_type)
-        request_params['folder'] = os.path.dirname(fname)
+        request_params['folder'] = os.path.dirname(fname) if folder is None else folder
         return close_fd
 
+    def map(self, method, iterable, max_workers=DEFAULT_MAX_WORKERS, ordered=True):
+        """ Call a method once for each item of iterable, concurrently.
+
+        >>> for result in hs.map('getSystemMetadata', pids, max_workers=16):
+        >>>     if result.ok:
+        >>>         print(result.value['resource_title'])
+        >>>     else:
+        >>>         print(result.args[0], result.exception)
+
+        :param method: Name of a HydroShare method (e.g. 'getSystemMetadata'), or any callable
+        :param iterable: Items to pass, one at a time, as the single argument of method
+        :param max_workers: Number of calls in flight at once
+        :param ordered: If True, results are yielded in the order of iterable, otherwise as they complete
+
+        :return: A generator of BatchResult objects.  HydroShareNotFound, HydroShareNotAuthorized and other
+            HydroShareExceptions are captured in the BatchResult of the failing item rather than stopping the batch.
+        """
+        return self.batch(((method, (item,)) for item in iterable), max_workers=max_workers, ordered=ordered)
+
+    def batch(self, calls, max_workers=DEFAULT_MAX_WORKERS, ordered=True):
+        """ Make a sequence of calls concurrently over this client's pooled session.
+
+        >>> results = hs.batch([('getScienceMetadata', (pid,)),
+        >>>                     ('getResourceFile', (pid, 'data.csv'), {'destination': '/tmp'})])
+
+        :param calls: Iterable of (method, args) or (method, args, kwargs) tuples, where method is the name of
+            a HydroShare method or any callable
+        :param max_workers: Number of calls in flight at once
+        :param ordered: If True, results are yielded in the order of calls, otherwise as they complete
+
+        :return: A generator of BatchResult objects, one per call.
+        """
+        self._ensurePoolSize(max_workers)
+
+        def prepare():
+            for call in calls:
+                method, args = call[0], call[1]
+                kwargs = call[2] if len(call) > 2 else {}
+                if not callable(method):
+                    method = getattr(self, method)
+                yield method, tuple(args), kwargs
+
+        return executeBatch(prepare(), max_workers=max_workers, ordered=ordered)
+
     def getResourceList(self, **kwargs):
         warnings.warn("This syntax is deprecated, please use hs.resources(**kwargs) instead.")
         return self.resources(**kwargs)
 
-    def getSystemMetadata(self, pid):
+    def getSystemMetadata(self, pid, use_cache=True):
         """ Get system metadata for a resource
 
         :param pid: The HydroShare ID of the resource
+        :param use_cache: If False, ask the server even if a cached response is available
 
         :raises: HydroShareHTTPException to signal an HTTP error
 
@@ -232,7 +480,7 @@ class HydroShare(object):
         """
         url = "{url_base}/resource/{pid}/sysmeta/".format(url_base=self.url_base,
                                                  pid=pid)
-        r = self._request('GET', url)
+        r = self._request('GET', url, endpoint='sysmeta', pid=pid, use_cache=use_cache)
         if r.status_code != 200:
             if r.status_code == 403:
                 raise HydroShareNotAuthorized(('GET', url))
@@ -243,10 +491,11 @@ class HydroShare(object):
 
         return r.json()
 
-    def getScienceMetadataRDF(self, pid):
+    def getScienceMetadataRDF(self, pid, use_cache=True):
         """ Get science metadata for a resource in XML+RDF format
 
         :param pid: The HydroShare ID of the resource
+        :param use_cache: If False, ask the server even if a cached response is available
         :raises: HydroShareNotAuthorized if the user is not authorized to view the metadata.
         :raises: HydroShareNotFound if the resource was not found.
         :raises: HydroShareHTTPException to signal an HTTP error.
@@ -347,7 +596,7 @@ class HydroShare(object):
         """
 
         url = "{url_base}/scimeta/{pid}/".format(url_base=self.url_base, pid=pid)
-        r = self._request('GET', url)
+        r = self._request('GET', url, endpoint='scimeta_rdf', pid=pid, use_cache=use_cache)
         if r.status_code != 200:
             if r.status_code == 403:
                 raise HydroShareNotAuthorized(('GET', url))
@@ -358,11 +607,12 @@ class HydroShare(object):
 
         return str(r.content)
 
-    def getScienceMetadata(self, pid):
+    def getScienceMetadata(self, pid, use_cache=True):
         """ Get science metadata for a resource in JSON format
         Note: Dublin core metadata as well as any resource specific metadata is retrieved.
 
         :param pid: The HydroShare ID of the resource
+        :param use_cache: If False, ask the server even if a cached response is available
         :raises: HydroShareNotAuthorized if the user is not authorized to view the metadata.
         :raises: HydroShareNotFound if the resource was not found.
         :raises: HydroShareHTTPException to signal an HTTP error.
@@ -411,7 +661,7 @@ class HydroShare(object):
 
         url = "{url_base}/resource/{pid}/scimeta/elements".format(url_base=self.url_base, pid=pid)
 
-        r = self._request('GET', url)
+        r = self._request('GET', url, endpoint='scimeta', pid=pid, use_cache=use_cache)
         if r.status_code != 200:
             if r.status_code == 403:
                 raise HydroShareNotAuthorized(('GET', url))
@@ -486,10 +736,11 @@ class HydroShare(object):
 
         return r.json()
 
-    def getResourceMap(self, pid):
+    def getResourceMap(self, pid, use_cache=True):
         """ Get resource map metadata for a resource
 
         :param pid: The HydroShare ID of the resource
+        :param use_cache: If False, ask the server even if a cached response is available
         :raises: HydroShareNotAuthorized if the user is not authorized to view the metadata.
         :raises: HydroShareNotFound if the resource was not found.
         :raises: HydroShareHTTPException to signal an HTTP error.
@@ -554,7 +805,7 @@ class HydroShare(object):
         """
         url = "{url_base}/resource/{pid}/map/".format(url_base=self.url_base,
                                                  pid=pid)
-        r = self._request('GET', url)
+        r = self._request('GET', url, endpoint='resource_map', pid=pid, use_cache=use_cache)
         if r.status_code != 200:
             if r.status_code == 403:
                 raise HydroShareNotAuthorized(('GET', url))
@@ -565,7 +816,8 @@ class HydroShare(object):
 
         return str(r.content)
 
-    def getResource(self, pid, destination=None, unzip=False, wait_for_bag_creation=True):
+    def getResource(self, pid, destination=None, unzip=False, wait_for_bag_creation=True, resume=False,
+                    verify=False, extract_workers=0):
         """ Get a resource in BagIt format
 
         :param pid: The HydroShare ID of the resource
@@ -573,62 +825,116 @@ class HydroShare(object):
             $(PID).zip in destination; existing file of the same name will be overwritten. If None, a stream to the
             zipped bag will be returned instead.
         :param unzip: True if the bag should be unzipped when saved to destination. Bag contents to be saved to
-            directory named $(PID) residing in destination. Only applies when destination is not None.
+            directory named $(PID) residing in destination. Only applies when destination is not None.  Unless
+            resume is True, the bag is extracted as it is downloaded, without saving the zip file.
 
         :param wait_for_bag_creation: True if to wait to download the bag in case the bag is not ready
-            (bag needs to be recreated before it can be downloaded).
+            (bag needs to be recreated before it can be downloaded), or the number of seconds to wait at most.
+        :param resume: True to download the bag to $(PID).zip.part in destination, next to a small sidecar
+            file, so that a download interrupted in the meantime is resumed where it stopped.  The part is
+            renamed to $(PID).zip once its size has been checked (and, with unzip, removed once extracted).
+        :param verify: True to check the files of the bag against the checksums of its manifest-*.txt and
+            tagmanifest-*.txt files.  With unzip, files are hashed as they are extracted; otherwise the saved
+            zip file is read back once.
+        :param extract_workers: With unzip, number of threads inflating large files of the bag while the rest of
+            it is downloaded.  0 (the default) extracts everything on the calling thread.
         :raises: HydroShareArgumentException if any arguments are invalid.
         :raises: HydroShareNotAuthorized if the user is not authorized to access the
             resource.
         :raises: HydroShareNotFound if the resource was not found.
         :raises: HydroShareHTTPException to signal an HTTP error
-        :raise: HydroShareBagNotReady if the bag is not ready to be downloaded and wait_for_bag_creation is False
+        :raise: HydroShareBagNotReady if the bag is not ready to be downloaded and wait_for_bag_creation is False,
+            or still not ready after wait_for_bag_creation seconds
+        :raises: HydroShareChecksumException if verify is True and a file does not match the bag's manifests.  The
+            zip file or the extracted directory is removed.
+        :raises: HydroShareException if the bag cannot be extracted; a partially extracted directory is removed.
 
         :return: None if the bag was saved directly to disk.  Or a generator representing a buffered stream of the
             bytes comprising the bag returned by the REST end point.
         """
-        stream = self._getBagStream(pid, wait_for_bag_creation)
         if destination:
-            self._storeBagOnFilesystem(stream, pid, destination, unzip)
+            self._storeBagOnFilesystem(pid, destination, unzip, wait_for_bag_creation, resume, verify,
+                                       extract_workers)
             return None
         else:
-            return stream
+            return self._getBagStream(pid, wait_for_bag_creation)
 
-    def _storeBagOnFilesystem(self, stream, pid, destination, unzip=False):
+    def _storeBagOnFilesystem(self, pid, destination, unzip=False, wait_for_bag_creation=True, resume=False,
+                              verify=False, extract_workers=0, response=None):
+        # response: a streamed response of the bag already requested, to be saved instead of requesting it again
         if not os.path.isdir(destination):
             raise HydroShareArgumentException("{0} is not a directory.".format(destination))
         if not os.access(destination, os.W_OK):
             raise HydroShareArgumentException("You do not have write permissions to directory '{0}'.".format(destination))
 
-        filename = "{pid}.zip".format(pid=pid)
-        tempdir = None
-        if unzip:
-            tempdir = tempfile.mkdtemp()
-            filepath = os.path.join(tempdir, filename)
-        else:
-            filepath = os.path.join(destination, filename)
-
-        # Download bag (maybe temporarily)
-        with open(filepath, 'wb') as fd:
-            for chunk in stream:
-                fd.write(chunk)
+        filepath = os.path.join(destination, "{pid}.zip".format(pid=pid))
+        dirname = os.path.join(destination, pid)
+        if unzip and not resume:
+            # Extracted as it arrives, without saving the archive
+            r = response or self._getBagResponse(pid, wait_for_bag_creation)
+            try:
+                extractor = BagStreamExtractor(dirname, verify=verify, workers=extract_workers)
+                self._extractBag(dirname, lambda: extractor.extract(readChunks(r)))
+            finally:
+                r.close()
+            return dirname
 
-        if unzip:
+        # Download bag
+        if resume:
+            resumableDownload(lambda headers: self._getBagResponse(pid, wait_for_bag_creation, headers),
+                              self._bagUrl(pid), filepath)
+        else:
+            r = response or self._getBagResponse(pid, wait_for_bag_creation)
             try:
-                dirname = os.path.join(destination, pid)
-                zfile = zipfile.ZipFile(filepath)
-                zfile.extractall(dirname)
-            except Exception as e:
-                print("Received error {e} when unzipping BagIt archive to {dest}.".format(e=repr(e),
-                                                                                          dest=destination))
+                with open(filepath, 'wb') as fd:
+                    for chunk in readChunks(r):
+                        fd.write(chunk)
             finally:
-                shutil.rmtree(tempdir)
+                r.close()
+
+        try:
+            if unzip:
+                self._extractBag(dirname, lambda: extractBagFile(filepath, dirname, verify=verify))
+                os.remove(filepath)
+                return dirname
+            elif verify:
+                extractBagFile(filepath, verify=True)
+        except HydroShareChecksumException:
+            os.remove(filepath)
+            raise
+        return filepath
+
+    def _extractBag(self, dirname, extract):
+        # Remove what a failed extraction left behind, unless it was extracting over an existing directory
+        existed = os.path.isdir(dirname)
+        try:
+            extract()
+        except Exception:
+            if not existed:
+                shutil.rmtree(dirname, ignore_errors=True)
+            raise
+
+    def _bagUrl(self, pid):
+        return "{url_base}/resource/{pid}/".format(url_base=self.url_base, pid=pid)
 
     def _getBagStream(self, pid, wait_for_bag_creation):
-        bag_url = "{url_base}/resource/{pid}/".format(url_base=self.url_base,
-                                                      pid=pid)
-        r = self._request('GET', bag_url, stream=True)
-        if r.status_code != 200:
+        return readChunks(self._getBagResponse(pid, wait_for_bag_creation), copy=True)
+
+    def _getBagResponse(self, pid, wait_for_bag_creation, headers=None):
+        while True:
+            r, task_id = self._requestBag(pid, headers)
+            if task_id is None:
+                return r
+            if not wait_for_bag_creation:
+                raise HydroShareBagNotReadyException("Please try later. The bag is not ready yet for download.")
+            # wait until the bag is ready for download, then ask for it again
+            self._waitForBag(task_id, wait_for_bag_creation)
+
+    def _requestBag(self, pid, headers=None):
+        # (streamed response, None) if the bag can be downloaded, or (None, task ID) if it is being created
+        bag_url = self._bagUrl(pid)
+        r = self._request('GET', bag_url, headers=headers, stream=True)
+        if r.status_code not in (200, 206):
             if r.status_code == 403:
                 raise HydroShareNotAuthorized(('GET', bag_url))
             elif r.status_code == 404:
@@ -639,30 +945,127 @@ class HydroShare(object):
             # this  is the case of bag being generated by hydroshare and not ready for download
             content = json.loads(r.content.decode('utf-8'))
             if content['bag_status'] == "Not ready":
-                if wait_for_bag_creation:
-                    # will wait until the bag is ready for download
-                    status = False
-                    while not status:
-                        # check bag ready status every 3 seconds
-                        time.sleep(3)
-                        task_id = content['task_id']
-                        # check task status
-                        status = self._getTaskStatus(task_id)
-                        if status:
-                            # bag is ready for download
-                            return self._getBagStream(pid, wait_for_bag_creation)
-                else:
-                    raise HydroShareBagNotReadyException("Please try later. The bag is not ready yet for download.")
+                return None, content['task_id']
         elif r.headers['content-type'] == 'text/plain':
             # this is the case of big file issue
             raise HydroShareException(r.content)
+        return r, None
+
+    def _waitForBag(self, task_id, wait_for_bag_creation):
+        timeout = None if wait_for_bag_creation is True else wait_for_bag_creation
+        try:
+            self.tasks.wait(task_id, timeout=timeout)
+        except HydroShareTaskTimeoutException as e:
+            raise self._bagNotReady(e)
+
+    def _bagNotReady(self, timeout_exception):
+        return HydroShareBagNotReadyException("The bag is not ready yet for download after {0} seconds.".format(
+            timeout_exception.timeout))
+
+    def getResources(self, pids, destination, max_workers=DEFAULT_MAX_WORKERS, unzip=False,
+                     wait_for_bag_creation=True, verify=False):
+        """ Get the bags of many resources, overlapping their creation by HydroShare with their downloads.
+
+            The bag of every resource is requested.  A bag that is ready is downloaded from the response, while
+            the task creating any other is handed to hs.tasks as soon as the request returns; each of those bags
+            is downloaded as soon as its task is done.
+
+        >>> for result in hs.getResources(pids, '/tmp/bags', max_workers=4):
+        >>>     print(result.pid, result.value if result.ok else result.exception, result.wait_time,
+        >>>           result.download_time)
+
+        :param pids: HydroShare IDs of the resources
+        :param destination: Directory to save the bags to, as in getResource
+        :param max_workers: Number of bags requested or downloaded at once
+        :param unzip: True to extract each bag into a directory named after its resource, as in getResource
+        :param wait_for_bag_creation: True to wait for bags being created, the number of seconds to wait at most
+            for each, or False to fail resources whose bag is not ready
+        :param verify: True to check each bag against its manifests, as in getResource
+        :raises: HydroShareArgumentException if destination is not a writable directory
+        :return: A list of BagDownload objects, in the order of pids, giving the path of each saved bag or the
+            exception its download failed with, and how long was spent waiting for and downloading it.
+        """
+        if not os.path.isdir(destination):
+            raise HydroShareArgumentException("{0} is not a directory.".format(destination))
+        if not os.access(destination, os.W_OK):
+            raise HydroShareArgumentException("You do not have write permissions to directory '{0}'.".format(destination))
+
+        pids = list(pids)
+        results = [BagDownload(index, pid) for index, pid in enumerate(pids)]
+        if not pids:
+            return results
+        # The bag tasks are polled alongside the requests of the workers
+        self._ensurePoolSize(max_workers + self.tasks.poll_workers)
+        timeout = None if wait_for_bag_creation is True else wait_for_bag_creation
+        started = time.time()
+        condition = threading.Condition()
+        pending = [len(pids)]
+        unexpected = []
+
+        def settled():
+            with condition:
+                pending[0] -= 1
+                condition.notify()
+
+        def fail(result, exception):
+            if isinstance(exception, HydroShareTaskTimeoutException):
+                exception = self._bagNotReady(exception)
+            result.exception = exception
+            result.wait_time = time.time() - started
+            settled()
+
+        def download(result, response=None):
+            result.wait_time = time.time() - started
+            begin = time.time()
+            try:
+                result.value = self._storeBagOnFilesystem(result.pid, destination, unzip, wait_for_bag_creation,
+                                                          verify=verify, response=response)
+            except (HydroShareException, requests.RequestException) as e:
+                result.exception = e
+            except Exception as e:
+                result.exception = e
+                unexpected.append(e)
+            finally:
+                result.download_time = time.time() - begin
+                settled()
+
+        def created(result, future):
+            # Called by the task tracker once the task creating the bag is over
+            if future.exception() is not None:
+                fail(result, future.exception())
+            else:
+                executor.submit(download, result)
 
-        return r.iter_content(STREAM_CHUNK_SIZE)
+        def start(result):
+            try:
+                response, task_id = self._requestBag(result.pid)
+            except Exception as e:
+                fail(result, e)
+                return
+            if response is not None:
+                # Ready: the bag is downloaded from the response to the request that found it so
+                download(result, response)
+            elif not wait_for_bag_creation:
+                fail(result, HydroShareBagNotReadyException("Please try later. The bag is not ready yet for download."))
+            else:
+                self.tasks.track(task_id, callback=lambda future: created(result, future), timeout=timeout)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for result in results:
+                executor.submit(start, result)
+            with condition:
+                while pending[0]:
+                    condition.wait()
+        if unexpected:
+            raise unexpected[0]
+        return results
 
     def _getTaskStatus(self, task_id):
         task_status_url = "{url_base}/taskstatus/{task_id}/"
         task_status_url = task_status_url.format(url_base=self.url_base, task_id=task_id)
         r = self._request('GET', task_status_url)
+        if r.status_code != 200:
+            raise HydroShareHTTPException(r)
         if r.content is None:
             return False
         response_data = r.json()
@@ -677,7 +1080,7 @@ class HydroShare(object):
         """
         url = "{url_base}/resource/types".format(url_base=self.url_base)
 
-        r = self._request('GET', url)
+        r = self._request('GET', url, endpoint='resource_types')
         if r.status_code != 200:
             raise HydroShareHTTPException(r)
 
@@ -687,7 +1090,7 @@ class HydroShare(object):
     def createResource(self, resource_type, title, resource_file=None, resource_filename=None,
                        abstract=None, keywords=None,
                        edit_users=None, view_users=None, edit_groups=None, view_groups=None,
-                       metadata=None, extra_metadata=None, progress_callback=None):
+                       metadata=None, extra_metadata=None, progress_callback=None, retry=False, strategy=None):
         """ Create a new resource.
 
         :param resource_type: string representing the a HydroShare resource type recognized by this
@@ -710,6 +1113,13 @@ class HydroShare(object):
         :param progress_callback: user-defined function to provide feedback to the user about the progress
             of the upload of resource_file.  For more information, see:
             http://toolbelt.readthedocs.org/en/latest/uploading-data.html#monitoring-your-streaming-multipart-upload
+        :param retry: True if the request may be retried according to the retry policy.  Creating a resource is not
+            idempotent: a retry after a lost response may create a duplicate resource.  resource_file must be
+            seekable.
+        :param strategy: UploadStrategy to send resource_file with, instead of the upload_strategy of this object.
+            With anything but SinglePostUpload, the resource is created first and resource_file, which must then be
+            seekable, is added to it afterwards.  If that upload fails, the resource is deleted again (or a warning
+            giving its ID is issued if it cannot be) and the exception of the upload is raised.
 
         :return: string representing ID of newly created resource.
 
@@ -750,31 +1160,50 @@ class HydroShare(object):
         if extra_metadata:
             params['extra_metadata'] = extra_metadata
 
+        strategy = strategy or self.upload_strategy
+        separate_upload = resource_file and not isinstance(strategy, SinglePostUpload)
+        # The file is sent with the request creating the resource, or on its own afterwards
+        upload_params = {} if separate_upload else params
         if resource_file:
-            close_fd = self._prepareFileForUpload(params, resource_file, resource_filename)
-
-        encoder = MultipartEncoder(params)
-        if progress_callback is None:
-            progress_callback = default_progress_callback
-        monitor = MultipartEncoderMonitor(encoder, progress_callback)
-
-        r = self._request('POST', url, data=monitor, headers={'Content-Type': monitor.content_type})
-
-        if close_fd:
-            fd = params['file'][1]
-            fd.close()
+            close_fd = self._prepareFileForUpload(upload_params, resource_file, resource_filename)
 
-        if r.status_code != 201:
-            if r.status_code == 403:
-                raise HydroShareNotAuthorized(('POST', url))
-            else:
-                raise HydroShareHTTPException(r)
-
-        response = r.json()
-        new_resource_id = response['resource_id']
+        try:
+            if separate_upload and uploadSize(upload_params['file'][1]) is None:
+                # Found out now rather than after creating a resource the file cannot be added to
+                raise HydroShareArgumentException("resource_file must be seekable to be uploaded separately.")
+            body, headers, retryable = self._multipartBody(params, progress_callback, retry)
+            r = self._request('POST', url, data=body, headers=headers, retryable=retryable)
+
+            if r.status_code != 201:
+                if r.status_code == 403:
+                    raise HydroShareNotAuthorized(('POST', url))
+                else:
+                    raise HydroShareHTTPException(r)
+
+            response = r.json()
+            new_resource_id = response['resource_id']
+
+            if separate_upload:
+                try:
+                    strategy.upload(self, new_resource_id, upload_params, progress_callback, retry)
+                except Exception:
+                    self._deleteIncompleteResource(new_resource_id)
+                    raise
+        finally:
+            if close_fd:
+                fd = upload_params['file'][1]
+                fd.close()
 
         return new_resource_id
 
+    def _deleteIncompleteResource(self, pid):
+        # Delete a resource created without the file it was created for, whose upload failed
+        try:
+            self.deleteResource(pid)
+        except (HydroShareException, requests.RequestException) as e:
+            warnings.warn("Resource {0} was created but its file could not be added, nor could it be "
+                          "deleted: {1}".format(pid, e))
+
     def deleteResource(self, pid):
         """
         Delete a resource.
@@ -817,7 +1246,8 @@ class HydroShare(object):
         assert(resource['resource_id'] == pid)
         return resource['resource_id']
 
-    def addResourceFile(self, pid, resource_file, resource_filename=None, progress_callback=None):
+    def addResourceFile(self, pid, resource_file, resource_filename=None, progress_callback=None, retry=False,
+                        folder=None, strategy=None):
         """ Add a new file to an existing resource
 
         :param pid: The HydroShare ID of the resource
@@ -830,6 +1260,11 @@ class HydroShare(object):
         :param progress_callback: user-defined function to provide feedback to the user about the progress
             of the upload of resource_file.  For more information, see:
             http://toolbelt.readthedocs.org/en/latest/uploading-data.html#monitoring-your-streaming-multipart-upload
+        :param retry: True if the upload may be retried according to the retry policy.  resource_file must be
+            seekable.
+        :param folder: Folder of the resource, relative to its data/contents folder, to add the file to.  Defaults
+            to the folder part of resource_filename, if any.
+        :param strategy: UploadStrategy to send the file with, instead of the upload_strategy of this object
 
         :return: Dictionary containing 'resource_id' the ID of the resource to which the file was added, and
                 'file_name' the filename of the file added.
@@ -838,43 +1273,79 @@ class HydroShare(object):
         :raises: HydroShareNotFound if the resource was not found.
         :raises: HydroShareHTTPException if an unexpected HTTP response code is encountered.
         """
-        url = "{url_base}/resource/{pid}/files/".format(url_base=self.url_base,
-                                                        pid=pid)
-
         params = {}
-        close_fd = self._prepareFileForUpload(params, resource_file, resource_filename)
+        close_fd = self._prepareFileForUpload(params, resource_file, resource_filename, folder)
 
-        encoder = MultipartEncoder(params)
-        if progress_callback is None:
-            progress_callback = default_progress_callback
-        monitor = MultipartEncoderMonitor(encoder, progress_callback)
+        try:
+            return (strategy or self.upload_strategy).upload(self, pid, params, progress_callback, retry)
+        finally:
+            if close_fd:
+                fd = params['file'][1]
+                fd.close()
 
-        r = self._request('POST', url, data=monitor, headers={'Content-Type': monitor.content_type})
+    def addResourceFiles(self, pid, files, max_workers=DEFAULT_MAX_WORKERS, progress_callback=None, retry=False):
+        """ Add many files to an existing resource, uploading them concurrently over the pooled session.
 
-        if close_fd:
-            fd = params['file'][1]
-            fd.close()
+        >>> results = hs.addResourceFiles(pid, ['run1.nc', ('run2.nc', 'outputs'), (fd, 'model', 'params.json')],
+        >>>                               progress_callback=lambda p: print(p.bytes_sent, p.total_bytes))
+        >>> failed = [r for r in results if not r.ok]
 
-        if r.status_code != 201:
-            if r.status_code == 403:
-                raise HydroShareNotAuthorized(('POST', url))
-            elif r.status_code == 404:
-                raise HydroShareNotFound((pid,))
-            else:
-                raise HydroShareHTTPException(r)
-
-        response = r.json()
-        # assert(response['resource_id'] == pid)
-
-        return response
+        :param pid: The HydroShare ID of the resource
+        :param files: Iterable of the files to add.  Each is either a path (a string or path-like object), a
+            file-like object named after the basename of its name attribute, or a (resource_file, folder) or
+            (resource_file, folder, resource_filename) tuple of the arguments of addResourceFile; folder may be
+            None to add the file at the top of the resource.
+        :param max_workers: Number of files uploaded at once
+        :param progress_callback: Callable given an UploadProgress (see hs_restclient.uploads), adding up the
+            bytes sent and files finished across all uploads, every time one of them progresses.  It is called
+            from the uploading threads.
+        :param retry: True if the uploads may be retried according to the retry policy, as in addResourceFile
+        :return: A list of BatchResult objects, in the order of files, whose args are (index, resource_file,
+            folder, resource_filename).  The value of a successful upload is the response of addResourceFile; a
+            failed upload holds its exception, and doesn't stop the others.
+
+        :raises: HydroShareArgumentException if an item of files is neither a file nor a tuple, before any upload.
+        """
+        items = [uploadItem(item) for item in files]
+        progress = UploadProgress([uploadSize(resource_file) for resource_file, _, _ in items], progress_callback)
 
-    def getResourceFile(self, pid, filename, destination=None):
+        def upload(index, resource_file, folder, resource_filename):
+            try:
+                response = self.addResourceFile(pid, resource_file, resource_filename=resource_filename,
+                                                progress_callback=progress.monitor(index), retry=retry,
+                                                folder=folder)
+            except Exception:
+                progress.finished(False)
+                raise
+            progress.finished(True)
+            return response
+
+        calls = ((upload, (index,) + item, {}) for index, item in enumerate(items))
+        return list(self.batch(calls, max_workers=max_workers))
+
+    def getResourceFile(self, pid, filename, destination=None, use_cache=True, segment_workers=0,
+                        segment_size=DEFAULT_SEGMENT_SIZE, resume=False, verify=False):
         """ Get a file within a resource.
 
         :param pid: The HydroShare ID of the resource
         :param filename: String representing the name of the resource file to get.
         :param destination: String representing the directory to save the resource file to. If None, a stream
             to the resource file will be returned instead.
+        :param use_cache: If False, ask the server even if the file was recently found missing or forbidden
+            (see the negative_cache argument of HydroShare), and download it even if it is in the file cache (see
+            the file_cache argument of HydroShare).  The file cache still keeps the downloaded file.
+        :param segment_workers: If greater than 0 and destination is given, download the file as segments of
+            segment_size bytes, this many at a time, with HTTP Range requests written in place into the
+            destination file.  Falls back to a single stream if the server does not advertise Accept-Ranges
+            for the file or it fits in one segment.
+        :param segment_size: Number of bytes per segment
+        :param resume: If True and destination is given, download to $(filename).part in destination, next to a
+            small $(filename).part.json sidecar, and rename it once its size has been checked.  A download
+            interrupted in the meantime is resumed by requesting only the missing bytes.  Does not apply to
+            segmented downloads.
+        :param verify: If True and destination is given, check the file's size and checksum (if listed) against
+            its entry in getResourceFileList, computing the checksum on the chunks as they are written.  The
+            entry can be passed instead of True to save looking it up.  Segmented downloads only check the size.
         :return: The path of the downloaded file (if destination was specified), or a stream to the resource
             file.
 
@@ -882,6 +1353,8 @@ class HydroShare(object):
         :raises: HydroShareNotAuthorized if user is not authorized to perform action.
         :raises: HydroShareNotFound if the resource was not found.
         :raises: HydroShareHTTPException if an unexpected HTTP response code is encountered.
+        :raises: HydroShareChecksumException if verify is set and the file does not match its listing; the file
+            is removed.
         """
         url = "{url_base}/resource/{pid}/files/{filename}".format(url_base=self.url_base,
                                                                   pid=pid,
@@ -892,24 +1365,128 @@ class HydroShare(object):
                 raise HydroShareArgumentException("{0} is not a directory.".format(destination))
             if not os.access(destination, os.W_OK):
                 raise HydroShareArgumentException("You do not have write permissions to directory '{0}'.".format(destination))
-
-        r = self._request('GET', url, stream=True)
-        if r.status_code != 200:
+        elif segment_workers or resume or verify:
+            raise HydroShareArgumentException("segment_workers, resume and verify require a destination.")
+
+        listed = None
+        if verify:
+            listed = verify if hasattr(verify, 'get') else self._getListedFile(pid, filename)
+        hasher = ChecksumWriter() if listed is not None else None
+
+        filepath = os.path.join(destination, filename) if destination else None
+        file_cache = self.file_cache if destination else None
+        response = None
+        if file_cache is not None:
+            if use_cache:
+                served, response = self._getCachedFile(pid, filename, url, filepath, listed)
+                if served:
+                    return filepath
+            if hasher is None:
+                hasher = ChecksumWriter()
+            if response is not None and (segment_workers or resume):
+                response.close()
+                response = None
+
+        if segment_workers:
+            if file_cache is not None and os.path.lexists(filepath):
+                # filepath may be a hard link to a cached file, which segments written in place would change
+                os.remove(filepath)
+            if segmentedDownload(self, url, filepath, segment_size=segment_size, workers=segment_workers,
+                                 pid=pid, use_cache=use_cache):
+                if listed is not None:
+                    # Segments are written out of order, so there is nothing to hash as they arrive
+                    hasher.size = os.path.getsize(filepath)
+                    self._verifyDownload(filepath, hasher, listed.get('size'))
+                if file_cache is not None:
+                    file_cache.store(pid, filename, filepath)
+                return filepath
+
+        etag = last_modified = None
+        if resume:
+            resumableDownload(lambda headers: self._getFileResponse(pid, filename, url, use_cache, headers),
+                              url, filepath, hasher=hasher)
+        else:
+            r = response or self._getFileResponse(pid, filename, url, use_cache)
+            if destination is None:
+                return readChunks(r, copy=True)
+            etag, last_modified = r.headers.get('ETag'), r.headers.get('Last-Modified')
+            # filepath may be a hard link to a cached file, shared with other destinations, so with a file cache
+            # the download gets a file of its own that then replaces filepath
+            target = filepath if file_cache is None else '{0}.{1}.tmp'.format(filepath, uuid.uuid4().hex)
+            try:
+                with open(target, 'wb') as fd:
+                    writer = fd
+                    if hasher is not None:
+                        hasher.fd = fd
+                        writer = hasher
+                    for chunk in readChunks(r):
+                        writer.write(chunk)
+            except BaseException:
+                if target != filepath and os.path.exists(target):
+                    os.remove(target)
+                raise
+            finally:
+                r.close()
+            if target != filepath:
+                replace(target, filepath)
+        if listed is not None:
+            self._verifyDownload(filepath, hasher, listed.get('size'), listed.get('checksum'))
+        if file_cache is not None:
+            file_cache.store(pid, filename, filepath, hasher=hasher, etag=etag, last_modified=last_modified)
+        return filepath
+
+    def _getCachedFile(self, pid, filename, url, filepath, listed):
+        # Write the file to filepath from the file cache, if it is there: found by the checksum it is listed with,
+        # or found by its name and not modified on the server since it was cached.  Returns (True, None) if the
+        # file was served, otherwise (False, the 200 response to a conditional request, or None)
+        file_cache = self.file_cache
+        if listed is not None:
+            digest = file_cache.find(listed.get('checksum'), listed.get('size'))
+            if digest is not None and file_cache.materialize(digest, filepath):
+                file_cache.statistics.count('hits')
+                return True, None
+        entry = file_cache.lookup(pid, filename)
+        if entry is None:
+            file_cache.statistics.count('misses')
+            return False, None
+        file_cache.statistics.count('revalidations')
+        r = self._getFileResponse(pid, filename, url, headers=entry.conditionalHeaders(), statuses=(200, 304))
+        if r.status_code == 304:
+            r.close()
+            if file_cache.materialize(entry.digest, filepath):
+                file_cache.statistics.count('hits')
+                return True, None
+            # Evicted in the meantime
+            file_cache.statistics.count('misses')
+            return False, None
+        file_cache.statistics.count('misses')
+        return False, r
+
+    def _getListedFile(self, pid, filename):
+        # The entry of getResourceFileList for a file, for its size and checksum
+        suffix = '/data/contents/' + filename
+        for f in self.getResourceFileList(pid):
+            if unquote(f['url']).endswith(suffix):
+                return f
+        raise HydroShareNotFound((pid, filename))
+
+    def _verifyDownload(self, filepath, hasher, size=None, checksum=None):
+        try:
+            hasher.verify(filepath, size=size, checksum=checksum)
+        except HydroShareChecksumException:
+            os.remove(filepath)
+            raise
+
+    def _getFileResponse(self, pid, filename, url, use_cache=True, headers=None, statuses=(200, 206)):
+        r = self._request('GET', url, headers=headers, stream=True, endpoint='file', pid=pid, use_cache=use_cache)
+        if r.status_code not in statuses:
             if r.status_code == 403:
                 raise HydroShareNotAuthorized(('GET', url))
             elif r.status_code == 404:
                 raise HydroShareNotFound((pid, filename))
             else:
                 raise HydroShareHTTPException(r)
-
-        if destination is None:
-            return r.iter_content(STREAM_CHUNK_SIZE)
-        else:
-            filepath = os.path.join(destination, filename)
-            with open(filepath, 'wb') as fd:
-                for chunk in r.iter_content(STREAM_CHUNK_SIZE):
-                    fd.write(chunk)
-            return filepath
+        return r
 
     def deleteResourceFile(self, pid, filename):
         """
@@ -942,18 +1519,106 @@ class HydroShare(object):
         assert(response['resource_id'] == pid)
         return response['resource_id']
 
-    def getResourceFileList(self, pid):
+    def syncResource(self, pid, local_dir, delete=False, max_workers=DEFAULT_MAX_WORKERS, verify=True):
+        """ Bring a local copy of the files of a resource up to date, downloading only what changed.
+
+            The files listed by getResourceFileList are compared with an index kept in local_dir (see
+            hs_restclient.sync.SyncIndex) of what the previous sync downloaded.  New files, files that changed
+            on HydroShare and files that changed or disappeared locally are downloaded concurrently with
+            getResourceFile, each through a .part file so that an interrupted sync resumes it.  Files are
+            written under local_dir at their path in the resource's data/contents folder.
+
+        >>> summary = hs.syncResource(pid, '/data/my_resource', delete=True)
+        >>> print(summary.bytes_downloaded, summary.bytes_saved)
+
+        :param pid: The HydroShare ID of the resource
+        :param local_dir: Directory of the local copy; created if it does not exist
+        :param delete: True to delete the local copies of files that were synced before but are no longer in the
+            resource.  Local files that were never synced are left alone.
+        :param max_workers: Number of files downloaded at once
+        :param verify: True to check each download against the size and checksum listed for it
+        :raises: HydroShareArgumentException if local_dir is not a writable directory
+        :raises: HydroShareNotAuthorized, HydroShareNotFound or HydroShareHTTPException if the file list cannot be
+            read, or HydroShareException if a listed file would be written outside local_dir or over the index
+            (a file named .hs_sync.json at the top of the resource); nothing is downloaded or deleted then.
+        :return: A SyncSummary of the files downloaded, unchanged, deleted and failed, and of the bytes downloaded
+            and saved.  Files that failed to download are left as they were, and are retried by the next sync.
+        """
+        if not os.path.isdir(local_dir):
+            os.makedirs(local_dir)
+        if not os.access(local_dir, os.W_OK):
+            raise HydroShareArgumentException("You do not have write permissions to directory '{0}'.".format(local_dir))
+
+        index = SyncIndex(local_dir, pid)
+        summary = SyncSummary()
+        listed = {}
+        targets = {}
+        changed = []
+        for entry in self.getResourceFileList(pid):
+            path = listedPath(entry['url'])
+            # Checked for every file before anything is downloaded
+            targets[path] = localPath(local_dir, path)
+            listed[path] = entry
+            if index.isCurrent(path, entry):
+                summary.unchanged.append(path)
+                summary.bytes_saved += entry.get('size') or 0
+            else:
+                changed.append((path, entry))
+
+        def download(path, entry):
+            target = targets[path]
+            if not os.path.isdir(os.path.dirname(target)):
+                os.makedirs(os.path.dirname(target))
+            return self.getResourceFile(pid, path, destination=local_dir, resume=True,
+                                        verify=entry if verify else False)
+
+        self._ensurePoolSize(max_workers)
+        try:
+            calls = ((download, (path, entry), {}) for path, entry in changed)
+            for result in executeBatch(calls, max_workers=max_workers, ordered=False):
+                path, entry = result.args
+                if result.ok:
+                    index.record(path, entry)
+                    summary.downloaded.append(path)
+                    summary.bytes_downloaded += entry.get('size') or 0
+                else:
+                    summary.failed.append(result)
+
+            if delete:
+                for path in sorted(set(index.files) - set(listed)):
+                    removeLocalCopy(local_dir, path)
+                    index.forget(path)
+                    summary.deleted.append(path)
+        finally:
+            index.save()
+        return summary
+
+    def getResourceFileList(self, pid, prefetch=0, page_workers=0, ordered=True, cursor=None,
+                            stream_items=False, as_records=False):
         """ Get a listing of files within a resource.
 
         :param pid: The HydroShare ID of the resource whose resource files are to be listed.
+        :param prefetch: Number of pages to fetch ahead on a background thread while the current page is being
+            consumed.  0 (the default) fetches each page only when the previous one is exhausted.
+        :param page_workers: Number of threads fetching pages concurrently.  When greater than 0, the page count
+            is computed from the first page and all remaining pages are requested at once.
+        :param ordered: With page_workers, True (the default) yields files in listing order, False as pages
+            arrive.
+        :param cursor: PaginationCursor (or its serialization) from the cursor attribute of an earlier listing,
+            to resume that listing where it stopped.
+        :param stream_items: If True, decode each page incrementally as its files are consumed, holding one
+            file object rather than one page in memory.  Requires the ijson package.
+        :param as_records: If True, yield compact ResourceFileInfo records (see hs_restclient.records) instead
+            of dicts.
 
         :raises: HydroShareArgumentException if any parameters are invalid.
         :raises: HydroShareNotAuthorized if user is not authorized to perform action.
         :raises: HydroShareNotFound if the resource was not found.
         :raises: HydroShareHTTPException if an unexpected HTTP response code is encountered.
 
-        :return: A generator that can be used to fetch dict objects, each dict representing
-            the JSON object representation of the resource returned by the REST end point.  For example:
+        :return: An iterator that can be used to fetch dict objects, each dict representing
+            the JSON object representation of the resource returned by the REST end point.  Its cursor attribute
+            gives the position to resume from.  For example:
 
         {
             "count": 95,
@@ -990,7 +1655,9 @@ class HydroShare(object):
         """
         url = "{url_base}/resource/{pid}/files/".format(url_base=self.url_base,
                                                             pid=pid)
-        return resultsListGenerator(self, url)
+        return resultsListGenerator(self, url, prefetch=prefetch, page_workers=page_workers, ordered=ordered,
+                                    cursor=cursor, stream_items=stream_items,
+                                    record_class=ResourceFileInfo if as_records else None, columns=FILE_COLUMNS)
 
     def getResourceFolderContents(self, pid, pathname):
         """ Get a listing of files and folders for a resource at the specified path (*pathname*)
@@ -1014,7 +1681,7 @@ class HydroShare(object):
 
         url = "{url_base}/resource/{pid}/folders/{path}".format(url_base=self.url_base, pid=pid, path=pathname)
 
-        r = self._request('GET', url)
+        r = self._request('GET', url, endpoint='folder', pid=pid)
         if r.status_code != 200:
             if r.status_code == 403:
                 raise HydroShareNotAuthorized(('GET', url))
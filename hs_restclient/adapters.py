@@ -0,0 +1,89 @@
+"""
+
+Transport adapters for the HydroShare client session
+
+"""
+
+import threading
+
+from requests.adapters import HTTPAdapter, DEFAULT_POOLSIZE, DEFAULT_POOLBLOCK
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+
+class PoolStatistics(object):
+    """ Thread-safe counters of connections opened and requests sent through the connection pools """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.connections_created = 0
+        self.requests = 0
+
+    def connectionCreated(self):
+        with self._lock:
+            self.connections_created += 1
+
+    def requestSent(self):
+        with self._lock:
+            self.requests += 1
+
+    @property
+    def connections_reused(self):
+        # Every request either opened a new connection or reused a pooled one
+        return max(0, self.requests - self.connections_created)
+
+    def asDict(self):
+        with self._lock:
+            return {'connections_created': self.connections_created,
+                    'connections_reused': max(0, self.requests - self.connections_created),
+                    'requests': self.requests}
+
+
+class _CountingConnectionMixin(object):
+    statistics = None
+
+    def connect(self):
+        # Called for the first connection and whenever urllib3 reopens a dropped one
+        self.statistics.connectionCreated()
+        return super(_CountingConnectionMixin, self).connect()
+
+
+class _CountingPoolMixin(object):
+    statistics = None
+
+    def urlopen(self, *args, **kwargs):
+        self.statistics.requestSent()
+        return super(_CountingPoolMixin, self).urlopen(*args, **kwargs)
+
+
+def _countingPoolClass(pool_class, statistics):
+    attrs = {'statistics': statistics}
+    connection_class = type('Counting' + pool_class.ConnectionCls.__name__,
+                            (_CountingConnectionMixin, pool_class.ConnectionCls), attrs)
+    attrs['ConnectionCls'] = connection_class
+    return type('Counting' + pool_class.__name__, (_CountingPoolMixin, pool_class), attrs)
+
+
+class PoolingHTTPAdapter(HTTPAdapter):
+    """ HTTPAdapter whose connection pools report to a PoolStatistics instance
+
+        :param statistics: PoolStatistics to update; shared across sessions so counts survive session
+            re-initialization
+        :param pool_connections: Number of host pools to cache
+        :param pool_maxsize: Maximum number of connections to keep open per host
+        :param pool_block: If True, block when all pooled connections are in use instead of opening (and then
+            discarding) extra connections
+    """
+    def __init__(self, statistics=None, pool_connections=DEFAULT_POOLSIZE, pool_maxsize=DEFAULT_POOLSIZE,
+                 pool_block=DEFAULT_POOLBLOCK, **kwargs):
+        self.statistics = statistics
+        super(PoolingHTTPAdapter, self).__init__(pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+                                                 pool_block=pool_block, **kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super(PoolingHTTPAdapter, self).init_poolmanager(*args, **kwargs)
+        # statistics is not pickled with the adapter, hence getattr
+        statistics = getattr(self, 'statistics', None)
+        if statistics is not None:
+            self.poolmanager.pool_classes_by_scheme = {
+                'http': _countingPoolClass(HTTPConnectionPool, statistics),
+                'https': _countingPoolClass(HTTPSConnectionPool, statistics),
+            }
@@ -0,0 +1,532 @@
+"""
+
+Asyncio client for HydroShare REST API
+
+Requires the optional aiohttp package (pip install hs_restclient[async]).
+
+"""
+
+import os
+import mimetypes
+import json
+import asyncio
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from . import DEFAULT_HOSTNAME, STREAM_CHUNK_SIZE, HydroShareAuthBasic, HydroShareAuthOAuth2
+from .endpoints.resources import ResourceEndpoint, ResourceList, ScimetaSubEndpoint, FilesSubEndpoint
+from .exceptions import *
+
+
+DEFAULT_CONNECTION_LIMIT = 100
+
+# Listing options of ResourceList, at the values AsyncResourceList lists with
+_LIST_OPTION_DEFAULTS = {'prefetch': 0, 'page_workers': 0, 'ordered': True, 'cursor': None, 'stream_items': False}
+
+
+class AsyncRequestInfo(object):
+    def __init__(self, method, url):
+        self.method = method
+        self.url = url
+
+
+class AsyncResponse(object):
+    """ Buffered response exposing the subset of requests.Response used by this library
+        (status_code, headers, content, text, json() and request), so that
+        HydroShareHTTPException and the endpoint classes work unchanged.
+    """
+    def __init__(self, method, url, status_code, headers, content):
+        self.request = AsyncRequestInfo(method, url)
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8', 'replace')
+
+    def json(self):
+        return json.loads(self.text)
+
+
+def _encodeParams(params):
+    # aiohttp only accepts str/int/float query values; expand sequences into repeated keys
+    if not params:
+        return None
+    encoded = []
+    for key, value in params.items():
+        if isinstance(value, (list, tuple, set)):
+            encoded.extend((key, str(v)) for v in value)
+        elif isinstance(value, bool) or not isinstance(value, (int, float)):
+            encoded.append((key, str(value)))
+        else:
+            encoded.append((key, value))
+    return encoded
+
+
+async def asyncResultsListGenerator(hs, url, params=None):
+    """ Async generator counterpart of generators.resultsListGenerator for AsyncHydroShare """
+    next_url = url
+    while next_url:
+        r = await hs._request('GET', next_url, params=params)
+        if r.status_code != 200:
+            if r.status_code == 403:
+                raise HydroShareNotAuthorized(('GET', next_url))
+            elif r.status_code == 404:
+                raise HydroShareNotFound((next_url,))
+            else:
+                raise HydroShareHTTPException(r)
+        res = r.json()
+        for item in res['results']:
+            yield item
+
+        next_url = res['next']
+        if next_url and hs.use_https:
+            # Make sure the next URL uses HTTPS
+            next_url = next_url.replace('http://', 'https://', 1)
+
+
+class AsyncScimetaSubEndpoint(ScimetaSubEndpoint):
+    async def get(self):
+        url = "{url_base}/resource/{pid}/scimeta/custom/".format(url_base=self.hs.url_base,
+                                                                 pid=self.pid)
+        r = await self.hs._request('GET', url)
+        return json.loads(r.text)
+
+
+class AsyncFilesSubEndpoint(FilesSubEndpoint):
+    def all(self, stream_items=False):
+        if stream_items:
+            raise HydroShareArgumentException("stream_items is not supported by AsyncHydroShare; use "
+                                              "getResourceFileList instead.")
+        return super(AsyncFilesSubEndpoint, self).all()
+
+
+class AsyncResourceEndpoint(ResourceEndpoint):
+    """ Resource endpoint bound to an AsyncHydroShare.
+
+        Methods inherited from ResourceEndpoint, FilesSubEndpoint and FunctionsSubEndpoint return the
+        result of hs._request unchanged, so with AsyncHydroShare they return awaitables.  Only methods
+        that post-process the response are overridden here.
+    """
+    def __init__(self, hs, pid):
+        super(AsyncResourceEndpoint, self).__init__(hs, pid)
+        self.scimeta = AsyncScimetaSubEndpoint(hs, pid)
+        self.files = AsyncFilesSubEndpoint(hs, pid)
+
+
+class AsyncResourceList(ResourceList):
+    def _listGenerator(self, url, params, **options):
+        unsupported = [name for name, value in options.items()
+                       if name not in _LIST_OPTION_DEFAULTS or value != _LIST_OPTION_DEFAULTS[name]]
+        if unsupported:
+            raise HydroShareArgumentException("Unsupported listing options for AsyncHydroShare: {0}".format(
+                ", ".join(sorted(unsupported))))
+        return asyncResultsListGenerator(self.hs, url, params)
+
+
+class AsyncHydroShare(object):
+    """
+        Construct an asyncio HydroShare client.  Method names, arguments and return values mirror
+        HydroShare, but every network call is a coroutine and listings are async generators.  All
+        requests share one aiohttp connection pool, so many calls can be in flight on a single
+        event loop:
+
+        >>> async with AsyncHydroShare(auth=auth) as hs:
+        >>>     sysmeta = await asyncio.gather(*[hs.getSystemMetadata(pid) for pid in pids])
+
+        :param hostname: Hostname of the HydroShare server to query
+        :param port: Integer representing the TCP port on which to connect to the HydroShare server
+        :param use_https: Boolean, if True, HTTPS will be used (HTTP cannot be used when auth is specified)
+        :param verify: Boolean, if True, security certificates will be verified
+        :param auth: Concrete instance of AbstractHydroShareAuth (e.g. HydroShareAuthBasic)
+        :param connection_limit: Maximum number of simultaneous connections in the pool
+
+        :raises: HydroShareException if aiohttp is not installed.
+        :raises: HydroShareAuthenticationException if auth is not a known authentication type.
+    """
+
+    _URL_PROTO_WITHOUT_PORT = "{scheme}://{hostname}/hsapi"
+    _URL_PROTO_WITH_PORT = "{scheme}://{hostname}:{port}/hsapi"
+
+    def __init__(self, hostname=DEFAULT_HOSTNAME, port=None, use_https=True, verify=True,
+                 auth=None, connection_limit=DEFAULT_CONNECTION_LIMIT):
+        if aiohttp is None:
+            raise HydroShareException("AsyncHydroShare requires the aiohttp package.")
+        self.hostname = hostname
+        self.verify = verify
+        self.auth = auth
+        self.connection_limit = connection_limit
+        self.session = None
+
+        if use_https:
+            self.scheme = 'https'
+        else:
+            self.scheme = 'http'
+        self.use_https = use_https
+
+        if port:
+            self.port = int(port)
+            if self.port < 0 or self.port > 65535:
+                raise HydroShareException("Port number {0} is illegal.".format(self.port))
+            self.url_base = self._URL_PROTO_WITH_PORT.format(scheme=self.scheme,
+                                                             hostname=self.hostname,
+                                                             port=self.port)
+        else:
+            self.url_base = self._URL_PROTO_WITHOUT_PORT.format(scheme=self.scheme,
+                                                                hostname=self.hostname)
+
+        self._resource_types = None
+
+    async def __aenter__(self):
+        await self._getSession()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    def resource(self, pid):
+        return self.resources(id=pid)
+
+    def resources(self, **kwargs):
+        if 'id' in kwargs:
+            return AsyncResourceEndpoint(self, kwargs.get('id', None))
+
+        return AsyncResourceList(self, **kwargs).list
+
+    async def _getSession(self):
+        if self.session is None:
+            await self._initializeSession()
+        return self.session
+
+    async def _initializeSession(self):
+        # aiohttp sessions must be created from within a running event loop
+        await self.close()
+
+        basic_auth = None
+        headers = {}
+        if self.auth is None:
+            # No authentication
+            pass
+        elif isinstance(self.auth, HydroShareAuthBasic):
+            basic_auth = aiohttp.BasicAuth(self.auth.username, self.auth.password)
+        elif isinstance(self.auth, HydroShareAuthOAuth2):
+            if not self.use_https:
+                raise HydroShareAuthenticationException("HTTPS is required when using authentication.")
+            if self.auth.token is None:
+                if self.auth.username is None or self.auth.password is None:
+                    msg = "Username and password are required when using OAuth2 without an external token"
+                    raise HydroShareAuthenticationException(msg)
+                self.auth.token = await self._fetchToken()
+            headers['Authorization'] = "Bearer {0}".format(self.auth.token['access_token'])
+        else:
+            raise HydroShareAuthenticationException("Unsupported authentication type '{0}'.".format(str(type(self.auth))))
+
+        connector = aiohttp.TCPConnector(limit=self.connection_limit,
+                                         ssl=None if self.verify else False)
+        self.session = aiohttp.ClientSession(connector=connector, auth=basic_auth, headers=headers)
+
+    async def _fetchToken(self):
+        data = {'grant_type': 'password',
+                'username': self.auth.username,
+                'password': self.auth.password}
+        auth = aiohttp.BasicAuth(self.auth.client_id, self.auth.client_secret)
+        async with aiohttp.ClientSession() as session:
+            async with session.post(self.auth.token_url, data=data, auth=auth,
+                                    ssl=None if self.verify else False) as r:
+                if r.status != 200:
+                    raise HydroShareAuthenticationException("Unable to obtain OAuth2 token.")
+                return await r.json()
+
+    async def _request(self, method, url, params=None, data=None, json=None, files=None, headers=None, stream=False):
+        if(data and json):
+            raise Exception("Can't pass data and json at the same time")
+
+        session = await self._getSession()
+        r = await session.request(method, url, params=_encodeParams(params), data=data, json=json,
+                                  headers=headers)
+        if stream:
+            return r
+        try:
+            content = await r.read()
+        finally:
+            r.release()
+        return AsyncResponse(method, str(r.url), r.status, r.headers, content)
+
+    async def _iterContent(self, r):
+        try:
+            async for chunk in r.content.iter_chunked(STREAM_CHUNK_SIZE):
+                yield chunk
+        finally:
+            r.release()
+
+    async def _raiseForStream(self, r, method, url, pid, filename=None):
+        # Buffer the body of a failed streaming response so it can be reported
+        content = await r.read()
+        r.release()
+        response = AsyncResponse(method, str(r.url), r.status, r.headers, content)
+        if r.status == 403:
+            raise HydroShareNotAuthorized((method, url))
+        elif r.status == 404:
+            if filename:
+                raise HydroShareNotFound((pid, filename))
+            raise HydroShareNotFound((pid,))
+        else:
+            raise HydroShareHTTPException(response)
+
+    async def getResourceTypes(self):
+        """ Get the list of resource types supported by the HydroShare server
+
+        :return: A set of strings representing the HydroShare resource types
+
+        :raises: HydroShareHTTPException to signal an HTTP error
+        """
+        if self._resource_types is None:
+            url = "{url_base}/resource/types".format(url_base=self.url_base)
+
+            r = await self._request('GET', url)
+            if r.status_code != 200:
+                raise HydroShareHTTPException(r)
+
+            self._resource_types = set([t['resource_type'] for t in r.json()])
+        return self._resource_types
+
+    async def _getMetadata(self, url, pid):
+        r = await self._request('GET', url)
+        if r.status_code != 200:
+            if r.status_code == 403:
+                raise HydroShareNotAuthorized(('GET', url))
+            elif r.status_code == 404:
+                raise HydroShareNotFound((pid,))
+            else:
+                raise HydroShareHTTPException(r)
+        return r
+
+    async def getSystemMetadata(self, pid):
+        """ Get system metadata for a resource.  See HydroShare.getSystemMetadata. """
+        url = "{url_base}/resource/{pid}/sysmeta/".format(url_base=self.url_base,
+                                                          pid=pid)
+        r = await self._getMetadata(url, pid)
+        return r.json()
+
+    async def getScienceMetadataRDF(self, pid):
+        """ Get science metadata for a resource in XML+RDF format.  See HydroShare.getScienceMetadataRDF. """
+        url = "{url_base}/scimeta/{pid}/".format(url_base=self.url_base, pid=pid)
+        r = await self._getMetadata(url, pid)
+        return r.text
+
+    async def getScienceMetadata(self, pid):
+        """ Get science metadata for a resource in JSON format.  See HydroShare.getScienceMetadata. """
+        url = "{url_base}/resource/{pid}/scimeta/elements".format(url_base=self.url_base, pid=pid)
+        r = await self._getMetadata(url, pid)
+        return r.json()
+
+    async def getResourceMap(self, pid):
+        """ Get resource map metadata for a resource.  See HydroShare.getResourceMap. """
+        url = "{url_base}/resource/{pid}/map/".format(url_base=self.url_base,
+                                                      pid=pid)
+        r = await self._getMetadata(url, pid)
+        return r.text
+
+    async def updateScienceMetadata(self, pid, metadata):
+        """ Update science metadata for a resource.  See HydroShare.updateScienceMetadata. """
+        url = "{url_base}/resource/{pid}/scimeta/elements/".format(url_base=self.url_base, pid=pid)
+
+        r = await self._request('PUT', url, json=metadata)
+        if r.status_code != 202:
+            if r.status_code == 403:
+                raise HydroShareNotAuthorized(('PUT', url))
+            elif r.status_code == 404:
+                raise HydroShareNotFound((pid,))
+            else:
+                raise HydroShareHTTPException(r)
+
+        return r.json()
+
+    def _prepareFormData(self, form, resource_file, resource_filename=None):
+        close_fd = False
+        if isinstance(resource_file, str):
+            if not os.path.isfile(resource_file) or not os.access(resource_file, os.R_OK):
+                raise HydroShareArgumentException("{0} is not a file or is not readable.".format(resource_file))
+            fd = open(resource_file, 'rb')
+            close_fd = True
+            fname = resource_filename or os.path.basename(resource_file)
+        else:
+            if not resource_filename:
+                raise HydroShareArgumentException("resource_filename must be specified when resource_file " +
+                                                  "is a file-like object.")
+            # Assume it is a file-like object
+            fd = resource_file
+            fname = resource_filename
+
+        mime_type = mimetypes.guess_type(fname)[0] or 'application/octet-stream'
+        form.add_field('file', fd, filename=fname, content_type=mime_type)
+        form.add_field('folder', os.path.dirname(fname))
+        return fd, close_fd
+
+    async def createResource(self, resource_type, title, resource_file=None, resource_filename=None,
+                             abstract=None, keywords=None,
+                             edit_users=None, view_users=None, edit_groups=None, view_groups=None,
+                             metadata=None, extra_metadata=None):
+        """ Create a new resource.  See HydroShare.createResource.
+
+        :return: string representing ID of newly created resource.
+        """
+        url = "{url_base}/resource/".format(url_base=self.url_base)
+
+        resource_types = await self.getResourceTypes()
+        if resource_type not in resource_types:
+            raise HydroShareArgumentException("Resource type {0} is not among known resources: {1}".format(resource_type,
+                                                                                                           ", ".join([r for r in resource_types])))
+
+        form = aiohttp.FormData()
+        form.add_field('resource_type', resource_type)
+        form.add_field('title', title)
+        if abstract:
+            form.add_field('abstract', abstract)
+        if keywords:
+            # Put keywords in a format that django-rest's serializer will understand
+            for (i, kw) in enumerate(keywords):
+                form.add_field("keywords[{index}]".format(index=i), kw)
+        for (name, value) in (('edit_users', edit_users), ('view_users', view_users),
+                              ('edit_groups', edit_groups), ('view_groups', view_groups),
+                              ('metadata', metadata), ('extra_metadata', extra_metadata)):
+            if value:
+                form.add_field(name, value if isinstance(value, str) else ','.join(value))
+
+        fd, close_fd = None, False
+        if resource_file:
+            fd, close_fd = self._prepareFormData(form, resource_file, resource_filename)
+        try:
+            r = await self._request('POST', url, data=form)
+        finally:
+            if close_fd:
+                fd.close()
+
+        if r.status_code != 201:
+            if r.status_code == 403:
+                raise HydroShareNotAuthorized(('POST', url))
+            else:
+                raise HydroShareHTTPException(r)
+
+        return r.json()['resource_id']
+
+    async def deleteResource(self, pid):
+        """ Delete a resource.  See HydroShare.deleteResource. """
+        url = "{url_base}/resource/{pid}/".format(url_base=self.url_base,
+                                                  pid=pid)
+
+        r = await self._request('DELETE', url)
+        if r.status_code != 204:
+            if r.status_code == 403:
+                raise HydroShareNotAuthorized(('DELETE', url))
+            elif r.status_code == 404:
+                raise HydroShareNotFound((pid,))
+            else:
+                raise HydroShareHTTPException(r)
+
+    async def addResourceFile(self, pid, resource_file, resource_filename=None):
+        """ Add a new file to an existing resource.  See HydroShare.addResourceFile.
+
+        :return: Dictionary containing 'resource_id' the ID of the resource to which the file was added, and
+                'file_name' the filename of the file added.
+        """
+        url = "{url_base}/resource/{pid}/files/".format(url_base=self.url_base,
+                                                        pid=pid)
+
+        form = aiohttp.FormData()
+        fd, close_fd = self._prepareFormData(form, resource_file, resource_filename)
+        try:
+            r = await self._request('POST', url, data=form)
+        finally:
+            if close_fd:
+                fd.close()
+
+        if r.status_code != 201:
+            if r.status_code == 403:
+                raise HydroShareNotAuthorized(('POST', url))
+            elif r.status_code == 404:
+                raise HydroShareNotFound((pid,))
+            else:
+                raise HydroShareHTTPException(r)
+
+        return r.json()
+
+    async def getResourceFile(self, pid, filename, destination=None):
+        """ Get a file within a resource.  See HydroShare.getResourceFile.
+
+        :return: The path of the downloaded file (if destination was specified), or an async generator
+            yielding the bytes of the resource file.
+        """
+        url = "{url_base}/resource/{pid}/files/{filename}".format(url_base=self.url_base,
+                                                                  pid=pid,
+                                                                  filename=filename)
+
+        if destination:
+            if not os.path.isdir(destination):
+                raise HydroShareArgumentException("{0} is not a directory.".format(destination))
+            if not os.access(destination, os.W_OK):
+                raise HydroShareArgumentException("You do not have write permissions to directory '{0}'.".format(destination))
+
+        r = await self._request('GET', url, stream=True)
+        if r.status != 200:
+            await self._raiseForStream(r, 'GET', url, pid, filename)
+
+        if destination is None:
+            return self._iterContent(r)
+        else:
+            filepath = os.path.join(destination, filename)
+            # Disk writes run on the default executor, leaving the event loop free for other requests
+            loop = asyncio.get_event_loop()
+            fd = await loop.run_in_executor(None, open, filepath, 'wb')
+            try:
+                async for chunk in self._iterContent(r):
+                    await loop.run_in_executor(None, fd.write, chunk)
+            finally:
+                await loop.run_in_executor(None, fd.close)
+            return filepath
+
+    async def deleteResourceFile(self, pid, filename):
+        """ Delete a resource file.  See HydroShare.deleteResourceFile. """
+        url = "{url_base}/resource/{pid}/files/{filename}".format(url_base=self.url_base,
+                                                                  pid=pid,
+                                                                  filename=filename)
+
+        r = await self._request('DELETE', url)
+        if r.status_code != 200:
+            if r.status_code == 403:
+                raise HydroShareNotAuthorized(('DELETE', url))
+            elif r.status_code == 404:
+                raise HydroShareNotFound((pid, filename))
+            else:
+                raise HydroShareHTTPException(r)
+
+        return r.json()['resource_id']
+
+    def getResourceFileList(self, pid):
+        """ Get a listing of files within a resource.  See HydroShare.getResourceFileList.
+
+        :return: An async generator yielding a dict for each file.
+        """
+        url = "{url_base}/resource/{pid}/files/".format(url_base=self.url_base,
+                                                        pid=pid)
+        return asyncResultsListGenerator(self, url)
+
+    async def getUserInfo(self):
+        """ Query the GET /hsapi/userInfo/ REST end point.  See HydroShare.getUserInfo. """
+        url = "{url_base}/userInfo/".format(url_base=self.url_base)
+
+        r = await self._request('GET', url)
+        if r.status_code != 200:
+            raise HydroShareHTTPException(r)
+
+        return r.json()
@@ -0,0 +1,391 @@
+"""
+
+Extraction and verification of the BagIt archives resources are downloaded as
+
+"""
+
+import os
+import zlib
+import struct
+import posixpath
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+from .compat import queue
+from .checksums import ChecksumWriter, parseManifest, isManifest, DEFAULT_ALGORITHMS
+from .exceptions import HydroShareException
+from .batch import BatchResult
+
+
+EXTRACT_CHUNK_SIZE = 1024 * 1024
+
+# Members whose compressed size is at least this large are inflated on a worker thread when extract workers
+# are available, while the next members are read from the stream
+THREADED_MEMBER_SIZE = 8 * 1024 * 1024
+
+_LOCAL_HEADER = struct.Struct('<HHHHHIIIHH')
+_LOCAL_SIGNATURE = b'PK\x03\x04'
+_CENTRAL_SIGNATURES = (b'PK\x01\x02', b'PK\x05\x06', b'PK\x06\x06')
+_DESCRIPTOR_SIGNATURE = b'PK\x07\x08'
+_ZIP64_EXTRA = 0x0001
+_FLAG_ENCRYPTED = 0x01
+_FLAG_DESCRIPTOR = 0x08
+_FLAG_UTF8 = 0x800
+
+
+class BagDownload(BatchResult):
+    """ Outcome of downloading the bag of one resource as part of HydroShare.getResources
+
+        :param index: Position of the resource in the requested pids
+        :param pid: The HydroShare ID of the resource
+        :param value: Path of the saved zip file, or of the directory it was extracted to, if the download succeeded
+        :param exception: HydroShareException (or requests.RequestException) the download failed with
+        :param wait_time: Seconds spent waiting for HydroShare to create the bag
+        :param download_time: Seconds spent downloading (and extracting) the bag
+    """
+    def __init__(self, index, pid, value=None, exception=None, wait_time=0.0, download_time=0.0):
+        super(BagDownload, self).__init__(index, (pid,), {}, value=value, exception=exception)
+        self.wait_time = wait_time
+        self.download_time = download_time
+
+    @property
+    def pid(self):
+        return self.args[0]
+
+    @property
+    def elapsed(self):
+        return self.wait_time + self.download_time
+
+    def __repr__(self):
+        if self.ok:
+            return "BagDownload(pid={0!r}, value={1!r}, elapsed={2:.2f})".format(self.pid, self.value, self.elapsed)
+        return "BagDownload(pid={0!r}, exception={1!r})".format(self.pid, self.exception)
+
+
+def memberPath(dirname, name):
+    """ Path a zip member is extracted to under dirname.
+
+    :raises: HydroShareException if the member would be written outside dirname
+    """
+    parts = [p for p in name.replace('\\', '/').split('/') if p not in ('', '.')]
+    if not parts or '..' in parts or os.path.splitdrive(parts[0])[0]:
+        raise HydroShareException("Refusing to extract {0!r} outside of {1}.".format(name, dirname))
+    return os.path.join(dirname, *parts)
+
+
+def _manifestEntries(name, text):
+    # (member name, checksum) of the entries of the manifest member name, whose paths are relative to it
+    root = posixpath.dirname(name)
+    for path, checksum in parseManifest(name, text).items():
+        yield (posixpath.join(root, path) if root else path), checksum
+
+
+def readManifests(zfile):
+    """ Checksums listed in the (tag)manifest files of a zipped bag.
+
+    :param zfile: zipfile.ZipFile of the bag
+    :return: dict mapping member names to lists of (algorithm, digest bytes)
+    """
+    expected = {}
+    for info in zfile.infolist():
+        if isManifest(info.filename):
+            for member, checksum in _manifestEntries(info.filename, zfile.read(info).decode('utf-8')):
+                expected.setdefault(member, []).append(checksum)
+    return expected
+
+
+def _makeParent(path):
+    parent = os.path.dirname(path)
+    if not os.path.isdir(parent):
+        os.makedirs(parent)
+
+
+def _copyMember(zfile, info, writer, chunk_size=EXTRACT_CHUNK_SIZE):
+    with zfile.open(info) as member:
+        while True:
+            chunk = member.read(chunk_size)
+            if not chunk:
+                break
+            writer.write(chunk)
+
+
+def extractBagFile(filepath, dirname=None, verify=True):
+    """ Extract a zipped bag to dirname and/or check its members against its manifests.
+
+        Members are hashed as they are decompressed, so extracting and verifying costs a single read of the
+        archive.  Only the algorithms a member's manifest entries use are computed.
+
+    :param filepath: Path of the bag's zip file
+    :param dirname: Directory to extract the bag to, or None to only verify
+    :param verify: If True, check members against the manifests
+    :return: Number of members checked against a manifest
+    :raises: HydroShareChecksumException if a member does not match its manifest entry
+    :raises: HydroShareException if the file is not a zip archive or a member would be extracted outside dirname
+    """
+    checked = 0
+    try:
+        zfile = zipfile.ZipFile(filepath)
+    except zipfile.BadZipfile as e:
+        raise HydroShareException("{0} is not a valid bag: {1}".format(filepath, e))
+    with zfile:
+        expected = readManifests(zfile) if verify else {}
+        for info in zfile.infolist():
+            target = memberPath(dirname, info.filename) if dirname else None
+            if info.filename.endswith('/'):
+                if target and not os.path.isdir(target):
+                    os.makedirs(target)
+                continue
+            checksums = expected.get(info.filename, ())
+            if target is None and not checksums:
+                continue
+            writer = ChecksumWriter(algorithms=set(algorithm for (algorithm, digest) in checksums))
+            if target is None:
+                _copyMember(zfile, info, writer)
+            else:
+                _makeParent(target)
+                with open(target, 'wb') as fd:
+                    writer.fd = fd
+                    _copyMember(zfile, info, writer)
+            for checksum in checksums:
+                writer.verify(info.filename, checksum=checksum)
+            if checksums:
+                checked += 1
+    return checked
+
+
+class _StreamReader(object):
+    # Reads exact amounts from an iterable of byte chunks, such as a response's iter_content()
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buffer = b''
+
+    def _fill(self):
+        for chunk in self._chunks:
+            if chunk:
+                self._buffer += chunk
+                return True
+        return False
+
+    def read(self, size):
+        """ Up to size bytes; fewer only at the end of the stream """
+        while len(self._buffer) < size and self._fill():
+            pass
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def readExactly(self, size):
+        data = self.read(size)
+        if len(data) != size:
+            raise HydroShareException("The bag archive ended unexpectedly.")
+        return data
+
+    def readSome(self, size):
+        """ Between 1 and size bytes, as soon as any are available """
+        if not self._buffer and not self._fill():
+            raise HydroShareException("The bag archive ended unexpectedly.")
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def unread(self, data):
+        self._buffer = data + self._buffer
+
+
+class _MemberWriter(object):
+    # Inflates a member's data into its file, checking its CRC-32 and size and hashing it when verifying
+    def __init__(self, name, target, method, algorithms):
+        self.name = name
+        self.target = target
+        self.fd = open(target, 'wb')
+        self.writer = ChecksumWriter(self.fd, algorithms=algorithms)
+        self.crc = 0
+        self._inflater = zlib.decompressobj(-zlib.MAX_WBITS) if method == zipfile.ZIP_DEFLATED else None
+
+    @property
+    def eof(self):
+        return self._inflater is not None and self._inflater.eof
+
+    def feed(self, data):
+        """ Write compressed data; return whatever follows the end of a deflate stream """
+        if self._inflater is None:
+            self._write(data)
+            return b''
+        try:
+            self._write(self._inflater.decompress(data))
+        except zlib.error as e:
+            raise HydroShareException("Cannot decompress {0} in the bag archive: {1}".format(self.name, e))
+        return self._inflater.unused_data
+
+    def _write(self, data):
+        if data:
+            self.crc = zlib.crc32(data, self.crc)
+            self.writer.write(data)
+
+    def finish(self, crc, size):
+        self.fd.close()
+        if self._inflater is not None and not self._inflater.eof:
+            raise HydroShareException("{0} is truncated in the bag archive.".format(self.name))
+        if (self.crc & 0xffffffff) != crc or self.writer.size != size:
+            raise HydroShareException("{0} is corrupt in the bag archive.".format(self.name))
+
+    def close(self):
+        self.fd.close()
+
+
+def _inflateQueued(member, chunks, crc, size):
+    # Worker side of a threaded member: chunks are fed until None.  After a failure the queue is still drained
+    # so that the reading thread never blocks on it.
+    error = None
+    while True:
+        data = chunks.get()
+        if data is None:
+            break
+        if error is None:
+            try:
+                member.feed(data)
+            except Exception as e:
+                error = e
+    try:
+        if error is not None:
+            raise error
+        member.finish(crc, size)
+    finally:
+        member.close()
+
+
+def _zip64Sizes(extra, csize, usize):
+    # Sizes in the ZIP64 extra field replace those stored as 0xFFFFFFFF in the local header
+    offset = 0
+    while offset + 4 <= len(extra):
+        tag, length = struct.unpack('<HH', extra[offset:offset + 4])
+        if tag == _ZIP64_EXTRA:
+            values = list(struct.unpack('<{0}Q'.format(length // 8), extra[offset + 4:offset + 4 + length // 8 * 8]))
+            if usize == 0xffffffff and values:
+                usize = values.pop(0)
+            if csize == 0xffffffff and values:
+                csize = values.pop(0)
+            return csize, usize, True
+        offset += 4 + length
+    return csize, usize, False
+
+
+class BagStreamExtractor(object):
+    """ Extracts a zipped bag from a stream of chunks as they arrive, without saving the archive.
+
+        Members are read from their local headers in archive order and inflated straight into dirname.  The
+        CRC-32 and size of every member are checked; with verify, members are also hashed as they are written
+        and checked against the bag's manifests once the stream ends.  With workers, members of at least
+        THREADED_MEMBER_SIZE compressed bytes are inflated on worker threads while the following members are
+        read.
+
+        Members must be stored or deflated.  Stored members of unknown size (written with a data descriptor)
+        cannot be delimited in a stream and raise HydroShareException.
+
+        :param dirname: Directory to extract the bag to
+        :param verify: If True, check members against the bag's manifest files
+        :param workers: Number of threads inflating large members; 0 inflates everything on the calling thread
+        :param chunk_size: Number of compressed bytes handed to a member at a time
+    """
+    def __init__(self, dirname, verify=False, workers=0, chunk_size=EXTRACT_CHUNK_SIZE):
+        self.dirname = dirname
+        self.verify = verify
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.members = {}
+
+    def extract(self, chunks):
+        """ Extract the archive read from chunks.
+
+        :return: Number of files extracted
+        :raises: HydroShareChecksumException if verify is set and a file does not match the bag's manifests
+        :raises: HydroShareException if the archive is malformed, truncated or uses unsupported features
+        """
+        reader = _StreamReader(chunks)
+        executor = ThreadPoolExecutor(max_workers=self.workers) if self.workers else None
+        futures = []
+        try:
+            while True:
+                signature = reader.read(4)
+                if signature in _CENTRAL_SIGNATURES or (signature == b'' and self.members):
+                    break
+                if signature != _LOCAL_SIGNATURE:
+                    raise HydroShareException("The bag is not a zip archive.")
+                future = self._member(reader, executor)
+                if future is not None:
+                    futures.append(future)
+            for future in futures:
+                future.result()
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=True)
+        if self.verify:
+            self._verifyManifests()
+        return len(self.members)
+
+    def _member(self, reader, executor):
+        (version, flags, method, mtime, mdate, crc, csize, usize,
+         name_length, extra_length) = _LOCAL_HEADER.unpack(reader.readExactly(_LOCAL_HEADER.size))
+        raw_name = reader.readExactly(name_length)
+        name = raw_name.decode('utf-8' if flags & _FLAG_UTF8 else 'cp437')
+        csize, usize, zip64 = _zip64Sizes(reader.readExactly(extra_length), csize, usize)
+        target = memberPath(self.dirname, name)
+
+        if name.endswith('/'):
+            if not os.path.isdir(target):
+                os.makedirs(target)
+            return None
+        if flags & _FLAG_ENCRYPTED:
+            raise HydroShareException("{0} is encrypted in the bag archive.".format(name))
+        if method not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+            raise HydroShareException("{0} uses an unsupported compression method ({1}).".format(name, method))
+        descriptor = flags & _FLAG_DESCRIPTOR
+        if descriptor and method == zipfile.ZIP_STORED:
+            raise HydroShareException("{0} is stored with an unknown size and cannot be streamed.".format(name))
+
+        _makeParent(target)
+        member = _MemberWriter(name, target, method, DEFAULT_ALGORITHMS if self.verify else ())
+        self.members[name] = member.writer
+        if not descriptor and executor is not None and csize >= THREADED_MEMBER_SIZE:
+            chunks = queue.Queue(maxsize=4)
+            future = executor.submit(_inflateQueued, member, chunks, crc, usize)
+            try:
+                self._copy(reader, csize, chunks.put)
+            finally:
+                chunks.put(None)
+            return future
+
+        try:
+            if descriptor:
+                while not member.eof:
+                    reader.unread(member.feed(reader.readSome(self.chunk_size)))
+                crc, csize, usize = self._descriptor(reader, zip64)
+            else:
+                self._copy(reader, csize, member.feed)
+            member.finish(crc, usize)
+        finally:
+            member.close()
+        return None
+
+    def _copy(self, reader, size, feed):
+        while size:
+            data = reader.readSome(min(size, self.chunk_size))
+            size -= len(data)
+            feed(data)
+
+    def _descriptor(self, reader, zip64):
+        size_format = '<QQ' if zip64 else '<II'
+        first = reader.readExactly(4)
+        if first == _DESCRIPTOR_SIGNATURE:
+            first = reader.readExactly(4)
+        crc = struct.unpack('<I', first)[0]
+        csize, usize = struct.unpack(size_format, reader.readExactly(struct.calcsize(size_format)))
+        return crc, csize, usize
+
+    def _verifyManifests(self):
+        for name in [n for n in self.members if isManifest(n)]:
+            with open(memberPath(self.dirname, name), 'rb') as f:
+                text = f.read().decode('utf-8')
+            for member, checksum in _manifestEntries(name, text):
+                if member not in self.members:
+                    raise HydroShareException("{0} is listed in {1} but missing from the bag.".format(member, name))
+                self.members[member].verify(member, checksum=checksum)
+
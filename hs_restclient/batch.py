@@ -0,0 +1,112 @@
+"""
+
+Concurrent execution of HydroShare client calls over a bounded thread pool
+
+"""
+
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import requests
+
+from .exceptions import HydroShareException
+
+
+DEFAULT_MAX_WORKERS = 8
+
+
+class BatchResult(object):
+    """ Outcome of a single call made as part of a batch
+
+        :param index: Position of the call in the input sequence
+        :param args: Positional arguments the call was made with
+        :param kwargs: Keyword arguments the call was made with
+        :param value: Return value of the call, if it succeeded
+        :param exception: HydroShareException (or requests.RequestException) raised by the call, if it failed
+    """
+    def __init__(self, index, args, kwargs, value=None, exception=None):
+        self.index = index
+        self.args = args
+        self.kwargs = kwargs
+        self.value = value
+        self.exception = exception
+
+    @property
+    def ok(self):
+        return self.exception is None
+
+    def result(self):
+        """ Return the value of the call, or re-raise the exception it failed with """
+        if self.exception is not None:
+            raise self.exception
+        return self.value
+
+    def __repr__(self):
+        if self.ok:
+            return "BatchResult(args={0!r}, value={1!r})".format(self.args, self.value)
+        return "BatchResult(args={0!r}, exception={1!r})".format(self.args, self.exception)
+
+
+def _collect(index, args, kwargs, future):
+    exception = future.exception()
+    if exception is None:
+        return BatchResult(index, args, kwargs, value=future.result())
+    if isinstance(exception, (HydroShareException, requests.RequestException)):
+        return BatchResult(index, args, kwargs, exception=exception)
+    # Anything else is a programming error and should stop the batch
+    raise exception
+
+
+def executeBatch(calls, max_workers=DEFAULT_MAX_WORKERS, ordered=True):
+    """ Run calls concurrently on a pool of max_workers threads.
+
+        At most 2 * max_workers calls are submitted or buffered at any time, so calls may be a
+        lazy iterable over millions of items.
+
+        :param calls: iterable of (callable, args, kwargs) tuples
+        :param max_workers: number of threads making calls
+        :param ordered: if True, results are yielded in input order, otherwise in completion order
+
+        :return: A generator of BatchResult objects, one per call.  Failures raising HydroShareException
+            or requests.RequestException are captured in the BatchResult rather than stopping the batch.
+    """
+    calls = iter(calls)
+    window = max(1, max_workers) * 2
+    pending = {}
+    completed = {}
+    submitted = 0
+    next_index = 0
+    exhausted = False
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        while True:
+            while not exhausted and len(pending) + len(completed) < window:
+                try:
+                    fn, args, kwargs = next(calls)
+                except StopIteration:
+                    exhausted = True
+                    break
+                future = executor.submit(fn, *args, **kwargs)
+                pending[future] = (submitted, args, kwargs)
+                submitted += 1
+
+            if not pending:
+                break
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                index, args, kwargs = pending.pop(future)
+                result = _collect(index, args, kwargs, future)
+                if ordered:
+                    completed[index] = result
+                else:
+                    yield result
+
+            while next_index in completed:
+                yield completed.pop(next_index)
+                next_index += 1
+    finally:
+        # The consumer may stop early; don't start calls nobody will look at
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
@@ -0,0 +1,745 @@
+"""
+
+Caching of GET responses and downloaded files for the HydroShare client, revalidated with conditional requests
+
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import shutil
+import binascii
+import sqlite3
+import threading
+from collections import OrderedDict
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from .compat import urlencode, http_responses, replace
+from .checksums import ChecksumWriter, parseChecksum
+
+
+DEFAULT_MAX_ENTRIES = 1024
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+DEFAULT_MAX_FILE_BYTES = 10 * 1024 * 1024 * 1024
+
+DEFAULT_NEGATIVE_TTL = 30
+
+# Statuses remembered by NegativeCache: not found and not authorized
+NEGATIVE_STATUSES = frozenset([403, 404])
+
+# Methods that do not modify the resource they are sent to, and so leave its cached responses in place
+SAFE_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS'])
+
+# Names of the endpoints whose responses are cached, for use as keys of the ttls argument
+ENDPOINTS = ('sysmeta', 'scimeta', 'scimeta_rdf', 'resource_map', 'resource_types', 'folder')
+
+# Headers of a 304 response that update the stored response
+REVALIDATION_HEADERS = ('ETag', 'Last-Modified', 'Cache-Control', 'Expires', 'Date')
+
+
+_RESOURCE_ID_IN_URL = re.compile(r'/(?:resource|scimeta)/([0-9a-f]{32})(?:/|$)')
+
+
+def cacheKey(url, params=None):
+    if not params:
+        return url
+    return "{0}?{1}".format(url, urlencode(sorted(params.items()), doseq=True))
+
+
+def resourceIdFromUrl(url):
+    """ The HydroShare ID of the resource a REST API URL refers to, or None """
+    match = _RESOURCE_ID_IN_URL.search(url)
+    return match.group(1) if match else None
+
+
+def _versions(items):
+    for item in items:
+        pid = item.get('resource_id')
+        version = item.get('date_last_updated')
+        if pid and version:
+            yield pid, version
+
+
+class CacheStatistics(object):
+    """ Thread-safe cache counters.
+
+        hits: responses served from the cache, either still fresh or after the server answered 304 Not Modified
+        misses: responses whose body had to be downloaded, because nothing was cached or it had changed
+        revalidations: conditional requests (If-None-Match / If-Modified-Since) sent to the server
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+
+    def count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def asDict(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'revalidations': self.revalidations}
+
+
+class CacheEntry(object):
+    """ A cached response body with the validators needed to revalidate it """
+    def __init__(self, url, status_code, headers, content, endpoint=None, pid=None, stored_at=None, version=None):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.endpoint = endpoint
+        self.pid = pid
+        self.stored_at = stored_at if stored_at is not None else time.time()
+        # date_last_updated of the resource, as last seen in a listing, when the response was stored
+        self.version = version
+
+    @property
+    def etag(self):
+        return self.headers.get('ETag')
+
+    @property
+    def last_modified(self):
+        return self.headers.get('Last-Modified')
+
+    def conditionalHeaders(self):
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+    def toResponse(self, request=None):
+        """ Rebuild a requests.Response serving the cached body """
+        r = requests.Response()
+        r.status_code = self.status_code
+        r.headers = CaseInsensitiveDict(self.headers)
+        r._content = self.content
+        r._content_consumed = True
+        r.encoding = requests.utils.get_encoding_from_headers(r.headers)
+        r.url = self.url
+        r.request = request
+        r.from_cache = True
+        return r
+
+
+class ResponseCache(object):
+    """ In-memory cache of GET responses for HydroShare metadata endpoints.
+
+        Responses carrying an ETag or Last-Modified header are stored.  The next request for the same URL is
+        sent with If-None-Match / If-Modified-Since, and if the server answers 304 Not Modified the cached
+        body is returned instead, as a regular 200 response whose from_cache attribute is True.
+
+        Responses of endpoints given a TTL are served without contacting the server at all for that many
+        seconds after they were stored (or last revalidated).  Requests that modify a resource (anything but
+        GET) drop the cached responses of that resource.
+
+        Resource listings read through a HydroShare object with a cache report each resource's
+        date_last_updated to observe().  Responses about a resource are stored along with the date_last_updated
+        last observed for it, and are served without contacting the server for as long as listings keep
+        reporting that same date.  A nightly harvest that scans the listing before fetching metadata therefore
+        only downloads the metadata of resources that changed.
+
+        Cache keys do not include credentials: do not share a cache between HydroShare objects logged in as
+        different users.
+
+        :param max_entries: Number of responses to keep; the least recently used are dropped first
+        :param ttls: dict mapping endpoint names (see ENDPOINTS) to the number of seconds their responses stay
+            fresh
+        :param default_ttl: Seconds responses of endpoints not in ttls stay fresh; 0 revalidates every time
+    """
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttls=None, default_ttl=0):
+        self.max_entries = max_entries
+        self.ttls = dict(ttls or {})
+        self.default_ttl = default_ttl
+        self.statistics = CacheStatistics()
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._versions = {}
+
+    def ttl(self, endpoint):
+        return self.ttls.get(endpoint, self.default_ttl)
+
+    def isFresh(self, entry):
+        """ True if entry can be served without asking the server, because of its TTL or its version """
+        if entry.version is not None and entry.version == self.version(entry.pid):
+            return True
+        ttl = self.ttl(entry.endpoint)
+        return ttl > 0 and time.time() - entry.stored_at < ttl
+
+    def observe(self, items):
+        """ Record the date_last_updated of the resources in a list of listing items (dicts or records).
+            Cached responses about resources whose date changed become stale.
+        """
+        with self._lock:
+            self._versions.update(_versions(items))
+
+    def version(self, pid):
+        """ The date_last_updated last observed for a resource, or None """
+        if pid is None:
+            return None
+        with self._lock:
+            return self._versions.get(pid)
+
+    key = staticmethod(cacheKey)
+
+    def lookup(self, key):
+        """ Return the CacheEntry stored under key, or None """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.pop(key)
+                self._entries[key] = entry
+            return entry
+
+    def store(self, key, entry):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def remove(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def invalidate(self, pid=None):
+        """ Drop the cached responses of a resource, or all of them if pid is None """
+        with self._lock:
+            if pid is None:
+                self._entries.clear()
+                self._versions.clear()
+            else:
+                for key in [k for (k, e) in self._entries.items() if e.pid == pid]:
+                    del self._entries[key]
+                # The resource has changed since it was last listed
+                self._versions.pop(pid, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def prepare(self, key, headers=None):
+        """ Look up key and add the conditional request headers of its entry to headers.
+
+        :return: (entry, headers, response); response is the cached response if it is still fresh, in which
+            case no request needs to be made.  entry is None if nothing is cached that can be revalidated.
+        """
+        entry = self.lookup(key)
+        if entry is None:
+            return None, headers, None
+        if self.isFresh(entry):
+            self.statistics.count('hits')
+            return entry, headers, entry.toResponse()
+        conditional = entry.conditionalHeaders()
+        if not conditional:
+            return None, headers, None
+        self.statistics.count('revalidations')
+        merged = dict(headers or {})
+        merged.update(conditional)
+        return entry, merged, None
+
+    def update(self, key, entry, response, endpoint=None, pid=None):
+        """ Process the response to a (possibly conditional) request, and return the response to use """
+        if entry is not None and response.status_code == 304:
+            self.statistics.count('hits')
+            # Validators (and other headers) sent along with the 304 supersede the stored ones
+            headers = CaseInsensitiveDict(entry.headers)
+            headers.update((k, response.headers[k]) for k in REVALIDATION_HEADERS if k in response.headers)
+            entry = CacheEntry(entry.url, entry.status_code, headers, entry.content, entry.endpoint, entry.pid,
+                               version=self.version(entry.pid))
+            self.store(key, entry)
+            response.close()
+            return entry.toResponse(response.request)
+
+        self.statistics.count('misses')
+        validated = 'ETag' in response.headers or 'Last-Modified' in response.headers
+        if response.status_code == 200 and (validated or self.ttl(endpoint) > 0 or self.version(pid) is not None):
+            self.store(key, CacheEntry(response.url, response.status_code, CaseInsensitiveDict(response.headers),
+                                       response.content, endpoint, pid, version=self.version(pid)))
+        elif entry is not None:
+            self.remove(key)
+        return response
+
+
+class NegativeCache(object):
+    """ Short-lived memory of requests that failed with 404 Not Found or 403 Forbidden.  Its statistics count
+        failures served from memory as hits and failures remembered as misses.
+
+        While an entry is fresh, repeating the request returns a response with the same status without contacting
+        the server, so the calling method raises HydroShareNotFound or HydroShareNotAuthorized as before.  Kept
+        separate from ResponseCache so that failures expire much sooner than metadata.
+
+        :param ttl: Seconds a failure is remembered
+        :param max_entries: Number of failures to remember; the least recently used are dropped first
+    """
+    def __init__(self, ttl=DEFAULT_NEGATIVE_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.statistics = CacheStatistics()
+        self._lock = threading.Lock()
+        # key -> (status_code, url, pid, stored_at, method, request_url)
+        self._entries = OrderedDict()
+
+    key = staticmethod(cacheKey)
+
+    def lookup(self, key):
+        """ Return a response with the remembered status of key, or None """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            status_code, url, pid, stored_at, method, request_url = entry
+            if time.time() - stored_at >= self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.pop(key)
+            self._entries[key] = entry
+        self.statistics.count('hits')
+        r = requests.Response()
+        r.status_code = status_code
+        r.reason = http_responses.get(status_code)
+        r._content = b''
+        r._content_consumed = True
+        r.url = url
+        # HydroShareHTTPException reports the method and url of the request
+        r.request = requests.PreparedRequest()
+        r.request.prepare(method=method, url=request_url)
+        r.from_cache = True
+        return r
+
+    def update(self, key, response, pid=None):
+        """ Remember response if it is a failure, otherwise forget any failure remembered for key """
+        if response.status_code in NEGATIVE_STATUSES:
+            self.statistics.count('misses')
+        with self._lock:
+            if response.status_code in NEGATIVE_STATUSES:
+                self._entries.pop(key, None)
+                request = response.request
+                self._entries[key] = (response.status_code, response.url, pid, time.time(),
+                                      request.method if request is not None else 'GET',
+                                      request.url if request is not None else response.url)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            else:
+                self._entries.pop(key, None)
+
+    def invalidate(self, pid=None):
+        """ Forget the failures of a resource, or all of them if pid is None """
+        with self._lock:
+            if pid is None:
+                self._entries.clear()
+            else:
+                for key in [k for (k, e) in self._entries.items() if e[2] == pid]:
+                    del self._entries[key]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class DiskResponseCache(ResponseCache):
+    """ ResponseCache kept in an SQLite database, shared by all HydroShare objects (and processes) using the same
+        path.  Behaves like ResponseCache, with a byte budget instead of an entry count.
+
+        >>> cache = DiskResponseCache(os.path.expanduser('~/.cache/hs_restclient'), ttls={'sysmeta': 60})
+        >>> hs = HydroShare(auth=auth, cache=cache)
+
+        :param directory: Directory holding the cache database; created if missing
+        :param max_bytes: Total size of the cached bodies to keep; the least recently used are dropped first
+        :param ttls: dict mapping endpoint names (see ENDPOINTS) to the number of seconds their responses stay
+            fresh
+        :param default_ttl: Seconds responses of endpoints not in ttls stay fresh; 0 revalidates every time
+        :param timeout: Seconds to wait for another process holding the database lock
+    """
+    FILENAME = 'responses.sqlite'
+    # Bumped whenever the tables change; databases of other versions are emptied and recreated
+    SCHEMA_VERSION = 1
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES, ttls=None, default_ttl=0, timeout=30):
+        super(DiskResponseCache, self).__init__(ttls=ttls, default_ttl=default_ttl)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.path = os.path.join(directory, self.FILENAME)
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self._local = threading.local()
+        with self._transaction() as db:
+            if db.execute("PRAGMA user_version").fetchone()[0] != self.SCHEMA_VERSION:
+                db.execute("DROP TABLE IF EXISTS entries")
+                db.execute("DROP TABLE IF EXISTS versions")
+                db.execute("PRAGMA user_version={0}".format(self.SCHEMA_VERSION))
+            db.execute("CREATE TABLE IF NOT EXISTS entries ("
+                       "key TEXT PRIMARY KEY, url TEXT, status_code INTEGER, headers TEXT, content BLOB, "
+                       "endpoint TEXT, pid TEXT, stored_at REAL, accessed_at REAL, size INTEGER, version TEXT)")
+            db.execute("CREATE INDEX IF NOT EXISTS entries_pid ON entries (pid)")
+            db.execute("CREATE INDEX IF NOT EXISTS entries_accessed_at ON entries (accessed_at)")
+            db.execute("CREATE TABLE IF NOT EXISTS versions (pid TEXT PRIMARY KEY, version TEXT)")
+
+    def _connection(self):
+        return _threadConnection(self._local, self.path, self.timeout)
+
+    def _transaction(self):
+        return _Transaction(self._connection())
+
+    def lookup(self, key):
+        with self._transaction() as db:
+            row = db.execute("SELECT url, status_code, headers, content, endpoint, pid, stored_at, version "
+                             "FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            db.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (time.time(), key))
+        url, status_code, headers, content, endpoint, pid, stored_at, version = row
+        return CacheEntry(url, status_code, CaseInsensitiveDict(json.loads(headers)), bytes(content), endpoint,
+                          pid, stored_at, version)
+
+    def store(self, key, entry):
+        size = len(entry.content)
+        if size > self.max_bytes:
+            # Too large to keep, but an older body stored under the same key must not be served in its place
+            self.remove(key)
+            return
+        with self._transaction() as db:
+            db.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                       (key, entry.url, entry.status_code, json.dumps(dict(entry.headers)),
+                        sqlite3.Binary(entry.content), entry.endpoint, entry.pid, entry.stored_at, time.time(),
+                        size, entry.version))
+            total = db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            if total > self.max_bytes:
+                evict = []
+                for old_key, old_size in db.execute("SELECT key, size FROM entries ORDER BY accessed_at"):
+                    if total <= self.max_bytes:
+                        break
+                    evict.append((old_key,))
+                    total -= old_size
+                db.executemany("DELETE FROM entries WHERE key = ?", evict)
+
+    def remove(self, key):
+        with self._transaction() as db:
+            db.execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def invalidate(self, pid=None):
+        """ Drop the cached responses of a resource, or all of them if pid is None """
+        with self._transaction() as db:
+            if pid is None:
+                db.execute("DELETE FROM entries")
+                db.execute("DELETE FROM versions")
+            else:
+                db.execute("DELETE FROM entries WHERE pid = ?", (pid,))
+                db.execute("DELETE FROM versions WHERE pid = ?", (pid,))
+
+    def observe(self, items):
+        """ Record the date_last_updated of the resources in a list of listing items (dicts or records).
+            Cached responses about resources whose date changed become stale.
+        """
+        versions = list(_versions(items))
+        if versions:
+            with self._transaction() as db:
+                db.executemany("INSERT OR REPLACE INTO versions VALUES (?, ?)", versions)
+
+    def version(self, pid):
+        """ The date_last_updated last observed for a resource, or None """
+        if pid is None:
+            return None
+        row = self._connection().execute("SELECT version FROM versions WHERE pid = ?", (pid,)).fetchone()
+        return row[0] if row else None
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def close(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+
+def _threadConnection(local, path, timeout):
+    # sqlite3 connections may not be shared between threads, nor survive a fork
+    connection = getattr(local, 'connection', None)
+    if connection is None or local.pid != os.getpid():
+        connection = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        # With WAL, commits need not wait for fsync; the cache can afford losing the last writes on power loss
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute("PRAGMA busy_timeout={0}".format(int(timeout * 1000)))
+        local.connection = connection
+        local.pid = os.getpid()
+    return connection
+
+
+class _Transaction(object):
+    # BEGIN IMMEDIATE takes the database write lock up front, so read-modify-write sequences of concurrent
+    # processes cannot interleave
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        self.connection.execute("BEGIN IMMEDIATE")
+        return self.connection
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.connection.execute("COMMIT")
+        else:
+            self.connection.execute("ROLLBACK")
+        return False
+
+
+# ioctl cloning a whole file on Linux filesystems with copy-on-write extents (btrfs, XFS, ...)
+_FICLONE = 0x40049409
+
+
+def _reflink(source, target):
+    if fcntl is None or not sys.platform.startswith('linux'):
+        return False
+    with open(source, 'rb') as src, open(target, 'wb') as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+            return True
+        except (IOError, OSError):
+            pass
+    os.remove(target)
+    return False
+
+
+def placeFile(source, target, link=True):
+    """ Make target a copy of source, as cheaply as the filesystem allows: a copy-on-write clone (reflink) where
+        supported, else a hard link if link is True, else a copy of the bytes.  target must not exist.
+
+    :return: 'reflink', 'hardlink' or 'copy'
+    """
+    if _reflink(source, target):
+        return 'reflink'
+    if link and hasattr(os, 'link'):
+        try:
+            os.link(source, target)
+            return 'hardlink'
+        except OSError:
+            pass
+    shutil.copyfile(source, target)
+    return 'copy'
+
+
+class FileCacheEntry(object):
+    """ A cached resource file: the validators it was downloaded with and the digest of its content """
+    def __init__(self, pid, path, size, etag, last_modified, digest):
+        self.pid = pid
+        self.path = path
+        self.size = size
+        self.etag = etag
+        self.last_modified = last_modified
+        self.digest = digest
+
+    def conditionalHeaders(self):
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class FileCache(object):
+    """ Read-through cache of the files downloaded by HydroShare.getResourceFile, kept in a directory shared by
+        all HydroShare objects (and processes) using it.
+
+        >>> hs = HydroShare(auth=auth, file_cache=FileCache(os.path.expanduser('~/.cache/hs_restclient/files')))
+
+        Files are stored by content, under the SHA-256 of their bytes, so that a file shared by a resource and its
+        versions or copies is kept once.  A file is served from the cache when the listing it is downloaded with
+        (the verify argument of getResourceFile) gives a checksum of cached content, or when the server answers
+        304 Not Modified to a request made with the validators (ETag, Last-Modified) the file was downloaded with.
+        It is then placed in the destination as a reflink, hard link or copy (see placeFile) instead of being
+        downloaded.
+
+        Hard links share their bytes with the cache: a cached file edited through one is noticed, by its size and
+        mtime, and dropped rather than served.  getResourceFile never writes into a file it may have linked: a new
+        download replaces the destination with a file of its own.  Pass link=False to always copy.
+
+        :param directory: Directory holding the cached files and their index; created if missing
+        :param max_bytes: Total size of the cached files to keep; the least recently used are dropped first
+        :param link: False to copy files out of (and into) the cache rather than hard link them
+        :param timeout: Seconds to wait for another process holding the index lock
+    """
+    FILENAME = 'files.sqlite'
+    SCHEMA_VERSION = 1
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_FILE_BYTES, link=True, timeout=30):
+        self.directory = directory
+        self.blobs = os.path.join(directory, 'blobs')
+        if not os.path.isdir(self.blobs):
+            os.makedirs(self.blobs)
+        self.path = os.path.join(directory, self.FILENAME)
+        self.max_bytes = max_bytes
+        self.link = link
+        self.timeout = timeout
+        self.statistics = CacheStatistics()
+        self._local = threading.local()
+        with self._transaction() as db:
+            if db.execute("PRAGMA user_version").fetchone()[0] != self.SCHEMA_VERSION:
+                db.execute("DROP TABLE IF EXISTS blobs")
+                db.execute("DROP TABLE IF EXISTS files")
+                db.execute("PRAGMA user_version={0}".format(self.SCHEMA_VERSION))
+            db.execute("CREATE TABLE IF NOT EXISTS blobs ("
+                       "digest TEXT PRIMARY KEY, md5 TEXT, size INTEGER, mtime REAL, accessed_at REAL)")
+            db.execute("CREATE INDEX IF NOT EXISTS blobs_md5 ON blobs (md5)")
+            db.execute("CREATE INDEX IF NOT EXISTS blobs_accessed_at ON blobs (accessed_at)")
+            db.execute("CREATE TABLE IF NOT EXISTS files ("
+                       "pid TEXT, path TEXT, size INTEGER, etag TEXT, last_modified TEXT, digest TEXT, "
+                       "PRIMARY KEY (pid, path))")
+            db.execute("CREATE INDEX IF NOT EXISTS files_digest ON files (digest)")
+
+    def _connection(self):
+        return _threadConnection(self._local, self.path, self.timeout)
+
+    def _transaction(self):
+        return _Transaction(self._connection())
+
+    def blobPath(self, digest):
+        return os.path.join(self.blobs, digest[:2], digest)
+
+    def lookup(self, pid, path):
+        """ The FileCacheEntry of a file, or None if it was not downloaded with validators or its content is gone """
+        row = self._connection().execute(
+            "SELECT files.size, etag, last_modified, files.digest FROM files JOIN blobs USING (digest) "
+            "WHERE pid = ? AND path = ?", (pid, path)).fetchone()
+        if row is None or not (row[1] or row[2]):
+            return None
+        return FileCacheEntry(pid, path, *row)
+
+    def find(self, checksum, size=None):
+        """ Digest of the cached content having a checksum, as listed by getResourceFileList, or None
+
+        :param checksum: Checksum accepted by checksums.parseChecksum; only MD5 and SHA-256 can be found
+        :param size: Size the content must have, or None
+        """
+        parsed = parseChecksum(checksum) if checksum else None
+        if parsed is None or parsed[0] not in ('md5', 'sha256'):
+            return None
+        column = 'digest' if parsed[0] == 'sha256' else 'md5'
+        row = self._connection().execute("SELECT digest, size FROM blobs WHERE {0} = ?".format(column),
+                                         (binascii.hexlify(parsed[1]).decode(),)).fetchone()
+        if row is None or (size is not None and int(size) != row[1]):
+            return None
+        return row[0]
+
+    def materialize(self, digest, filepath):
+        """ Write the cached content of digest to filepath, replacing it
+
+        :return: True, or False if the content is no longer cached (or was modified through a hard link)
+        """
+        with self._transaction() as db:
+            row = db.execute("SELECT size, mtime FROM blobs WHERE digest = ?", (digest,)).fetchone()
+            if row is not None:
+                db.execute("UPDATE blobs SET accessed_at = ? WHERE digest = ?", (time.time(), digest))
+        blob = self.blobPath(digest)
+        if row is None or not self._intact(blob, *row):
+            self._drop([digest])
+            return False
+        temporary = '{0}.{1}.tmp'.format(filepath, uuid.uuid4().hex)
+        placeFile(blob, temporary, self.link)
+        replace(temporary, filepath)
+        return True
+
+    def store(self, pid, path, filepath, hasher=None, etag=None, last_modified=None):
+        """ Add a downloaded file to the cache
+
+        :param pid: The HydroShare ID of the resource
+        :param path: Path of the file in the resource
+        :param filepath: Where the file was downloaded to
+        :param hasher: ChecksumWriter that computed the MD5 and SHA-256 of the file as it was written, or None to
+            read it back
+        :param etag: ETag header the file was served with, or None
+        :param last_modified: Last-Modified header the file was served with, or None
+        :return: The digest the content is cached under, or None if it is larger than max_bytes
+        """
+        if hasher is None or not set(('md5', 'sha256')) <= set(hasher.hashes):
+            hasher = ChecksumWriter()
+            with open(filepath, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    hasher.write(chunk)
+        if hasher.size > self.max_bytes:
+            self.forget(pid, path)
+            return None
+        digest = hasher.hexdigest('sha256')
+        blob = self.blobPath(digest)
+        row = self._connection().execute("SELECT size, mtime FROM blobs WHERE digest = ?", (digest,)).fetchone()
+        if row is None or not self._intact(blob, *row):
+            if not os.path.isdir(os.path.dirname(blob)):
+                os.makedirs(os.path.dirname(blob))
+            temporary = '{0}.{1}.tmp'.format(blob, uuid.uuid4().hex)
+            placeFile(filepath, temporary, self.link)
+            replace(temporary, blob)
+        mtime = os.stat(blob).st_mtime
+
+        with self._transaction() as db:
+            db.execute("INSERT OR REPLACE INTO blobs VALUES (?, ?, ?, ?, ?)",
+                       (digest, hasher.hexdigest('md5'), hasher.size, mtime, time.time()))
+            db.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)",
+                       (pid, path, hasher.size, etag, last_modified, digest))
+            total = db.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+            evict = []
+            if total > self.max_bytes:
+                for old_digest, old_size in db.execute("SELECT digest, size FROM blobs ORDER BY accessed_at"):
+                    if total <= self.max_bytes:
+                        break
+                    if old_digest != digest:
+                        evict.append(old_digest)
+                        total -= old_size
+        self._drop(evict)
+        return digest
+
+    def forget(self, pid, path):
+        """ Drop the entry of a file; its content stays cached for other files having it """
+        with self._transaction() as db:
+            db.execute("DELETE FROM files WHERE pid = ? AND path = ?", (pid, path))
+
+    def invalidate(self, pid=None):
+        """ Drop the entries of the files of a resource, or all entries and content if pid is None """
+        with self._transaction() as db:
+            if pid is not None:
+                db.execute("DELETE FROM files WHERE pid = ?", (pid,))
+                return
+            digests = [row[0] for row in db.execute("SELECT digest FROM blobs")]
+        self._drop(digests)
+
+    def _intact(self, blob, size, mtime):
+        try:
+            stat = os.stat(blob)
+        except OSError:
+            return False
+        return (stat.st_size, stat.st_mtime) == (size, mtime)
+
+    def _drop(self, digests):
+        if not digests:
+            return
+        with self._transaction() as db:
+            db.executemany("DELETE FROM files WHERE digest = ?", [(d,) for d in digests])
+            db.executemany("DELETE FROM blobs WHERE digest = ?", [(d,) for d in digests])
+        for digest in digests:
+            try:
+                os.remove(self.blobPath(digest))
+            except OSError:
+                pass
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM blobs").fetchone()[0]
+
+    def close(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
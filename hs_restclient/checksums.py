@@ -0,0 +1,121 @@
+"""
+
+Checksums computed on downloads as they are written, and the BagIt manifests they are checked against
+
+"""
+
+import re
+import base64
+import hashlib
+import binascii
+
+from .exceptions import HydroShareChecksumException
+
+
+DEFAULT_ALGORITHMS = ('md5', 'sha256')
+
+# Names used in BagIt manifest file names and in iRODS checksums ('sha2:<base64>')
+_ALGORITHM_NAMES = {'md5': 'md5', 'sha1': 'sha1', 'sha2': 'sha256', 'sha256': 'sha256', 'sha512': 'sha512'}
+
+_HEX_LENGTHS = {32: 'md5', 40: 'sha1', 64: 'sha256', 128: 'sha512'}
+
+_MANIFEST_NAME = re.compile(r'(?:^|/)(?:tag)?manifest-(\w+)\.txt$')
+
+
+def parseChecksum(value, algorithm=None):
+    """ Parse a checksum, either hex digits or iRODS' '<algorithm>:<base64>', to (algorithm, raw digest)
+
+    :param value: The checksum
+    :param algorithm: Algorithm of a hex checksum; guessed from its length if None
+    :return: (algorithm, digest bytes), or None if value is not a checksum
+    """
+    value = value.strip()
+    if ':' in value:
+        name, encoded = value.split(':', 1)
+        algorithm = _ALGORITHM_NAMES.get(name.lower())
+        try:
+            return (algorithm, base64.b64decode(encoded)) if algorithm else None
+        except (binascii.Error, TypeError):
+            return None
+    algorithm = _ALGORITHM_NAMES.get(algorithm) if algorithm else _HEX_LENGTHS.get(len(value))
+    try:
+        return (algorithm, binascii.unhexlify(value)) if algorithm else None
+    except (binascii.Error, TypeError):
+        return None
+
+
+def parseManifest(name, text):
+    """ Parse a BagIt (tag)manifest file.
+
+        Lines are either '<hex checksum> <path>' as BagIt specifies, or '<path> <algorithm>:<base64>' as written
+        by HydroShare's iRODS.
+
+    :param name: Name of the manifest file, e.g. 'manifest-md5.txt', giving the algorithm of hex checksums
+    :param text: Contents of the manifest
+    :return: dict mapping paths relative to the bag to (algorithm, digest bytes)
+    """
+    match = _MANIFEST_NAME.search(name)
+    algorithm = match.group(1).lower() if match else None
+    entries = {}
+    for line in text.replace('\x00', '').splitlines():
+        fields = line.split(None, 1)
+        if len(fields) != 2:
+            continue
+        first, second = fields[0], fields[1].strip()
+        checksum = parseChecksum(second) if ':' in second and ' ' not in second else None
+        if checksum is not None:
+            entries[first] = checksum
+        else:
+            checksum = parseChecksum(first, algorithm)
+            if checksum is not None:
+                entries[second] = checksum
+    return entries
+
+
+def isManifest(name):
+    return _MANIFEST_NAME.search(name) is not None
+
+
+class ChecksumWriter(object):
+    """ File-like object passing written chunks on to a file while counting and hashing them, so that the
+        content can be verified without reading it back.
+
+        :param fd: File object to write to, or None to only hash
+        :param algorithms: Names of the hashlib algorithms to compute
+    """
+    def __init__(self, fd=None, algorithms=DEFAULT_ALGORITHMS):
+        self.fd = fd
+        self.size = 0
+        self.hashes = dict((algorithm, hashlib.new(algorithm)) for algorithm in algorithms)
+
+    def write(self, chunk):
+        if self.fd is not None:
+            self.fd.write(chunk)
+        self.size += len(chunk)
+        for h in self.hashes.values():
+            h.update(chunk)
+
+    def hexdigest(self, algorithm):
+        return self.hashes[algorithm].hexdigest()
+
+    def verify(self, path, size=None, checksum=None):
+        """ Check what was written against an expected size and checksum.
+
+        :param path: Name of the content, reported in the exception
+        :param size: Expected number of bytes, or None
+        :param checksum: Expected checksum as accepted by parseChecksum, or an (algorithm, digest bytes) tuple,
+            or None.  Checksums of algorithms that were not computed are ignored.
+        :raises: HydroShareChecksumException on a mismatch
+        """
+        if size is not None and int(size) != self.size:
+            raise HydroShareChecksumException((path, 'size', int(size), self.size))
+        if checksum is None:
+            return
+        if not isinstance(checksum, tuple):
+            checksum = parseChecksum(checksum)
+            if checksum is None:
+                return
+        algorithm, digest = checksum
+        if algorithm in self.hashes and self.hashes[algorithm].digest() != digest:
+            raise HydroShareChecksumException((path, algorithm, binascii.hexlify(digest).decode(),
+                                               self.hexdigest(algorithm)))
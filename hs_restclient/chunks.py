@@ -0,0 +1,118 @@
+"""
+
+Reading streamed response bodies into one reusable buffer, in chunks sized to the observed throughput
+
+"""
+
+import time
+
+import requests
+from urllib3.exceptions import ProtocolError, DecodeError, ReadTimeoutError, SSLError
+
+
+DEFAULT_MIN_CHUNK_SIZE = 64 * 1024
+
+DEFAULT_MAX_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Seconds a chunk should take to arrive: long enough to amortize the per-chunk work, short enough for progress
+DEFAULT_CHUNK_INTERVAL = 0.1
+
+
+class AdaptiveChunkSize(object):
+    """ Chunk size following the throughput of a download.
+
+        The size doubles while chunks arrive in under half the target interval and halves while they take more
+        than twice as long, staying a power of two times minimum between minimum and maximum.  A slow link is
+        thus read in small chunks, so that progress and timeouts stay responsive, and a fast one in chunks of
+        several MB, so that the work per chunk is done less often.
+
+        :param minimum: Smallest chunk size, in bytes
+        :param maximum: Largest chunk size, in bytes
+        :param interval: Seconds a chunk should take to arrive
+        :param initial: Chunk size to start with; defaults to minimum
+    """
+    def __init__(self, minimum=DEFAULT_MIN_CHUNK_SIZE, maximum=DEFAULT_MAX_CHUNK_SIZE,
+                 interval=DEFAULT_CHUNK_INTERVAL, initial=None):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.interval = interval
+        self.size = initial or minimum
+
+    def update(self, nbytes, seconds):
+        """ Adjust the size to a chunk of nbytes that took seconds to read, and return it """
+        if nbytes < self.size:
+            # A short read is the end of the body, not a measure of the link
+            return self.size
+        if seconds * 2 < self.interval:
+            self.size = min(self.size * 2, self.maximum)
+        elif seconds > self.interval * 2:
+            self.size = max(self.size // 2, self.minimum)
+        return self.size
+
+
+def _rawReadinto(response):
+    # readinto of the urllib3 response, or None if the body is not left to be read from it as is: compressed
+    # bodies need iter_content to decode them, and a body already read (or served from a cache) has no stream
+    raw = response.raw
+    if not hasattr(raw, 'release_conn') or raw.closed:
+        return None
+    if response.headers.get('Content-Encoding', 'identity').lower() != 'identity':
+        return None
+    return getattr(raw, 'readinto', None)
+
+
+def readChunks(response, chunk_size=None, copy=False):
+    """ Generate the body of a streamed requests response in chunks read into one reusable buffer.
+
+        Chunks are memoryviews of that buffer, only valid until the next chunk is read: write or hash them,
+        don't keep them.  The buffer is only reallocated when the chunk size grows.  Bodies that are compressed
+        or already read (e.g. served from a cache) are read through iter_content instead.
+
+        The connection goes back to the pool once the body has been read.
+
+    :param response: Response requested with stream=True
+    :param chunk_size: Fixed chunk size in bytes, an AdaptiveChunkSize, or None for a default AdaptiveChunkSize
+    :param copy: True to generate bytes objects that may be kept, e.g. for chunks handed to the caller
+    :raises: requests.exceptions.ChunkedEncodingError if the connection closed before the end of the body,
+        requests.exceptions.ConnectionError if reading from it failed
+    """
+    sizes = AdaptiveChunkSize() if chunk_size is None else chunk_size
+    if not isinstance(sizes, AdaptiveChunkSize):
+        sizes = AdaptiveChunkSize(minimum=chunk_size, maximum=chunk_size)
+
+    readinto = _rawReadinto(response)
+    if readinto is None:
+        for chunk in response.iter_content(sizes.size):
+            yield chunk
+        return
+
+    length = response.headers.get('Content-Length')
+    length = int(length) if length and length.isdigit() else None
+    buffer = memoryview(bytearray(sizes.size))
+    received = 0
+    while True:
+        size = sizes.size
+        if size > len(buffer):
+            buffer = memoryview(bytearray(size))
+        started = time.time()
+        # The errors of urllib3 are turned into those of requests as in Response.iter_content
+        try:
+            n = readinto(buffer[:size])
+        except ProtocolError as e:
+            raise requests.exceptions.ChunkedEncodingError(e)
+        except DecodeError as e:
+            raise requests.exceptions.ContentDecodingError(e)
+        except ReadTimeoutError as e:
+            raise requests.exceptions.ConnectionError(e)
+        except SSLError as e:
+            raise requests.exceptions.SSLError(e)
+        if not n:
+            break
+        received += n
+        sizes.update(n, time.time() - started)
+        yield bytes(buffer[:n]) if copy else buffer[:n]
+
+    if length is not None and received < length:
+        raise requests.exceptions.ChunkedEncodingError(
+            "Connection closed after {0} of {1} bytes.".format(received, length))
+    response.raw.release_conn()
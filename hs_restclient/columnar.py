@@ -0,0 +1,222 @@
+"""
+
+Columnar (Arrow, Parquet and NumPy) export of paginated listings
+
+"""
+
+import re
+from datetime import datetime, timedelta
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from .exceptions import HydroShareException
+
+
+# (name, kind) of the columns exported for each kind of listing.  kind is one of 'string', 'bool', 'int',
+# 'float' or 'datetime'.
+RESOURCE_COLUMNS = (
+    ('resource_id', 'string'),
+    ('resource_title', 'string'),
+    ('resource_type', 'string'),
+    ('creator', 'string'),
+    ('author', 'string'),
+    ('date_created', 'datetime'),
+    ('date_last_updated', 'datetime'),
+    ('public', 'bool'),
+    ('discoverable', 'bool'),
+    ('shareable', 'bool'),
+    ('immutable', 'bool'),
+    ('published', 'bool'),
+    ('bag_url', 'string'),
+    ('resource_url', 'string'),
+    ('resource_map_url', 'string'),
+    ('science_metadata_url', 'string'),
+)
+
+FILE_COLUMNS = (
+    ('file_name', 'string'),
+    ('url', 'string'),
+    ('size', 'int'),
+    ('content_type', 'string'),
+    ('logical_type', 'string'),
+    ('modified_time', 'datetime'),
+    ('checksum', 'string'),
+)
+
+_ISO_DATE = re.compile(r'(\d{4})-(\d{2})-(\d{2})(?:[T ](\d{2}):(\d{2})(?::(\d{2})(?:\.(\d{1,6})\d*)?)?)?'
+                       r'\s*(Z|[+-]\d{2}:?\d{2})?$')
+
+
+def parseDate(value):
+    """ Parse a listing date, either MM-DD-YYYY or ISO 8601, to a naive datetime in UTC (None if empty) """
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        return value
+    try:
+        return datetime.strptime(value, '%m-%d-%Y')
+    except ValueError:
+        pass
+    match = _ISO_DATE.match(value.strip())
+    if match is None:
+        raise ValueError("Unrecognized date {0!r}".format(value))
+    year, month, day, hour, minute, second, fraction, zone = match.groups()
+    parsed = datetime(int(year), int(month), int(day), int(hour or 0), int(minute or 0), int(second or 0),
+                      int((fraction or '0').ljust(6, '0')))
+    if zone and zone != 'Z':
+        sign = -1 if zone[0] == '-' else 1
+        zone = zone[1:].replace(':', '')
+        parsed -= sign * timedelta(hours=int(zone[:2]), minutes=int(zone[2:]))
+    return parsed
+
+
+def inferColumns(items):
+    """ Column specification for a listing not covered by RESOURCE_COLUMNS or FILE_COLUMNS """
+    kinds = {}
+    names = []
+    for item in items:
+        for name in item.keys():
+            if name not in kinds:
+                names.append(name)
+                kinds[name] = None
+            value = item[name]
+            if kinds[name] is None and value is not None:
+                if isinstance(value, bool):
+                    kinds[name] = 'bool'
+                elif isinstance(value, int):
+                    kinds[name] = 'int'
+                elif isinstance(value, float):
+                    kinds[name] = 'float'
+                else:
+                    kinds[name] = 'string'
+    return tuple((name, kinds[name] or 'string') for name in names)
+
+
+def _columnValues(items, name, kind):
+    values = [item.get(name) for item in items]
+    if kind == 'datetime':
+        return [parseDate(v) for v in values]
+    if kind == 'string':
+        return [v if v is None or isinstance(v, str) else str(v) for v in values]
+    return values
+
+
+def _requireArrow():
+    if pyarrow is None:
+        raise HydroShareException("Arrow and Parquet export requires the pyarrow package.")
+
+
+def arrowSchema(columns):
+    _requireArrow()
+    types = {
+        'string': pyarrow.string(),
+        'bool': pyarrow.bool_(),
+        'int': pyarrow.int64(),
+        'float': pyarrow.float64(),
+        'datetime': pyarrow.timestamp('us', tz='UTC'),
+    }
+    return pyarrow.schema([(name, types[kind]) for (name, kind) in columns])
+
+
+def arrowBatch(items, columns, schema=None):
+    """ Convert one page of listing items (dicts or records) to a pyarrow.RecordBatch """
+    if schema is None:
+        schema = arrowSchema(columns)
+    arrays = [pyarrow.array(_columnValues(items, name, kind), type=schema.field(name).type)
+              for (name, kind) in columns]
+    return pyarrow.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def toArrow(pages, columns=None):
+    """ Build a pyarrow.Table from an iterable of pages (lists of listing items), one record batch per page.
+
+    :param pages: iterable of lists of dicts or records
+    :param columns: sequence of (name, kind) column specifications; inferred from the first page if None
+    """
+    _requireArrow()
+    batches = []
+    schema = None
+    for page in pages:
+        if schema is None:
+            columns = columns or inferColumns(page)
+            schema = arrowSchema(columns)
+        batches.append(arrowBatch(page, columns, schema))
+    if schema is None:
+        schema = arrowSchema(columns or ())
+    return pyarrow.Table.from_batches(batches, schema=schema)
+
+
+def toParquet(pages, path, columns=None, **kwargs):
+    """ Write an iterable of pages to a Parquet file one page at a time, holding a single page in memory.
+
+    :param pages: iterable of lists of dicts or records
+    :param path: Path (or writable file object) of the Parquet file
+    :param columns: sequence of (name, kind) column specifications; inferred from the first page if None
+    :param kwargs: further arguments of pyarrow.parquet.ParquetWriter, such as compression
+    :return: Number of rows written
+    """
+    _requireArrow()
+    pages = iter(pages)
+    first = next(pages, [])
+    columns = columns or inferColumns(first)
+    schema = arrowSchema(columns)
+    rows = 0
+    writer = pyarrow.parquet.ParquetWriter(path, schema, **kwargs)
+    try:
+        page = first
+        while page is not None:
+            if page:
+                writer.write_batch(arrowBatch(page, columns, schema))
+                rows += len(page)
+            page = next(pages, None)
+    finally:
+        writer.close()
+    return rows
+
+
+def numpyDtype(columns):
+    if numpy is None:
+        raise HydroShareException("NumPy export requires the numpy package.")
+    types = {
+        'string': object,
+        'bool': '?',
+        'int': 'i8',
+        'float': 'f8',
+        'datetime': 'datetime64[us]',
+    }
+    return numpy.dtype([(name, types[kind]) for (name, kind) in columns])
+
+
+def toNumpy(pages, columns=None):
+    """ Build a structured numpy.ndarray from an iterable of pages.
+
+        Strings are stored as Python objects.  Missing values become None for strings, False for booleans, 0 for
+        integers, NaN for floats and NaT for dates.
+
+    :param pages: iterable of lists of dicts or records
+    :param columns: sequence of (name, kind) column specifications; inferred from the first page if None
+    """
+    missing = {'string': None, 'bool': False, 'int': 0, 'float': float('nan'), 'datetime': None}
+    arrays = []
+    dtype = None
+    for page in pages:
+        if dtype is None:
+            columns = columns or inferColumns(page)
+            dtype = numpyDtype(columns)
+        array = numpy.empty(len(page), dtype=dtype)
+        for name, kind in columns:
+            values = _columnValues(page, name, kind)
+            array[name] = [missing[kind] if v is None else v for v in values]
+        arrays.append(array)
+    if dtype is None:
+        return numpy.empty(0, dtype=numpyDtype(columns or ()))
+    return numpy.concatenate(arrays)
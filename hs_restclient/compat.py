@@ -1,3 +1,4 @@
+import abc
 import sys
 
 _ver = sys.version_info
@@ -10,7 +11,20 @@ is_py3 = (_ver[0] == 3)
 
 if is_py2:
     from httplib import responses as http_responses
+    from urlparse import urlsplit, urlunsplit, parse_qsl, urljoin
+    from urllib import urlencode, unquote
+    import Queue as queue
+    intern = intern
+    # Atomic on POSIX; Python 2 on Windows cannot replace an existing file
+    from os import rename as replace
 
 elif is_py3:
     from http.client import responses as http_responses
+    from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode, unquote, urljoin
+    import queue
+    from sys import intern
+    from os import replace
     basestring = str
+
+#: Base class of abstract classes, on both Python 2 and 3
+ABC = abc.ABCMeta('ABC', (object,), {'__slots__': ()})
@@ -0,0 +1,268 @@
+"""
+
+Segmented and resumable downloads: fetching parts of a file with HTTP Range requests
+
+"""
+
+import os
+import re
+import json
+import threading
+
+from .batch import executeBatch
+from .chunks import readChunks, DEFAULT_MAX_CHUNK_SIZE
+from .compat import replace
+from .exceptions import HydroShareException, HydroShareHTTPException
+
+
+DEFAULT_SEGMENT_SIZE = 8 * 1024 * 1024
+
+PART_SUFFIX = '.part'
+
+_CONTENT_RANGE = re.compile(r'bytes (\d+)-(\d+)/(\d+|\*)$')
+
+
+class RangeNotSupported(Exception):
+    """ The server ignored a Range request; the file has to be downloaded as a single stream """
+
+
+class _PositionalWriter(object):
+    # os.pwrite lets every segment write at its own offset through one shared descriptor; where it is
+    # unavailable (Windows) writes are serialized around a seek
+    def __init__(self, fd):
+        self.fd = fd
+        self._lock = threading.Lock()
+
+    def write(self, data, offset):
+        if hasattr(os, 'pwrite'):
+            while data:
+                written = os.pwrite(self.fd, data, offset)
+                data = data[written:]
+                offset += written
+        else:
+            with self._lock:
+                os.lseek(self.fd, offset, os.SEEK_SET)
+                while data:
+                    data = data[os.write(self.fd, data):]
+
+
+def rangeLength(response):
+    """ Length of the file behind response if the server advertises byte ranges for it, otherwise None """
+    if response.status_code != 200 or response.headers.get('Accept-Ranges', '').lower() != 'bytes':
+        return None
+    length = response.headers.get('Content-Length')
+    return int(length) if length and length.isdigit() else None
+
+
+def segments(length, segment_size):
+    """ (start, end) byte positions, end inclusive, of the segments of a file of the given length """
+    return [(start, min(start + segment_size, length) - 1) for start in range(0, length, segment_size)]
+
+
+def _fetchSegment(hs, url, writer, start, end, length):
+    r = hs._request('GET', url, headers={'Range': 'bytes={0}-{1}'.format(start, end)}, stream=True)
+    try:
+        if r.status_code == 200:
+            raise RangeNotSupported()
+        if r.status_code != 206:
+            raise HydroShareHTTPException(r)
+        match = _CONTENT_RANGE.match(r.headers.get('Content-Range', ''))
+        if match is None or (int(match.group(1)), int(match.group(2))) != (start, end) \
+                or match.group(3) not in ('*', str(length)):
+            raise RangeNotSupported()
+
+        offset = start
+        for chunk in readChunks(r):
+            writer.write(chunk, offset)
+            offset += len(chunk)
+        if offset != end + 1:
+            raise HydroShareException("Segment {0}-{1} of {2} ended after {3} bytes.".format(start, end, url,
+                                                                                            offset - start))
+    finally:
+        r.close()
+    return end + 1 - start
+
+
+def segmentedDownload(hs, url, filepath, segment_size=DEFAULT_SEGMENT_SIZE, workers=4, pid=None, use_cache=True):
+    """ Download url to filepath in segments fetched concurrently.
+
+    A HEAD request checks that the server accepts byte ranges and gives the file's length; the destination
+    file is then preallocated and each segment written in place as it arrives.
+
+    :param hs: HydroShare object used to make requests
+    :param url: URL of the file
+    :param filepath: Path of the file to write
+    :param segment_size: Number of bytes requested per Range request
+    :param workers: Number of segments downloaded at once
+    :param pid: The HydroShare ID of the resource the file belongs to
+    :param use_cache: If False, send the HEAD request even if the file was recently found missing or forbidden
+        (see the negative_cache argument of HydroShare)
+    :return: True if the file was downloaded, False if the server does not support ranges for this file (or
+        it fits in a single segment) and it should be downloaded as a single stream instead.  Nothing is
+        written to filepath in that case.
+    :raises: HydroShareException (or the requests exception) of the first segment that failed; the partial
+        file is removed.
+    """
+    head = hs._request('HEAD', url, endpoint='file', pid=pid, use_cache=use_cache)
+    head.close()
+    length = rangeLength(head)
+    if length is None or length <= segment_size:
+        return False
+
+    hs._ensurePoolSize(workers)
+    fd = os.open(filepath, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0), 0o666)
+    complete = False
+    try:
+        os.ftruncate(fd, length)
+        writer = _PositionalWriter(fd)
+        calls = ((_fetchSegment, (hs, url, writer, start, end, length), {})
+                 for (start, end) in segments(length, segment_size))
+        for result in executeBatch(calls, max_workers=workers, ordered=False):
+            result.result()
+        complete = True
+    except RangeNotSupported:
+        return False
+    finally:
+        os.close(fd)
+        if not complete:
+            os.remove(filepath)
+    return True
+
+
+class PartialDownload(object):
+    """ The .part file of a download, and the sidecar (.part.json) recording the URL it comes from, the
+        expected size and the validator (ETag or Last-Modified) needed to resume it with an If-Range request.
+
+        :param filepath: Path the file is moved to once complete
+    """
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.part_path = filepath + PART_SUFFIX
+        self.sidecar_path = self.part_path + '.json'
+
+    def state(self, url):
+        """ The sidecar of a part of url that can be resumed, with the number of bytes already downloaded
+            added as 'size', or None
+        """
+        try:
+            with open(self.sidecar_path) as f:
+                state = json.load(f)
+            state['size'] = os.path.getsize(self.part_path)
+        except (EnvironmentError, ValueError):
+            return None
+        if state.get('url') != url or not (state.get('etag') or state.get('last_modified')):
+            return None
+        if state.get('length') is not None and state['size'] > state['length']:
+            return None
+        return state
+
+    def requestHeaders(self, state):
+        # Byte offsets are only meaningful for the unencoded body
+        headers = {'Accept-Encoding': 'identity'}
+        if state is not None and state['size']:
+            headers['Range'] = 'bytes={0}-'.format(state['size'])
+            headers['If-Range'] = state.get('etag') or state['last_modified']
+        return headers
+
+    def save(self, url, length, etag, last_modified):
+        state = {'url': url, 'length': length, 'etag': etag, 'last_modified': last_modified}
+        temporary = self.sidecar_path + '.tmp'
+        with open(temporary, 'w') as f:
+            json.dump(state, f)
+        replace(temporary, self.sidecar_path)
+
+    def finish(self, url, length):
+        """ Check the size of the part and move it to filepath """
+        size = os.path.getsize(self.part_path)
+        if length is not None and size != length:
+            if size > length:
+                self.remove()
+                raise HydroShareException("Download of {0} is {1} bytes long instead of {2}.".format(url, size,
+                                                                                                   length))
+            raise HydroShareException("Download of {0} ended after {1} of {2} bytes; {3} is kept to resume "
+                                      "from.".format(url, size, length, self.part_path))
+        replace(self.part_path, self.filepath)
+        self._removeSidecar()
+        return self.filepath
+
+    def _removeSidecar(self):
+        try:
+            os.remove(self.sidecar_path)
+        except OSError:
+            pass
+
+    def remove(self):
+        try:
+            os.remove(self.part_path)
+        except OSError:
+            pass
+        self._removeSidecar()
+
+
+def _resumedRange(response, url, state):
+    # (offset, length) the body of response starts at and the length of the whole file
+    if response.status_code == 206:
+        match = _CONTENT_RANGE.match(response.headers.get('Content-Range', ''))
+        if state is None or match is None or int(match.group(1)) != state['size']:
+            raise HydroShareException("Unexpected Content-Range {0!r} resuming {1}.".format(
+                response.headers.get('Content-Range'), url))
+        return state['size'], int(match.group(3)) if match.group(3) != '*' else state.get('length')
+    length = response.headers.get('Content-Length')
+    return 0, int(length) if length and length.isdigit() else None
+
+
+def _hashPart(fd, hasher, length):
+    # Pass the first length bytes already downloaded to hasher
+    buffer = memoryview(bytearray(min(length, DEFAULT_MAX_CHUNK_SIZE)))
+    while hasher.size < length:
+        n = fd.readinto(buffer[:min(len(buffer), length - hasher.size)])
+        if not n:
+            break
+        hasher.write(buffer[:n])
+
+
+def resumableDownload(get, url, filepath, chunk_size=None, hasher=None):
+    """ Download url to filepath through filepath.part, resuming what an interrupted earlier call left there.
+
+    Only the missing bytes are requested, with an If-Range request so that the server sends the whole file
+    again if it changed in the meantime.  A part is only resumed if the server sent an ETag or Last-Modified
+    header with it.  Once complete, the part's size is checked against the length the server announced and it
+    is renamed to filepath.
+
+    :param get: Callable sending the GET request for url with the headers it is given, returning a streamed
+        response with status 200 or 206 (or raising)
+    :param url: URL of the file, recorded in the sidecar to make sure a part is only resumed from its own URL
+    :param filepath: Path of the file to write
+    :param chunk_size: Number of bytes read from the response at a time, or None to follow the throughput (see
+        readChunks)
+    :param hasher: ChecksumWriter (without a file) to pass the content to as it is written, or None.  The bytes
+        of a resumed part are read back into it first.
+    :return: filepath
+    :raises: HydroShareException if the download ended early (the part is kept and the next call resumes it)
+        or produced more bytes than expected (the part is removed)
+    """
+    partial = PartialDownload(filepath)
+    state = partial.state(url)
+    if state is not None and state['size'] == state.get('length'):
+        if hasher is not None:
+            with open(partial.part_path, 'rb') as fd:
+                _hashPart(fd, hasher, state['length'])
+        return partial.finish(url, state['length'])
+
+    r = get(partial.requestHeaders(state))
+    try:
+        offset, length = _resumedRange(r, url, state)
+        partial.save(url, length, r.headers.get('ETag') or (state or {}).get('etag'),
+                     r.headers.get('Last-Modified') or (state or {}).get('last_modified'))
+        with open(partial.part_path, 'r+b' if offset else 'wb') as fd:
+            if hasher is not None:
+                _hashPart(fd, hasher, offset)
+            fd.seek(offset)
+            fd.truncate()
+            for chunk in readChunks(r, chunk_size):
+                fd.write(chunk)
+                if hasher is not None:
+                    hasher.write(chunk)
+    finally:
+        r.close()
+    return partial.finish(url, length)
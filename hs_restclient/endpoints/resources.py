@@ -1,9 +1,13 @@
 import json
 import os
 
-from requests_toolbelt import MultipartEncoder, MultipartEncoderMonitor
-
+from ..columnar import RESOURCE_COLUMNS
 from ..generators import resultsListGenerator
+from ..records import ResourceSummary
+
+
+# Keyword arguments of ResourceList that control how pages are fetched rather than filter results
+LIST_OPTIONS = ('prefetch', 'page_workers', 'ordered', 'cursor', 'stream_items', 'as_records')
 
 
 def default_progress_callback(monitor):
@@ -53,13 +57,17 @@ class FilesSubEndpoint(object):
         self.hs = hs
         self.pid = pid
 
-    def all(self):
+    def all(self, stream_items=False):
         """
+        :param stream_items: If True, return an iterator over the file objects of all pages, each decoded from
+            the response stream as it is consumed (requires the ijson package)
         :return:
             array of file objects (200 status code)
         """
         url = "{url_base}/resource/{pid}/files/".format(url_base=self.hs.url_base,
                                                                  pid=self.pid)
+        if stream_items:
+            return resultsListGenerator(self.hs, url, stream_items=True)
         r = self.hs._request('GET', url)
         return r
 
@@ -233,13 +241,15 @@ class ResourceEndpoint(BaseEndpoint):
         url = "{url_base}/resource/{pid}/files/".format(url_base=self.hs.url_base,
                                                        pid=self.pid)
 
-        encoder = MultipartEncoder({
-            "file": (payload['file'], open(payload['file'], 'r')),
-            "folder": payload['folder']
-        })
-        monitor = MultipartEncoderMonitor(encoder, default_progress_callback)
-
-        r = self.hs._request('POST', url, None, data=monitor, headers={'Content-Type': monitor.content_type})
+        params = {}
+        close_fd = self.hs._prepareFileForUpload(params, payload['file'], payload['file'], payload['folder'])
+        try:
+            # Built by the client so that a retried request sends the whole file again
+            body, headers, retryable = self.hs._multipartBody(params, None, False)
+            r = self.hs._request('POST', url, None, data=body, headers=headers, retryable=retryable)
+        finally:
+            if close_fd:
+                params['file'][1].close()
         return r.text
 
     def version(self):
@@ -324,12 +334,26 @@ class ResourceList(BaseEndpoint):
         :param south: Filter by south coordinate, float or char
         :param east: Filter by east coordinate, float or char
         :param west: Filter by west coordinate, float or char
+        :param prefetch: Number of pages to fetch ahead on a background thread while the current page is being
+            consumed.  0 (the default) fetches each page only when the previous one is exhausted.
+        :param page_workers: Number of threads fetching pages concurrently.  When greater than 0, the page count
+            is computed from the first page and all remaining pages are requested at once.
+        :param ordered: With page_workers, True (the default) yields resources in listing order, False as pages
+            arrive.
+        :param cursor: PaginationCursor (or its toDict()/toJSON() serialization) taken from the cursor attribute
+            of an earlier listing, to resume that listing where it stopped.  Filter arguments are restored from the
+            cursor.
+        :param stream_items: If True, decode each page incrementally as its resources are consumed, holding one
+            resource rather than one page in memory.  Requires the ijson package.
+        :param as_records: If True, yield compact ResourceSummary records (see hs_restclient.records) instead of
+            dicts, for holding large numbers of listed resources in memory.
 
         :raises: HydroShareHTTPException to signal an HTTP error
         :raises: HydroShareArgumentException for any invalid arguments
 
-        :return: A generator that can be used to fetch dict objects, each dict representing
-            the JSON object representation of the resource returned by the REST end point.  For example:
+        :return: An iterator (this ResourceList) that can be used to fetch dict objects, each dict representing
+            the JSON object representation of the resource returned by the REST end point, and whose toArrow,
+            toParquet and toNumpy methods export the listing.  For example:
 
         >>> for resource in hs.getResourceList():
         >>>>    print resource
@@ -381,6 +405,7 @@ class ResourceList(BaseEndpoint):
         """
         url = "{url_base}/resource/".format(url_base=self.hs.url_base)
 
+        options = dict((k, kwargs.pop(k)) for k in LIST_OPTIONS if k in kwargs)
         params = kwargs
         if 'from_date' in kwargs:
             params['from_date'] = kwargs['from_date'].strftime('%Y-%m-%d')
@@ -389,4 +414,50 @@ class ResourceList(BaseEndpoint):
         if 'types' in kwargs:
             params['type'] = kwargs.pop('types')
 
-        self.list = resultsListGenerator(self.hs, url, params)
\ No newline at end of file
+        if options.pop('as_records', False):
+            options['record_class'] = ResourceSummary
+        self.list = self._listGenerator(url, params, **options)
+
+    def _listGenerator(self, url, params, **options):
+        # Let the response cache see each resource's date_last_updated
+        observer = self.hs.cache.observe if self.hs.cache is not None else None
+        return resultsListGenerator(self.hs, url, params, columns=RESOURCE_COLUMNS, observer=observer, **options)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self.list)
+
+    next = __next__
+
+    @property
+    def cursor(self):
+        """ PaginationCursor to resume the listing from; see ResultsListIterator.cursor """
+        return self.list.cursor
+
+    def pages(self):
+        return self.list.pages()
+
+    def close(self):
+        self.list.close()
+
+    def toArrow(self):
+        """ Read the listing into a pyarrow.Table, one page (record batch) at a time, as in
+            hs.resources(...).toArrow().  Requires the pyarrow package.
+        """
+        return self.list.toArrow()
+
+    def toParquet(self, path, **kwargs):
+        """ Write the listing to a Parquet file one page at a time, with constant memory use.  Requires the
+            pyarrow package.
+
+        :param path: Path (or writable file object) of the Parquet file
+        :param kwargs: further arguments of pyarrow.parquet.ParquetWriter, such as compression
+        :return: Number of rows written
+        """
+        return self.list.toParquet(path, **kwargs)
+
+    def toNumpy(self):
+        """ Read the listing into a structured numpy.ndarray.  Requires the numpy package. """
+        return self.list.toNumpy()
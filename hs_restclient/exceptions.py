@@ -13,6 +13,24 @@ class HydroShareBagNotReadyException(HydroShareException):
         super(HydroShareBagNotReadyException, self).__init__(args)
 
 
+class HydroShareTaskTimeoutException(HydroShareException):
+    """ Exception raised when a HydroShare background task is not done by its deadline
+
+        Arguments in tuple passed to constructor must be: (task_id, timeout), timeout in seconds.
+    """
+    def __init__(self, args):
+        super(HydroShareTaskTimeoutException, self).__init__(args)
+        self.task_id = args[0]
+        self.timeout = args[1]
+
+    def __str__(self):
+        msg = "Task {task_id} was not done after {timeout} seconds."
+        return msg.format(task_id=self.task_id, timeout=self.timeout)
+
+    def __unicode__(self):
+        return str(self)
+
+
 class HydroShareNotAuthorized(HydroShareException):
     def __init__(self, args):
         super(HydroShareNotAuthorized, self).__init__(args)
@@ -75,6 +93,27 @@ class HydroShareHTTPException(HydroShareException):
         return str(self)
 
 
+class HydroShareChecksumException(HydroShareException):
+    """ Exception raised when downloaded content does not match its expected size or checksum
+
+        Arguments in tuple passed to constructor must be: (path, check, expected, actual), where check is
+        'size' or the name of the hash algorithm (e.g. 'md5', 'sha256').
+    """
+    def __init__(self, args):
+        super(HydroShareChecksumException, self).__init__(args)
+        self.path = args[0]
+        self.check = args[1]
+        self.expected = args[2]
+        self.actual = args[3]
+
+    def __str__(self):
+        msg = "{check} of {path} is {actual}, expected {expected}."
+        return msg.format(check=self.check, path=self.path, actual=self.actual, expected=self.expected)
+
+    def __unicode__(self):
+        return str(self)
+
+
 class HydroShareAuthenticationException(HydroShareException):
     def __init__(self, args):
         super(HydroShareArgumentException, self).__init__(args)
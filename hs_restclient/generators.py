@@ -1,8 +1,19 @@
-from .exceptions import HydroShareNotAuthorized, HydroShareNotFound, HydroShareHTTPException
+import json
+import math
+import threading
 
-def resultsListGenerator(hs, url, params=None):
-    # Get first (only?) page of results
-    r = hs._request('GET', url, params=params)
+from . import columnar
+from .batch import executeBatch
+from .compat import queue, urlsplit, urlunsplit, parse_qsl, urlencode
+from .exceptions import HydroShareNotAuthorized, HydroShareNotFound, HydroShareHTTPException, \
+    HydroShareArgumentException
+from .streaming import StreamedPage
+
+
+_END_OF_PAGES = object()
+
+
+def _checkPage(r, url):
     if r.status_code != 200:
         if r.status_code == 403:
             raise HydroShareNotAuthorized(('GET', url))
@@ -10,26 +21,355 @@ def resultsListGenerator(hs, url, params=None):
             raise HydroShareNotFound((url,))
         else:
             raise HydroShareHTTPException(r)
-    res = r.json()
-    results = res['results']
-    for item in results:
-        yield item
-
-    # Get remaining pages (if any exist)
-    while res['next']:
-        next_url = res['next']
-        if hs.use_https:
-            # Make sure the next URL uses HTTPS
-            next_url = next_url.replace('http://', 'https://', 1)
-        r = hs._request('GET', next_url, params=params)
-        if r.status_code != 200:
-            if r.status_code == 403:
-                raise HydroShareNotAuthorized(('GET', next_url))
-            elif r.status_code == 404:
-                raise HydroShareNotFound((next_url,))
-            else:
-                raise HydroShareHTTPException(r)
-        res = r.json()
-        results = res['results']
-        for item in results:
-            yield item
\ No newline at end of file
+
+
+def _getPage(hs, url, params=None):
+    r = hs._request('GET', url, params=params)
+    _checkPage(r, url)
+    return r.json()
+
+
+def _secureUrl(hs, next_url):
+    if next_url and hs.use_https:
+        # Make sure the next URL uses HTTPS
+        next_url = next_url.replace('http://', 'https://', 1)
+    return next_url
+
+
+def _nextUrl(hs, res):
+    return _secureUrl(hs, res['next'])
+
+
+def _pages(hs, url, params=None):
+    # Get first (only?) page of results, then remaining pages (if any exist)
+    while url:
+        res = _getPage(hs, url, params)
+        yield url, res
+        url = _nextUrl(hs, res)
+
+
+def _streamedPages(hs, url, params=None):
+    # Each page is a StreamedPage whose results are decoded as they are consumed; the URL of the
+    # following page is known once they have all been read
+    while url:
+        r = hs._request('GET', url, params=params, stream=True)
+        _checkPage(r, url)
+        page = StreamedPage(r)
+        yield url, page
+        url = _secureUrl(hs, page.next)
+
+
+def _prefetchedPages(hs, url, params, prefetch):
+    # Fetch pages on a background thread, at most `prefetch` pages ahead of the consumer
+    pages = queue.Queue(maxsize=prefetch)
+    stop = threading.Event()
+
+    def put(entry):
+        while not stop.is_set():
+            try:
+                pages.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def fetch():
+        try:
+            for page in _pages(hs, url, params):
+                if not put((page, None)):
+                    return
+            put((_END_OF_PAGES, None))
+        except Exception as e:
+            put((None, e))
+
+    thread = threading.Thread(target=fetch, name='hs_restclient-prefetch')
+    thread.daemon = True
+    thread.start()
+    try:
+        while True:
+            page, error = pages.get()
+            if error is not None:
+                raise error
+            if page is _END_OF_PAGES:
+                return
+            yield page
+    finally:
+        # Also reached when the consumer abandons the generator
+        stop.set()
+
+
+def _pageNumber(url):
+    for key, value in parse_qsl(urlsplit(url).query):
+        if key == 'page' and value.isdigit():
+            return int(value)
+    return None
+
+
+def _pageUrl(url, page):
+    parts = urlsplit(url)
+    query = [(k, v) for (k, v) in parse_qsl(parts.query, keep_blank_values=True) if k != 'page']
+    query.append(('page', str(page)))
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), parts.fragment))
+
+
+def _fanOutPages(hs, url, params, page_workers, ordered):
+    # The first page tells us the total count and the page size, from which the URLs of all
+    # remaining pages can be computed and fetched concurrently
+    first = _getPage(hs, url, params)
+    yield url, first
+
+    next_url = _nextUrl(hs, first)
+    next_page = _pageNumber(next_url) if next_url else None
+    page_size = len(first['results'])
+    if next_page is None or not page_size or 'count' not in first:
+        # Not page-number pagination; fall back to following 'next' links
+        if next_url:
+            for page in _pages(hs, next_url, params):
+                yield page
+        return
+
+    page_count = int(math.ceil(first['count'] / float(page_size)))
+    hs._ensurePoolSize(page_workers)
+    urls = [_pageUrl(next_url, page) for page in range(next_page, page_count + 1)]
+    calls = ((_getPage, (hs, page_url, params), {}) for page_url in urls)
+    for result in executeBatch(calls, max_workers=page_workers, ordered=ordered):
+        yield urls[result.index], result.result()
+
+
+def _observed(items, observer):
+    try:
+        for item in items:
+            observer([item])
+            yield item
+    finally:
+        items.close()
+
+
+class PaginationCursor(object):
+    """ Serializable position within a paginated listing: the URL and query parameters of the page being
+        read, and the number of items of that page already consumed.
+
+        >>> resources = hs.resources(owner='me')
+        >>> try:
+        >>>     for resource in resources:
+        >>>         harvest(resource)
+        >>> except HydroShareException:
+        >>>     saved = resources.cursor.toJSON()
+        >>> ...
+        >>> for resource in hs.resources(cursor=saved):
+        >>>     harvest(resource)
+    """
+    def __init__(self, url, params=None, offset=0):
+        self.url = url
+        self.params = dict(params) if params else {}
+        self.offset = offset
+
+    def toDict(self):
+        params = dict((k, list(v) if isinstance(v, (list, tuple, set)) else v) for (k, v) in self.params.items())
+        return {'url': self.url, 'params': params, 'offset': self.offset}
+
+    def toJSON(self):
+        return json.dumps(self.toDict())
+
+    @classmethod
+    def fromDict(cls, d):
+        return cls(d['url'], d.get('params'), d.get('offset', 0))
+
+    @classmethod
+    def fromJSON(cls, s):
+        return cls.fromDict(json.loads(s))
+
+    @classmethod
+    def load(cls, value):
+        """ Accept a PaginationCursor, or one serialized with toDict() or toJSON() """
+        if isinstance(value, cls):
+            return value
+        if isinstance(value, dict):
+            return cls.fromDict(value)
+        try:
+            return cls.fromJSON(value)
+        except (TypeError, ValueError, KeyError):
+            raise HydroShareArgumentException("Invalid pagination cursor {0!r}.".format(value))
+
+    def __repr__(self):
+        return "PaginationCursor(url={0!r}, params={1!r}, offset={2!r})".format(self.url, self.params,
+                                                                              self.offset)
+
+
+class ResultsListIterator(object):
+    """ Iterator over the items of a paginated listing that keeps track of its position; see
+        resultsListGenerator.
+    """
+    def __init__(self, hs, url, params=None, prefetch=0, page_workers=0, ordered=True, cursor=None,
+                 stream_items=False, record_class=None, columns=None, observer=None):
+        if stream_items and (prefetch or page_workers):
+            raise HydroShareArgumentException("stream_items cannot be combined with prefetch or page_workers.")
+        if cursor is not None:
+            cursor = PaginationCursor.load(cursor)
+            url, params, skip = cursor.url, cursor.params, cursor.offset
+        else:
+            skip = 0
+        self.hs = hs
+        self.url = url
+        self.params = params
+        self.prefetch = prefetch
+        self.page_workers = page_workers
+        self.ordered = ordered
+        self.stream_items = stream_items
+        self.record_class = record_class
+        self.columns = columns
+        self.observer = observer
+
+        self._source = None
+        self._items = iter(())
+        self._page_url = url
+        self._page_length = None
+        self._following = None
+        self._offset = skip
+        self._skip = skip
+        self._done = url is None
+
+    def _pageSource(self):
+        if self.stream_items:
+            return _streamedPages(self.hs, self.url, self.params)
+        if self.page_workers:
+            return _fanOutPages(self.hs, self.url, self.params, self.page_workers, self.ordered)
+        elif self.prefetch:
+            return _prefetchedPages(self.hs, self.url, self.params, self.prefetch)
+        return _pages(self.hs, self.url, self.params)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        while True:
+            try:
+                item = next(self._items)
+            except StopIteration:
+                self._nextPage()
+                continue
+            self._offset += 1
+            return self._record(item)
+
+    next = __next__
+
+    def _record(self, item):
+        if self.record_class is not None:
+            return self.record_class.fromDict(item, self.hs.url_base)
+        return item
+
+    def pages(self):
+        """ Generate the remaining items one page at a time, as lists """
+        while True:
+            page = [self._record(item) for item in self._items]
+            self._offset += len(page)
+            if page:
+                yield page
+            try:
+                self._nextPage()
+            except StopIteration:
+                return
+
+    def toArrow(self):
+        """ Read the remaining items into a pyarrow.Table, converting one page at a time to a record batch.
+            Dates are parsed to UTC timestamps.  Requires the pyarrow package.
+        """
+        return columnar.toArrow(self.pages(), self.columns)
+
+    def toParquet(self, path, **kwargs):
+        """ Write the remaining items to a Parquet file one page at a time, so that memory use does not grow
+            with the size of the listing.  Requires the pyarrow package.
+
+        :param path: Path (or writable file object) of the Parquet file
+        :param kwargs: further arguments of pyarrow.parquet.ParquetWriter, such as compression
+        :return: Number of rows written
+        """
+        return columnar.toParquet(self.pages(), path, self.columns, **kwargs)
+
+    def toNumpy(self):
+        """ Read the remaining items into a structured numpy.ndarray.  Requires the numpy package. """
+        return columnar.toNumpy(self.pages(), self.columns)
+
+    def _nextPage(self):
+        if self._done:
+            raise StopIteration
+        if self._source is None:
+            self._source = self._pageSource()
+        try:
+            page_url, res = next(self._source)
+        except StopIteration:
+            self._done = True
+            raise
+        # When resuming from a cursor, drop the items consumed before it was saved
+        if self.stream_items:
+            results = res.items()
+            if self.observer is not None:
+                results = _observed(results, self.observer)
+            for _ in range(self._skip):
+                next(results, None)
+            # Unknown until the page has been read to the end
+            self._page_length = self._following = None
+        else:
+            if self.observer is not None:
+                self.observer(res['results'])
+            results = iter(res['results'][self._skip:])
+            self._page_length = len(res['results'])
+            self._following = _nextUrl(self.hs, res)
+        if self._skip:
+            self._skip = 0
+        else:
+            self._offset = 0
+        self._page_url = page_url
+        self._items = results
+
+    @property
+    def cursor(self):
+        """ A PaginationCursor for the current position, None once the listing is exhausted (or when pages are
+            fetched out of order).  Resuming from it yields exactly the items not yet consumed.
+        """
+        if self._done or (self.page_workers and not self.ordered):
+            return None
+        if self._following and self._offset >= self._page_length:
+            # The current page is finished; resume at the start of the next one
+            return PaginationCursor(self._following, self.params, 0)
+        return PaginationCursor(self._page_url, self.params, self._offset)
+
+    def close(self):
+        if hasattr(self._items, 'close'):
+            # Releases the connection of a partly read streamed page
+            self._items.close()
+        if self._source is not None:
+            self._source.close()
+
+
+def resultsListGenerator(hs, url, params=None, prefetch=0, page_workers=0, ordered=True, cursor=None,
+                         stream_items=False, record_class=None, columns=None, observer=None):
+    """ Generate the items of a paginated HydroShare listing, fetching pages as needed.
+
+    :param hs: HydroShare object used to make requests
+    :param url: URL of the first page of the listing
+    :param params: dict of query parameters
+    :param prefetch: If greater than 0, pages are fetched on a background thread while the previous page is
+        being consumed, keeping at most this many pages buffered ahead of the consumer.
+    :param page_workers: If greater than 0, the first page is fetched, the number of pages is computed from its
+        'count', and the remaining pages are fetched concurrently by this many threads.  Takes precedence over
+        prefetch.  Items added or removed while the listing is being read may shift between pages.
+    :param ordered: When page_workers is used, True yields items in listing order, False yields each page's
+        items as soon as that page arrives.
+    :param cursor: PaginationCursor (or its toDict()/toJSON() serialization) to resume from, in place of url and
+        params.
+    :param stream_items: If True, each page is decoded incrementally from the response stream as its items are
+        consumed, so memory use is bounded by the size of one item rather than one page.  Requires the ijson
+        package; cannot be combined with prefetch or page_workers.
+    :param record_class: If given, a record type from hs_restclient.records (such as ResourceSummary) that items
+        are converted to instead of being yielded as dicts.
+    :param columns: (name, kind) column specifications used by the iterator's toArrow(), toParquet() and
+        toNumpy() methods, such as hs_restclient.columnar.RESOURCE_COLUMNS; inferred from the data if None.
+    :param observer: Callable passed the list of items of every page as it is read (one item at a time with
+        stream_items), such as ResponseCache.observe.
+
+    :return: A ResultsListIterator; its cursor attribute gives the position to resume from.
+    """
+    return ResultsListIterator(hs, url, params, prefetch=prefetch, page_workers=page_workers, ordered=ordered,
+                               cursor=cursor, stream_items=stream_items, record_class=record_class,
+                               columns=columns, observer=observer)
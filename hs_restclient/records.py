@@ -0,0 +1,208 @@
+"""
+
+Compact record types for the items of resource and file listings
+
+"""
+
+import re
+
+from .compat import intern
+
+
+def _intern(value):
+    # Only native strings can be interned under Python 2
+    if type(value) is str:
+        return intern(value)
+    return value
+
+
+class _DerivedUrl(object):
+    """ URL computed on access from a record's fields, unless the listing returned a different one """
+    def __init__(self, name, template):
+        self.name = name
+        self.template = template
+
+    def derive(self, record, site):
+        return self.template.format(site=site, record=record)
+
+    def __get__(self, record, owner):
+        if record is None:
+            return self
+        if record._overrides and self.name in record._overrides:
+            return record._overrides[self.name]
+        return self.derive(record, record._site)
+
+
+class _Record(object):
+    """ Base class of listing records.
+
+        Keys of the listing item named in FIELDS are kept in slots, with the values named in INTERNED shared
+        between records.  URLs that follow from the other fields are not stored at all but derived when read;
+        anything else the server returned is kept in a dict.  Records can be read like the dicts they replace:
+        record['resource_id'], record.get('creator') and record.toDict() all work.
+    """
+    __slots__ = ('_site', '_url_fields', '_overrides', '_extra')
+
+    FIELDS = ()
+    INTERNED = ()
+    URLS = ()
+
+    # Tuples of the URL keys present in a listing item, shared by records having the same keys
+    _url_field_tuples = {}
+
+    def __init__(self, **kwargs):
+        self._initialize(kwargs, None)
+
+    @classmethod
+    def fromDict(cls, d, url_base=None):
+        """ Build a record from a listing item.
+
+        :param d: dict decoded from the listing
+        :param url_base: URL base of the HydroShare object the listing came from (for example
+            https://www.hydroshare.org/hsapi), used to derive URLs when the item has none to infer the site from
+        """
+        record = cls.__new__(cls)
+        record._initialize(d, url_base)
+        return record
+
+    def _initialize(self, d, url_base):
+        fields = self.FIELDS
+        urls = dict((u.name, u) for u in self.URLS)
+        extra = None
+        present_urls = []
+        for key, value in d.items():
+            if key in fields:
+                setattr(self, key, _intern(value) if key in self.INTERNED else value)
+            elif key in urls:
+                present_urls.append(key)
+            else:
+                if extra is None:
+                    extra = {}
+                extra[key] = value
+        self._extra = extra
+        self._setDerivedKeys(d)
+
+        site = None
+        overrides = None
+        for key in present_urls:
+            url = d[key]
+            if site is None and url:
+                suffix = urls[key].derive(self, '')
+                if url.endswith(suffix):
+                    site = _intern(url[:len(url) - len(suffix)])
+                    continue
+            if site is None or url != urls[key].derive(self, site):
+                if overrides is None:
+                    overrides = {}
+                overrides[key] = url
+        if site is None and url_base:
+            site = _intern(url_base.rsplit('/hsapi', 1)[0])
+        self._site = site
+        self._overrides = overrides
+
+        key = tuple(sorted(present_urls))
+        self._url_fields = self._url_field_tuples.setdefault(key, key)
+
+    def _setDerivedKeys(self, d):
+        pass
+
+    def keys(self):
+        keys = [k for k in self.FIELDS if hasattr(self, k)]
+        keys.extend(self._url_fields)
+        if self._extra:
+            keys.extend(self._extra)
+        return keys
+
+    def __getitem__(self, key):
+        if key in self.FIELDS or key in self._url_fields:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key)
+        if self._extra and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __getattr__(self, name):
+        # Only reached for unset slots and keys the record has no slot for
+        if not name.startswith('_') and self._extra and name in self._extra:
+            return self._extra[name]
+        raise AttributeError(name)
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def toDict(self):
+        """ The listing item this record was built from, as a dict """
+        return dict((k, self[k]) for k in self.keys())
+
+    def __eq__(self, other):
+        if isinstance(other, (_Record, dict)):
+            return self.toDict() == (other if isinstance(other, dict) else other.toDict())
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    __hash__ = None
+
+    def __getstate__(self):
+        return self.toDict(), self._site
+
+    def __setstate__(self, state):
+        d, site = state
+        self._initialize(d, site + '/hsapi' if site else None)
+
+    def __repr__(self):
+        return "{0}({1!r})".format(type(self).__name__, self.toDict())
+
+
+class ResourceSummary(_Record):
+    """ A resource as returned by HydroShare.resources(..., as_records=True) """
+    FIELDS = ('resource_id', 'resource_title', 'resource_type', 'creator', 'author', 'date_created',
+              'date_last_updated', 'public', 'discoverable', 'shareable', 'immutable', 'published')
+    # Values shared by many resources; dates and titles are mostly unique and would only grow the intern table
+    INTERNED = ('resource_type', 'creator', 'author')
+    __slots__ = FIELDS
+
+    bag_url = _DerivedUrl('bag_url', '{site}/static/media/bags/{record.resource_id}.zip')
+    resource_url = _DerivedUrl('resource_url', '{site}/resource/{record.resource_id}/')
+    resource_map_url = _DerivedUrl('resource_map_url', '{site}/resource/{record.resource_id}/map/')
+    science_metadata_url = _DerivedUrl('science_metadata_url', '{site}/hsapi/scimeta/{record.resource_id}/')
+    URLS = (bag_url, resource_url, resource_map_url, science_metadata_url)
+
+
+_FILE_URL_PATTERN = re.compile(r'/django_irods/download/(?P<resource_id>[^/]+)/data/contents/(?P<file_path>.+)$')
+
+
+class ResourceFileInfo(_Record):
+    """ A file as returned by HydroShare.getResourceFileList(..., as_records=True).
+
+        resource_id and file_path (relative to the resource's data/contents folder) are parsed from the
+        file's url.
+    """
+    FIELDS = ('file_name', 'size', 'content_type', 'logical_type', 'modified_time', 'checksum')
+    INTERNED = ('content_type', 'logical_type')
+    __slots__ = FIELDS + ('resource_id', 'file_path')
+
+    url = _DerivedUrl('url', '{site}/django_irods/download/{record.resource_id}/data/contents/{record.file_path}')
+    URLS = (url,)
+
+    def _setDerivedKeys(self, d):
+        match = _FILE_URL_PATTERN.search(d.get('url') or '')
+        if match:
+            self.resource_id = _intern(match.group('resource_id'))
+            self.file_path = match.group('file_path')
+        else:
+            self.resource_id = self.file_path = None
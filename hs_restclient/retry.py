@@ -0,0 +1,94 @@
+"""
+
+Retry policy for requests made by the HydroShare client
+
+"""
+
+import time
+import random
+import calendar
+import email.utils
+
+
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'])
+
+RETRY_STATUSES = frozenset([429, 502, 503, 504])
+
+
+class RetryPolicy(object):
+    """ Decide whether and when to retry a failed request.
+
+        Connection errors and responses whose status is in retry_statuses are retried with exponential
+        backoff: attempt n (counting from 1) is followed by a delay of backoff_factor * 2 ** (n - 1) seconds,
+        capped at max_backoff and randomized by jitter.  A Retry-After header on the response is honoured
+        when it asks for a longer delay.  Retrying stops after max_attempts attempts, or when the next delay
+        would exceed time_budget seconds since the first attempt.
+
+        Only idempotent methods (GET, HEAD, OPTIONS, PUT, DELETE) are retried unless retry_non_idempotent is
+        True.  Individual calls such as HydroShare.createResource(..., retry=True) may also opt in.
+
+        :param max_attempts: Total number of attempts, including the first.  1 disables retries.
+        :param backoff_factor: Delay in seconds after the first failed attempt
+        :param max_backoff: Upper bound, in seconds, for the computed backoff of a single delay
+        :param jitter: Fraction (0 to 1) of each delay that is randomized, to spread out retries from many clients
+        :param time_budget: Maximum number of seconds to spend on a request across all attempts, or None
+        :param retry_statuses: HTTP status codes that trigger a retry
+        :param respect_retry_after: If True, wait at least as long as a Retry-After response header asks
+        :param retry_non_idempotent: If True, retry POST (and other non-idempotent) requests as well
+        :param sleep: Function used to wait between attempts
+    """
+    def __init__(self, max_attempts=3, backoff_factor=0.5, max_backoff=30, jitter=0.5, time_budget=120,
+                 retry_statuses=RETRY_STATUSES, respect_retry_after=True, retry_non_idempotent=False,
+                 sleep=time.sleep):
+        self.max_attempts = max_attempts
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.time_budget = time_budget
+        self.retry_statuses = frozenset(retry_statuses)
+        self.respect_retry_after = respect_retry_after
+        self.retry_non_idempotent = retry_non_idempotent
+        self.sleep = sleep
+
+    def isRetryable(self, method):
+        return method.upper() in IDEMPOTENT_METHODS or self.retry_non_idempotent
+
+    def backoff(self, attempt):
+        # The exponent is capped so that long runs of attempts cannot overflow the float conversion
+        delay = min(self.max_backoff, self.backoff_factor * (2 ** min(attempt - 1, 64)))
+        return delay * (1 - self.jitter) + random.uniform(0, delay * self.jitter)
+
+    def nextDelay(self, attempt, started, response=None):
+        """ Seconds to wait before the next attempt, or None if the request should not be retried.
+
+        :param attempt: Number of attempts made so far
+        :param started: time.time() of the first attempt
+        :param response: The response of the last attempt, or None if it failed to connect
+        """
+        if attempt >= self.max_attempts:
+            return None
+        if response is not None and response.status_code not in self.retry_statuses:
+            return None
+
+        delay = self.backoff(attempt)
+        if response is not None and self.respect_retry_after:
+            retry_after = parseRetryAfter(response.headers.get('Retry-After'))
+            if retry_after is not None:
+                delay = max(delay, retry_after)
+
+        if self.time_budget is not None and time.time() - started + delay > self.time_budget:
+            return None
+        return delay
+
+
+def parseRetryAfter(value):
+    """ Convert a Retry-After header (delay-seconds or HTTP-date) to seconds, or None if absent or invalid """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    parsed = email.utils.parsedate(value)
+    if parsed is None:
+        return None
+    return max(0.0, calendar.timegm(parsed) - time.time())
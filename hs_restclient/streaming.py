@@ -0,0 +1,76 @@
+"""
+
+Incremental decoding of paginated JSON listings, so that only one item of a page is held in memory at a time
+
+"""
+
+try:
+    import ijson
+    from ijson.common import ObjectBuilder
+except ImportError:
+    ijson = None
+
+from .exceptions import HydroShareException
+
+
+READ_CHUNK_SIZE = 64 * 1024
+
+
+class ResponseReader(object):
+    """ Minimal file-like object reading the (decompressed) body of a streamed requests response """
+    def __init__(self, response, chunk_size=READ_CHUNK_SIZE):
+        self._chunks = response.iter_content(chunk_size)
+        self._buffer = b''
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            try:
+                chunk = next(self._chunks)
+            except StopIteration:
+                break
+            self._buffer += chunk
+        if size < 0 or size >= len(self._buffer):
+            data, self._buffer = self._buffer, b''
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+class StreamedPage(object):
+    """ One page of a listing, decoded from the response as its results are iterated.
+
+        count and next are filled in as they are reached in the response body; both are known once items()
+        has been exhausted.
+
+        :param response: Streamed requests response (requested with stream=True) holding a page of the form
+            {"count": ..., "next": ..., "results": [...]}
+    """
+    def __init__(self, response):
+        if ijson is None:
+            raise HydroShareException("Streaming listings requires the ijson package.")
+        self.response = response
+        self.count = None
+        self.next = None
+
+    def items(self):
+        """ Generate the items of the page's 'results' array, one at a time """
+        builder = None
+        try:
+            for prefix, event, value in ijson.parse(ResponseReader(self.response), use_float=True):
+                if builder is not None:
+                    builder.event(event, value)
+                    if prefix == 'results.item' and event in ('end_map', 'end_array'):
+                        yield builder.value
+                        builder = None
+                elif prefix == 'results.item':
+                    if event in ('start_map', 'start_array'):
+                        builder = ObjectBuilder()
+                        builder.event(event, value)
+                    else:
+                        yield value
+                elif prefix == 'count' and event == 'number':
+                    self.count = value
+                elif prefix == 'next' and event in ('string', 'null'):
+                    self.next = value
+        finally:
+            self.response.close()
@@ -0,0 +1,130 @@
+"""
+
+Incremental mirroring of the files of a resource into a local directory
+
+"""
+
+import os
+import json
+
+from .compat import replace, unquote
+from .exceptions import HydroShareException
+
+
+INDEX_NAME = '.hs_sync.json'
+
+# Fields of a file listing that change when the file changes on HydroShare
+_REMOTE_FIELDS = ('size', 'checksum', 'modified_time')
+
+
+def listedPath(url):
+    """ Path of a listed file relative to its resource's data/contents folder, from the file's url """
+    url = unquote(url)
+    if '/data/contents/' not in url:
+        raise HydroShareException("Cannot find the path of {0} in its resource.".format(url))
+    return url.split('/data/contents/', 1)[1]
+
+
+def localPath(local_dir, path):
+    """ Path of the local copy of a file.
+
+    :raises: HydroShareException if the file would be written outside local_dir, or over its SyncIndex
+    """
+    parts = [p for p in path.split('/') if p not in ('', '.')]
+    if not parts or '..' in parts or os.path.splitdrive(parts[0])[0]:
+        raise HydroShareException("Refusing to write {0!r} outside of {1}.".format(path, local_dir))
+    if len(parts) == 1 and parts[0] in (INDEX_NAME, INDEX_NAME + '.tmp'):
+        raise HydroShareException("Refusing to write {0!r} over the sync index of {1}.".format(path, local_dir))
+    return os.path.join(local_dir, *parts)
+
+
+class SyncIndex(object):
+    """ State of a local mirror of a resource, kept in a hidden file of the mirror.
+
+        For every file it downloaded, the index remembers the size, checksum and modified time HydroShare listed
+        and the size and mtime of the local copy.  A file is current while both still match, so neither a
+        change on HydroShare nor a local edit goes unnoticed.
+
+        :param local_dir: Directory of the mirror
+        :param pid: The HydroShare ID of the mirrored resource.  An index left by another resource is ignored.
+    """
+    def __init__(self, local_dir, pid):
+        self.local_dir = local_dir
+        self.pid = pid
+        self.path = os.path.join(local_dir, INDEX_NAME)
+        self.files = {}
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+        except (IOError, OSError, ValueError):
+            return
+        if state.get('pid') == pid:
+            self.files = state.get('files', {})
+
+    def isCurrent(self, path, entry):
+        """ True if the local copy of path is the file listed in entry """
+        record = self.files.get(path)
+        if record is None:
+            return False
+        try:
+            stat = os.stat(localPath(self.local_dir, path))
+        except OSError:
+            return False
+        if (stat.st_size, stat.st_mtime) != (record['local_size'], record['local_mtime']):
+            return False
+        return all(entry.get(field) == record.get(field) for field in _REMOTE_FIELDS)
+
+    def record(self, path, entry):
+        """ Remember that the local copy of path was downloaded from entry """
+        stat = os.stat(localPath(self.local_dir, path))
+        record = dict((field, entry.get(field)) for field in _REMOTE_FIELDS)
+        record.update(local_size=stat.st_size, local_mtime=stat.st_mtime)
+        self.files[path] = record
+
+    def forget(self, path):
+        self.files.pop(path, None)
+
+    def save(self):
+        temporary = self.path + '.tmp'
+        with open(temporary, 'w') as f:
+            json.dump({'pid': self.pid, 'files': self.files}, f)
+        replace(temporary, self.path)
+
+
+class SyncSummary(object):
+    """ Outcome of HydroShare.syncResource.
+
+        downloaded, unchanged and deleted list the paths, relative to the resource's data/contents folder, of
+        the files downloaded, found current, and deleted locally because they are gone from HydroShare.  failed
+        holds the BatchResult of each download that failed, whose args are (path, listing entry).
+        bytes_downloaded is the listed size of the files downloaded, and bytes_saved that of the current files,
+        which downloading the whole resource again would have transferred.
+    """
+    def __init__(self):
+        self.downloaded = []
+        self.unchanged = []
+        self.deleted = []
+        self.failed = []
+        self.bytes_downloaded = 0
+        self.bytes_saved = 0
+
+    @property
+    def ok(self):
+        return not self.failed
+
+    def __repr__(self):
+        return ("SyncSummary(downloaded={0}, unchanged={1}, deleted={2}, failed={3}, bytes_downloaded={4}, "
+                "bytes_saved={5})").format(len(self.downloaded), len(self.unchanged), len(self.deleted),
+                                           len(self.failed), self.bytes_downloaded, self.bytes_saved)
+
+
+def removeLocalCopy(local_dir, path):
+    """ Delete the local copy of path, and the folders it leaves empty """
+    target = localPath(local_dir, path)
+    if os.path.exists(target):
+        os.remove(target)
+    parent = os.path.dirname(target)
+    while os.path.normpath(parent) != os.path.normpath(local_dir) and os.path.isdir(parent) \
+            and not os.listdir(parent):
+        os.rmdir(parent)
+        parent = os.path.dirname(parent)
@@ -0,0 +1,164 @@
+"""
+
+Waiting for HydroShare background tasks, such as bag creation, with exponential backoff and deadlines
+
+"""
+
+import time
+import heapq
+import itertools
+import threading
+from concurrent.futures import Future
+
+from .batch import executeBatch
+from .exceptions import HydroShareTaskTimeoutException
+
+
+DEFAULT_INITIAL_INTERVAL = 1
+
+DEFAULT_MAX_INTERVAL = 30
+
+DEFAULT_BACKOFF = 2
+
+DEFAULT_POLL_WORKERS = 4
+
+
+class _TrackedTask(object):
+    __slots__ = ('task_id', 'future', 'interval', 'deadline', 'timeout')
+
+    def __init__(self, task_id, future, interval, deadline, timeout):
+        self.task_id = task_id
+        self.future = future
+        self.interval = interval
+        self.deadline = deadline
+        self.timeout = timeout
+
+
+class TaskTracker(object):
+    """ Polls the status of any number of HydroShare tasks from one background thread.
+
+        Every tracked task gets a concurrent.futures.Future that resolves to True once the task is done.  A task
+        is first polled initial_interval seconds after it is tracked; every poll finding it still running
+        multiplies the interval by backoff, up to max_interval.  Tasks that are due together are polled
+        concurrently.  A task still running at its deadline fails with HydroShareTaskTimeoutException, and a
+        task whose status cannot be read fails with the exception raised.
+
+        >>> futures = [hs.tasks.track(task_id) for task_id in task_ids]
+        >>> concurrent.futures.wait(futures)
+
+        The background thread only runs while tasks are tracked.
+
+        :param hs: HydroShare object used to poll
+        :param initial_interval: Seconds before the first poll of a task
+        :param max_interval: Longest wait, in seconds, between two polls of a task
+        :param backoff: Factor the wait grows by after each poll
+        :param timeout: Default number of seconds a task may take, or None to wait without limit
+        :param poll_workers: Number of tasks polled at once
+    """
+    def __init__(self, hs, initial_interval=DEFAULT_INITIAL_INTERVAL, max_interval=DEFAULT_MAX_INTERVAL,
+                 backoff=DEFAULT_BACKOFF, timeout=None, poll_workers=DEFAULT_POLL_WORKERS):
+        self.hs = hs
+        self.initial_interval = initial_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.timeout = timeout
+        self.poll_workers = poll_workers
+        self._condition = threading.Condition()
+        # (time of the next poll, insertion order, task)
+        self._schedule = []
+        self._order = itertools.count()
+        self._thread = None
+
+    def track(self, task_id, callback=None, timeout=None):
+        """ Start waiting for a task.
+
+        :param task_id: ID of the task, as returned by the endpoint that started it
+        :param callback: Callable given the future once it is done, or None
+        :param timeout: Number of seconds the task may take; defaults to the tracker's timeout
+        :return: concurrent.futures.Future resolving to True when the task is done.  Cancelling it stops polling.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        now = time.time()
+        deadline = now + timeout if timeout is not None else None
+        task = _TrackedTask(task_id, Future(), self.initial_interval, deadline, timeout)
+        if callback is not None:
+            task.future.add_done_callback(callback)
+        with self._condition:
+            self._schedulePoll(task, now)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='hs_restclient-tasks')
+                self._thread.daemon = True
+                self._thread.start()
+            self._condition.notify()
+        return task.future
+
+    def wait(self, task_id, timeout=None):
+        """ Block until a task is done.
+
+        :raises: HydroShareTaskTimeoutException if the task is still running after timeout seconds
+        """
+        return self.track(task_id, timeout=timeout).result()
+
+    def pending(self):
+        """ Number of tasks being waited for """
+        with self._condition:
+            return len(self._schedule)
+
+    def _schedulePoll(self, task, now):
+        at = now + task.interval
+        if task.deadline is not None:
+            at = min(at, task.deadline)
+        heapq.heappush(self._schedule, (at, next(self._order), task))
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while True:
+                    if not self._schedule:
+                        self._thread = None
+                        return
+                    delay = self._schedule[0][0] - time.time()
+                    if delay <= 0:
+                        break
+                    self._condition.wait(delay)
+                now = time.time()
+                due = []
+                while self._schedule and self._schedule[0][0] <= now:
+                    task = heapq.heappop(self._schedule)[2]
+                    if not task.future.cancelled():
+                        due.append(task)
+            if due:
+                self._poll(due)
+
+    def _poll(self, tasks):
+        try:
+            calls = ((self.hs._getTaskStatus, (task.task_id,), {}) for task in tasks)
+            results = list(executeBatch(calls, max_workers=min(self.poll_workers, len(tasks))))
+        except Exception as e:
+            for task in tasks:
+                self._fail(task, e)
+            return
+
+        now = time.time()
+        finished = []
+        with self._condition:
+            for task, result in zip(tasks, results):
+                if not result.ok:
+                    finished.append((task, result.exception))
+                elif result.value:
+                    finished.append((task, None))
+                elif task.deadline is not None and now >= task.deadline:
+                    finished.append((task, HydroShareTaskTimeoutException((task.task_id, task.timeout))))
+                else:
+                    task.interval = min(task.interval * self.backoff, self.max_interval)
+                    self._schedulePoll(task, now)
+        # Callbacks run here, outside the lock, so they can track further tasks
+        for task, exception in finished:
+            if exception is not None:
+                self._fail(task, exception)
+            elif task.future.set_running_or_notify_cancel():
+                task.future.set_result(True)
+
+    def _fail(self, task, exception):
+        if task.future.set_running_or_notify_cancel():
+            task.future.set_exception(exception)
@@ -0,0 +1,330 @@
+"""
+
+Uploads of resource files: how their bytes are sent, and the progress of concurrent uploads
+
+"""
+
+import os
+import abc
+import json
+import base64
+import hashlib
+import threading
+
+import requests
+
+from .compat import ABC, replace, urljoin
+from .exceptions import HydroShareException, HydroShareArgumentException, HydroShareHTTPException, \
+    HydroShareNotAuthorized, HydroShareNotFound
+
+
+DEFAULT_PART_SIZE = 8 * 1024 * 1024
+
+DEFAULT_PART_ATTEMPTS = 5
+
+DEFAULT_JOURNAL_DIR = os.path.join(os.path.expanduser('~'), '.hs_restclient', 'uploads')
+
+TUS_VERSION = '1.0.0'
+
+
+def uploadSize(resource_file):
+    """ Number of bytes left to read from a path or seekable file-like object, or None if unknown """
+    if isinstance(resource_file, str):
+        try:
+            return os.path.getsize(resource_file)
+        except OSError:
+            return None
+    try:
+        position = resource_file.tell()
+        resource_file.seek(0, os.SEEK_END)
+        end = resource_file.tell()
+        resource_file.seek(position)
+        return end - position
+    except (AttributeError, IOError, OSError, ValueError):
+        return None
+
+
+def _uploadFile(resource_file):
+    # A path as a string, or the file-like object itself
+    if hasattr(resource_file, '__fspath__'):
+        return resource_file.__fspath__()
+    return resource_file
+
+
+def uploadItem(item):
+    """ (resource_file, folder, resource_filename) of an item of the files given to HydroShare.addResourceFiles
+
+    :raises: HydroShareArgumentException if item is neither a file nor a tuple of one to three values
+    """
+    resource_file = _uploadFile(item)
+    if isinstance(resource_file, str):
+        return resource_file, None, None
+    if hasattr(resource_file, 'read'):
+        name = getattr(resource_file, 'name', None)
+        return resource_file, None, os.path.basename(name) if isinstance(name, str) else None
+    if not isinstance(item, (tuple, list)) or not 1 <= len(item) <= 3:
+        raise HydroShareArgumentException("{0!r} is neither a file nor a (resource_file, folder[, "
+                                          "resource_filename]) tuple.".format(item))
+    item = tuple(item) + (None,) * (3 - len(item))
+    return (_uploadFile(item[0]),) + item[1:]
+
+
+class UploadProgress(object):
+    """ Progress of the files uploaded by one HydroShare.addResourceFiles call, passed to its progress_callback
+        after every update.
+
+        bytes_sent and total_bytes add up the multipart bodies of the uploads: a file's total is its size until
+        its upload starts, then the length of its body.  files_done and files_failed count finished uploads out of
+        files_total.  A retried upload starts its bytes over.
+
+        :param sizes: Size of each file, or None where unknown
+        :param callback: Callable given this object after every update, or None
+    """
+    def __init__(self, sizes, callback=None):
+        self._lock = threading.Lock()
+        self._sent = [0] * len(sizes)
+        self._lengths = [size or 0 for size in sizes]
+        self.callback = callback
+        self.files_total = len(sizes)
+        self.files_done = 0
+        self.files_failed = 0
+        self.bytes_sent = 0
+        self.total_bytes = sum(self._lengths)
+
+    def monitor(self, index):
+        """ progress_callback for addResourceFile, reporting the upload of file index """
+        def update(monitor):
+            with self._lock:
+                self.bytes_sent += monitor.bytes_read - self._sent[index]
+                self.total_bytes += monitor.len - self._lengths[index]
+                self._sent[index] = monitor.bytes_read
+                self._lengths[index] = monitor.len
+            self._notify()
+        return update
+
+    def finished(self, ok):
+        with self._lock:
+            if ok:
+                self.files_done += 1
+            else:
+                self.files_failed += 1
+        self._notify()
+
+    def _notify(self):
+        if self.callback is not None:
+            self.callback(self)
+
+    def __repr__(self):
+        return "UploadProgress(files={0}/{1}, failed={2}, bytes={3}/{4})".format(
+            self.files_done, self.files_total, self.files_failed, self.bytes_sent, self.total_bytes)
+
+
+class UploadStrategy(ABC):
+    """ How HydroShare.addResourceFile and createResource send the bytes of a file.
+
+        Subclasses implement upload(); HydroShare uses SinglePostUpload unless given another strategy, either as
+        its upload_strategy or for a single call.
+    """
+    @abc.abstractmethod
+    def upload(self, hs, pid, params, progress_callback=None, retry=False):
+        """ Add the file described by params to resource pid.
+
+        :param hs: HydroShare object to make requests with
+        :param pid: The HydroShare ID of the resource
+        :param params: dict holding 'file', a (file name, file object, MIME type) tuple, and 'folder', the folder of
+            the resource to add it to, along with any other form fields of the request
+        :param progress_callback: Callable given an object with bytes_read and len attributes as the upload
+            progresses, or None
+        :param retry: True if the upload may be retried according to hs.retry_policy
+        :return: Dictionary containing 'resource_id' and 'file_name', as returned by addResourceFile
+        """
+
+
+def checkUploadResponse(r, method, url, pid, status=201):
+    if r.status_code != status:
+        if r.status_code == 403:
+            raise HydroShareNotAuthorized((method, url))
+        elif r.status_code == 404:
+            raise HydroShareNotFound((pid,))
+        else:
+            raise HydroShareHTTPException(r)
+
+
+class SinglePostUpload(UploadStrategy):
+    """ Upload a file as a single multipart/form-data POST to the resource's files endpoint.  The default. """
+    def upload(self, hs, pid, params, progress_callback=None, retry=False):
+        url = "{url_base}/resource/{pid}/files/".format(url_base=hs.url_base, pid=pid)
+        body, headers, retryable = hs._multipartBody(params, progress_callback, retry)
+        r = hs._request('POST', url, data=body, headers=headers, retryable=retryable)
+        checkUploadResponse(r, 'POST', url, pid)
+        return r.json()
+
+
+class _PartProgress(object):
+    # Stands in for the MultipartEncoderMonitor given to the progress callbacks of single POST uploads
+    def __init__(self, length, callback):
+        self.len = length
+        self.bytes_read = 0
+        self.callback = callback
+
+    def update(self, offset):
+        self.bytes_read = offset
+        if self.callback is not None:
+            self.callback(self)
+
+
+class UploadJournal(object):
+    """ Progress of a chunked upload, kept in a small JSON file so that another process can resume it.
+
+        :param directory: Directory of the journal files
+        :param key: Identity of the upload, see ChunkedUpload.journalKey
+    """
+    def __init__(self, directory, key):
+        self.path = os.path.join(directory, key + '.json')
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def save(self, location, offset):
+        directory = os.path.dirname(self.path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        temporary = self.path + '.tmp'
+        with open(temporary, 'w') as f:
+            json.dump({'location': location, 'offset': offset}, f)
+        replace(temporary, self.path)
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class ChunkedUpload(UploadStrategy):
+    """ Upload a file in parts with the tus resumable upload protocol (https://tus.io/protocols/resumable-upload),
+        retrying only the parts that fail.
+
+        An upload is created with a POST to endpoint, giving the file's length, name and folder, and each part
+        is then sent with a PATCH at its offset.  A part that fails is retried, after asking the server (with a
+        HEAD) how much of it arrived, up to max_part_attempts times with the backoff of hs.retry_policy.
+
+        Uploads of files given by path are recorded in a journal in journal_dir as they progress.  Uploading the
+        same (unchanged) file to the same resource and folder again, e.g. from a new process after the previous
+        one died, resumes where the server says the upload stopped.
+
+        >>> hs = HydroShare(auth=auth, upload_strategy=ChunkedUpload(part_size=64 * 1024 * 1024))
+
+        :param part_size: Number of bytes sent per PATCH request
+        :param max_part_attempts: Number of attempts at sending a part before giving up; the journal is kept so that
+            a later call resumes
+        :param journal_dir: Directory of the journal files, or None to journal nothing
+        :param endpoint: URL the uploads are created at, formatted with url_base and pid.  The server must speak the
+            tus protocol with its creation extension there, adding the uploaded file to the resource once complete.
+    """
+    def __init__(self, part_size=DEFAULT_PART_SIZE, max_part_attempts=DEFAULT_PART_ATTEMPTS,
+                 journal_dir=DEFAULT_JOURNAL_DIR, endpoint='{url_base}/resource/{pid}/files/uploads/'):
+        self.part_size = part_size
+        self.max_part_attempts = max_part_attempts
+        self.journal_dir = journal_dir
+        self.endpoint = endpoint
+
+    def journalKey(self, url, params):
+        """ Identity of the upload of params to url, or None if its file cannot be recognized later """
+        fname, fd, mime_type = params['file']
+        path = getattr(fd, 'name', None)
+        if not isinstance(path, str) or not os.path.isfile(path):
+            return None
+        stat = os.stat(path)
+        identity = [url, os.path.abspath(path), stat.st_size, stat.st_mtime, fname, params.get('folder') or '']
+        return hashlib.sha1(json.dumps(identity).encode('utf-8')).hexdigest()
+
+    def upload(self, hs, pid, params, progress_callback=None, retry=False):
+        fname, fd, mime_type = params['file']
+        folder = params.get('folder') or ''
+        url = self.endpoint.format(url_base=hs.url_base, pid=pid)
+        length = uploadSize(fd)
+        if length is None:
+            raise HydroShareArgumentException("resource_file must be seekable for a chunked upload.")
+        start = fd.tell()
+
+        key = self.journalKey(url, params) if self.journal_dir else None
+        journal = UploadJournal(self.journal_dir, key) if key else None
+        state = journal.load() if journal else None
+        offset = self._offset(hs, state['location'], length) if state else None
+        if offset is not None:
+            location = state['location']
+        else:
+            location, offset = self._create(hs, url, pid, length, fname, folder, mime_type, retry), 0
+        if journal:
+            journal.save(location, offset)
+
+        progress = _PartProgress(length, progress_callback)
+        progress.update(offset)
+        r = None
+        while offset < length:
+            offset, r = self._sendPart(hs, pid, location, fd, start, offset, length)
+            progress.update(offset)
+            if journal:
+                journal.save(location, offset)
+        if journal:
+            journal.remove()
+
+        if r is not None and r.headers.get('Content-Type', '').startswith('application/json'):
+            return r.json()
+        return {'resource_id': pid, 'file_name': fname}
+
+    def _tusHeaders(self, **headers):
+        headers = dict((name.replace('_', '-'), value) for name, value in headers.items())
+        headers['Tus-Resumable'] = TUS_VERSION
+        return headers
+
+    def _create(self, hs, url, pid, length, fname, folder, mime_type, retry):
+        metadata = ','.join('{0} {1}'.format(name, base64.b64encode(value.encode('utf-8')).decode('ascii'))
+                            for name, value in (('filename', fname), ('folder', folder), ('filetype', mime_type)))
+        r = hs._request('POST', url, headers=self._tusHeaders(Upload_Length=str(length), Upload_Metadata=metadata),
+                        retryable=retry or None)
+        checkUploadResponse(r, 'POST', url, pid)
+        if 'Location' not in r.headers:
+            raise HydroShareException("The server did not give the location of the upload created at {0}.".format(url))
+        return urljoin(url, r.headers['Location'])
+
+    def _offset(self, hs, location, length):
+        # Number of bytes of the upload the server has, or None if it no longer knows the upload
+        r = hs._request('HEAD', location, headers=self._tusHeaders())
+        if r.status_code in (403, 404, 410):
+            return None
+        if r.status_code not in (200, 204):
+            raise HydroShareHTTPException(r)
+        if r.headers.get('Upload-Length') not in (None, str(length)):
+            return None
+        return int(r.headers['Upload-Offset'])
+
+    def _sendPart(self, hs, pid, location, fd, start, offset, length):
+        policy = hs.retry_policy
+        attempt = 1
+        while True:
+            fd.seek(start + offset)
+            data = fd.read(min(self.part_size, length - offset))
+            headers = self._tusHeaders(Upload_Offset=str(offset), Content_Type='application/offset+octet-stream')
+            try:
+                r = hs._request('PATCH', location, data=data, headers=headers, retryable=False)
+            except requests.ConnectionError:
+                if attempt >= self.max_part_attempts:
+                    raise
+            else:
+                if r.status_code in (200, 204):
+                    # The request completing the upload may answer with the added file instead
+                    return int(r.headers.get('Upload-Offset', offset + len(data))), r
+                # 409 Conflict: the server has a different offset, to be asked for below
+                if attempt >= self.max_part_attempts or (r.status_code != 409
+                                                         and r.status_code not in policy.retry_statuses):
+                    checkUploadResponse(r, 'PATCH', location, pid, status=204)
+            policy.sleep(policy.backoff(attempt))
+            attempt += 1
+            # Whatever part of the failed request the server kept need not be sent again
+            offset = self._offset(hs, location, length)
+            if offset is None:
+                raise HydroShareException("The upload at {0} is no longer known to the server.".format(location))
@@ -64,7 +64,8 @@ setup(
     # requirements files see:
     # https://packaging.python.org/en/latest/requirements.html
     install_requires=['requests', 'requests_toolbelt',
-                      'oauthlib', 'requests_oauthlib'],
+                      'oauthlib', 'requests_oauthlib',
+                      'futures; python_version < "3"'],
 
     # List additional groups of dependencies here (e.g. development
     # dependencies). You can install these using the following syntax,
@@ -73,6 +74,9 @@ setup(
     extras_require={
         'dev': ['check-manifest'],
         'test': ['httmock'],
+        'async': ['aiohttp'],
+        'streaming': ['ijson'],
+        'columnar': ['pyarrow', 'numpy'],
     },
 
     # If there are data files included in your packages that need to be
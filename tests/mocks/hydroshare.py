@@ -5,6 +5,9 @@ Adapted from: http://www.appneta.com/blog/python-unit-test-mock/
 
 """
 import os
+import json
+import time
+import threading
 from urllib.parse import parse_qs
 
 from httmock import response, urlmatch
@@ -454,3 +457,107 @@ def resourceUpdateReferenceURL_post(url, request):
 @urlmatch(netloc=NETLOC, method=POST)
 def resourceCreateReferenceURL_post(url, request):
     return response(200, '{"status": "success"}', HEADERS, None, 5, request)
+
+@urlmatch(netloc=NETLOC, method=GET)
+def resourceSysmeta_get(url, request):
+    # Serves system metadata for any resource with a fixture, 404 otherwise
+    pid = url.path.strip('/').split('/')[-2]
+    file_path = url.netloc + url.path + pid
+    try:
+        content = Resource(file_path).get()
+    except EnvironmentError:
+        return response(404, {}, HEADERS, None, 5, request)
+    return response(200, content, HEADERS, None, 5, request)
+
+
+def status_response(status_code, headers=None):
+    """ Handler answering every request with an empty response of the given status """
+    @urlmatch(netloc=NETLOC)
+    def handler(url, request):
+        return response(status_code, b'', headers or {}, None, 5, request)
+    return handler
+
+
+def sequence(*handlers):
+    """ Handler delegating each successive request to the next of handlers; the last one repeats.
+    The requests seen are recorded in the handler's 'requests' attribute.
+    """
+    requests = []
+
+    @urlmatch(netloc=NETLOC)
+    def handler(url, request):
+        requests.append(request)
+        return handlers[min(len(requests), len(handlers)) - 1](url, request)
+    handler.requests = requests
+    return handler
+
+
+def paged_listing(path, count, page_size, delay=0, updated=None):
+    """ Handler serving a synthetic listing of count resources at path, page_size per page.
+    The handler's 'pages' attribute records the page numbers requested and 'max_in_flight'
+    the largest number of requests handled at once.  updated maps resource numbers to a
+    date_last_updated overriding the generated one.
+    """
+    lock = threading.Lock()
+    state = {'in_flight': 0}
+
+    @urlmatch(netloc=NETLOC, path=path, method=GET)
+    def handler(url, request):
+        query = parse_qs(url.query)
+        page = int(query.get('page', ['1'])[0])
+        with lock:
+            handler.pages.append(page)
+            state['in_flight'] += 1
+            handler.max_in_flight = max(handler.max_in_flight, state['in_flight'])
+        time.sleep(delay)
+        start = (page - 1) * page_size
+        results = [{'resource_id': '{0:032x}'.format(i),
+                    'resource_title': 'Resource {0}'.format(i),
+                    'resource_type': 'CompositeResource',
+                    'date_last_updated': (updated or {}).get(i, '2015-05-{0:02d}T12:00:00Z'.format(1 + i % 28))}
+                   for i in range(start, min(start + page_size, count))]
+        next_url = None
+        if start + page_size < count:
+            next_url = 'http://www.hydroshare.org{0}?page={1}'.format(path, page + 1)
+        content = json.dumps({'count': count, 'next': next_url, 'previous': None, 'results': results})
+        with lock:
+            state['in_flight'] -= 1
+        return response(200, content, HEADERS, None, 5, request)
+    handler.pages = []
+    handler.max_in_flight = 0
+    return handler
+
+
+def revalidating(handler, etag='"v1"'):
+    """ Wrap handler to tag its 200 responses with an ETag (the handler's 'etag' attribute, which
+    tests may change) and answer 304 to requests whose If-None-Match matches it.  The statuses
+    returned are recorded in the 'statuses' attribute.
+    """
+    @urlmatch(netloc=NETLOC)
+    def wrapper(url, request):
+        if request.headers.get('If-None-Match') == wrapper.etag:
+            wrapper.statuses.append(304)
+            return response(304, b'', {'ETag': wrapper.etag}, None, 5, request)
+        r = handler(url, request)
+        if r is None:
+            return None
+        if r.status_code == 200:
+            r.headers['ETag'] = wrapper.etag
+        wrapper.statuses.append(r.status_code)
+        return r
+    wrapper.etag = etag
+    wrapper.statuses = []
+    return wrapper
+
+
+def scimeta_elements():
+    """ Handler serving minimal science metadata for any resource; the pids requested are
+    recorded in the handler's 'pids' attribute.
+    """
+    @urlmatch(netloc=NETLOC, path=r'^/hsapi/resource/[0-9a-f]{32}/scimeta/elements$', method=GET)
+    def handler(url, request):
+        pid = url.path.split('/')[3]
+        handler.pids.append(pid)
+        return response(200, json.dumps({'title': 'Resource {0}'.format(pid)}), HEADERS, None, 5, request)
+    handler.pids = []
+    return handler
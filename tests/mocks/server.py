@@ -0,0 +1,114 @@
+"""
+A small stand-in HydroShare server for tests that need a real socket (e.g. the
+asyncio client, connection pooling, ranged downloads), where patching
+requests with httmock is not enough.
+
+Handlers are registered per (method, path) and receive a Request object; they
+return a (status, headers, body) tuple.
+"""
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+
+class Request:
+    """ A request received by the stand-in server.
+    """
+
+    def __init__(self, method, path, query, headers, body):
+        self.method = method
+        self.path = path
+        self.query = query
+        self.headers = headers
+        self.body = body
+
+
+def json_response(content, status=200):
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    return status, {'Content-Type': 'application/json'}, content
+
+
+def file_response(request, data, content_type='application/octet-stream', ranges=True, etag=None):
+    """ Serve data, honouring a single 'bytes=start-end' Range header when ranges is True.
+    """
+    headers = {'Content-Type': content_type}
+    if etag:
+        headers['ETag'] = etag
+    if not ranges:
+        return 200, headers, data
+    headers['Accept-Ranges'] = 'bytes'
+    range_header = request.headers.get('Range')
+    if_range = request.headers.get('If-Range')
+    if range_header and (if_range is None or if_range == etag):
+        match = re.match(r'bytes=(\d*)-(\d*)$', range_header)
+        start = int(match.group(1) or 0)
+        end = int(match.group(2)) if match.group(2) else len(data) - 1
+        end = min(end, len(data) - 1)
+        if start > end:
+            headers['Content-Range'] = 'bytes */{0}'.format(len(data))
+            return 416, headers, b''
+        headers['Content-Range'] = 'bytes {0}-{1}/{2}'.format(start, end, len(data))
+        return 206, headers, data[start:end + 1]
+    return 200, headers, data
+
+
+class StandInServer:
+    """ Threaded HTTP/1.1 server bound to an ephemeral port on localhost.
+    """
+
+    def __init__(self):
+        self.handlers = {}
+        self.requests = []
+        self.connections = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                BaseHTTPRequestHandler.setup(self)
+                server.connections += 1
+
+            def log_message(self, *args):
+                pass
+
+            def _handle(self):
+                parts = urlsplit(self.path)
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                request = Request(self.command, parts.path, parse_qs(parts.query),
+                                  self.headers, body)
+                server.requests.append(request)
+                handler = server.handlers.get((self.command, parts.path))
+                if handler is None:
+                    status, headers, content = 404, {}, b''
+                else:
+                    status, headers, content = handler(request)
+                self.send_response(status)
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                if self.command != 'HEAD':
+                    self.wfile.write(content)
+
+            do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = do_HEAD = _handle
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.daemon_threads = True
+        self.port = self.httpd.server_address[1]
+        self.url_base = 'http://127.0.0.1:{0}/hsapi'.format(self.port)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, args=(0.05,), daemon=True)
+
+    def add(self, method, path, handler):
+        self.handlers[(method, path)] = handler
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -15,13 +15,46 @@ import shutil
 from zipfile import ZipFile
 import filecmp
 import json
-
+import multiprocessing
+import pickle
+import asyncio
+import time
+import io
+import pathlib
+import hashlib
+import base64
+import re
+import gzip
+import socket
+import threading
+
+import requests
 from httmock import with_httmock, HTTMock
 
 import mocks.hydroshare
+import mocks.server
 
 sys.path.append('../')
 from hs_restclient import HydroShare, HydroShareAuthBasic
+from hs_restclient import aio
+from hs_restclient.exceptions import HydroShareException, HydroShareNotFound, HydroShareNotAuthorized, \
+    HydroShareHTTPException, HydroShareArgumentException, HydroShareBagNotReadyException, \
+    HydroShareTaskTimeoutException
+from hs_restclient.retry import RetryPolicy, parseRetryAfter
+from hs_restclient.generators import PaginationCursor
+from hs_restclient import streaming
+from hs_restclient.records import ResourceSummary, ResourceFileInfo
+from hs_restclient import columnar
+from hs_restclient.endpoints.resources import ResourceEndpoint, ResourceList
+from hs_restclient.cache import ResponseCache, DiskResponseCache, CacheEntry, NegativeCache, FileCache
+from hs_restclient.downloads import PartialDownload, resumableDownload
+from hs_restclient.checksums import parseManifest, ChecksumWriter
+from hs_restclient import bags
+from hs_restclient.tasks import TaskTracker
+from hs_restclient.chunks import AdaptiveChunkSize, readChunks
+from hs_restclient.sync import INDEX_NAME
+from hs_restclient.uploads import UploadStrategy, ChunkedUpload, SinglePostUpload
+from hs_restclient.exceptions import HydroShareChecksumException
 
 
 class TestGetResourceTypes(unittest.TestCase):
@@ -489,5 +522,1906 @@ class TestReferencedFile(unittest.TestCase):
 
         self.assertEqual(response['status'], 'success')
 
+
+class TestBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.res_id = '511debf8858a4ea081f78d66870da76c'
+        self.missing = ['{0:032x}'.format(i) for i in range(10)]
+
+    @with_httmock(mocks.hydroshare.resourceSysmeta_get)
+    def test_map_ordered(self):
+        hs = HydroShare(prompt_auth=False)
+        pids = [self.res_id] + self.missing + [self.res_id]
+        results = list(hs.map('getSystemMetadata', pids, max_workers=4))
+
+        self.assertEqual([r.args[0] for r in results], pids)
+        self.assertTrue(results[0].ok)
+        self.assertEqual(results[0].value['resource_id'], self.res_id)
+        self.assertEqual(results[-1].result()['resource_id'], self.res_id)
+        for r in results[1:-1]:
+            self.assertIsInstance(r.exception, HydroShareNotFound)
+            self.assertRaises(HydroShareNotFound, r.result)
+
+    @with_httmock(mocks.hydroshare.resourceSysmeta_get)
+    def test_batch_unordered(self):
+        hs = HydroShare(prompt_auth=False)
+        calls = [('getSystemMetadata', (pid,)) for pid in self.missing]
+        calls.append((hs.getSystemMetadata, (), {'pid': self.res_id}))
+        results = list(hs.batch(calls, max_workers=16, ordered=False))
+
+        self.assertEqual(sorted(r.index for r in results), list(range(len(calls))))
+        self.assertEqual(len([r for r in results if r.ok]), 1)
+        self.assertGreaterEqual(hs.session.get_adapter(hs.url_base)._pool_maxsize, 16)
+
+    def test_programming_errors_propagate(self):
+        hs = HydroShare(prompt_auth=False)
+
+        def broken(pid):
+            raise ValueError(pid)
+        self.assertRaises(ValueError, list, hs.map(broken, ['a', 'b']))
+
+
+class TestConnectionPool(unittest.TestCase):
+
+    def setUp(self):
+        self.res_id = '511debf8858a4ea081f78d66870da76c'
+        sysmeta_path = 'www.hydroshare.org/hsapi/resource/{0}/sysmeta/{0}'.format(self.res_id)
+        with open(sysmeta_path, 'rb') as f:
+            content = f.read()
+        self.server = mocks.server.StandInServer()
+        self.server.add('GET', '/hsapi/resource/{0}/sysmeta/'.format(self.res_id),
+                        lambda r: mocks.server.json_response(content))
+        self.server.start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def _client(self, **kwargs):
+        return HydroShare(hostname='127.0.0.1', port=self.server.port, use_https=False, prompt_auth=False,
+                          **kwargs)
+
+    def test_connections_reused(self):
+        hs = self._client(pool_connections=2, pool_maxsize=4, pool_block=True)
+        adapter = hs.session.get_adapter(hs.url_base)
+        self.assertEqual(adapter._pool_maxsize, 4)
+        self.assertTrue(adapter._pool_block)
+
+        for i in range(5):
+            hs.getSystemMetadata(self.res_id)
+        stats = hs.getPoolStatistics()
+        self.assertEqual(stats['requests'], 5)
+        self.assertEqual(stats['connections_created'], 1)
+        self.assertEqual(stats['connections_reused'], 4)
+        self.assertEqual(self.server.connections, 1)
+
+    def test_growing_pool_closes_replaced_adapter(self):
+        hs = self._client(pool_maxsize=2)
+        hs.getSystemMetadata(self.res_id)
+        replaced = hs.session.get_adapter(hs.url_base)
+        self.assertEqual(len(replaced.poolmanager.pools), 1)
+        list(hs.map(hs.getSystemMetadata, [self.res_id] * 8, max_workers=8))
+        adapter = hs.session.get_adapter(hs.url_base)
+        self.assertIsNot(adapter, replaced)
+        self.assertEqual(adapter._pool_maxsize, 8)
+        self.assertEqual(len(replaced.poolmanager.pools), 0)
+
+    def test_blocking_pool_keeps_maxsize(self):
+        hs = self._client(pool_maxsize=2, pool_block=True)
+        adapter = hs.session.get_adapter(hs.url_base)
+        results = list(hs.map(hs.getSystemMetadata, [self.res_id] * 8, max_workers=8))
+        self.assertTrue(all(r.ok for r in results))
+        self.assertIs(hs.session.get_adapter(hs.url_base), adapter)
+        self.assertEqual(adapter._pool_maxsize, 2)
+        self.assertLessEqual(self.server.connections, 2)
+
+    def test_keep_alive_disabled(self):
+        hs = self._client(keep_alive=False)
+        for i in range(3):
+            hs.getSystemMetadata(self.res_id)
+        stats = hs.getPoolStatistics()
+        self.assertEqual(stats['connections_created'], 3)
+        self.assertEqual(stats['connections_reused'], 0)
+
+    def test_statistics_survive_session_reset(self):
+        hs = self._client()
+        hs.getSystemMetadata(self.res_id)
+        hs._resetSession(hs.session)
+        hs.getSystemMetadata(self.res_id)
+        self.assertEqual(hs.getPoolStatistics()['requests'], 2)
+
+
+class TestRetryPolicy(unittest.TestCase):
+
+    def setUp(self):
+        self.res_id = '511debf8858a4ea081f78d66870da76c'
+        self.delays = []
+        self.policy = RetryPolicy(max_attempts=4, backoff_factor=1, jitter=0, sleep=self.delays.append)
+
+    def test_retry_after_honoured(self):
+        handler = mocks.hydroshare.sequence(mocks.hydroshare.status_response(503, {'Retry-After': '7'}),
+                                            mocks.hydroshare.status_response(429),
+                                            mocks.hydroshare.resourceSysmeta_get)
+        hs = HydroShare(prompt_auth=False, retry_policy=self.policy)
+        with HTTMock(handler):
+            sysmeta = hs.getSystemMetadata(self.res_id)
+        self.assertEqual(sysmeta['resource_id'], self.res_id)
+        self.assertEqual(self.delays, [7, 2])
+
+    def test_gives_up_after_max_attempts(self):
+        hs = HydroShare(prompt_auth=False, retry_policy=self.policy)
+        handler = mocks.hydroshare.sequence(mocks.hydroshare.status_response(502))
+        with HTTMock(handler):
+            self.assertRaises(HydroShareHTTPException, hs.getSystemMetadata, self.res_id)
+        self.assertEqual(len(handler.requests), 4)
+        self.assertEqual(self.delays, [1, 2, 4])
+
+    def test_time_budget(self):
+        self.policy.time_budget = 5
+        hs = HydroShare(prompt_auth=False, retry_policy=self.policy)
+        handler = mocks.hydroshare.sequence(mocks.hydroshare.status_response(503, {'Retry-After': '60'}))
+        with HTTMock(handler):
+            self.assertRaises(HydroShareHTTPException, hs.getSystemMetadata, self.res_id)
+        self.assertEqual(len(handler.requests), 1)
+
+    def test_post_retried_only_when_opted_in(self):
+        hs = HydroShare(prompt_auth=False, retry_policy=self.policy)
+        fpath = 'mocks/data/another_resource_file.txt'
+        handler = mocks.hydroshare.sequence(mocks.hydroshare.status_response(503),
+                                            mocks.hydroshare.resourceFileCRUD)
+        with HTTMock(handler):
+            self.assertRaises(HydroShareHTTPException, hs.addResourceFile, self.res_id, fpath)
+        self.assertEqual(len(handler.requests), 1)
+
+        handler = mocks.hydroshare.sequence(mocks.hydroshare.status_response(503),
+                                            mocks.hydroshare.resourceFileCRUD)
+        with HTTMock(handler):
+            resp = hs.addResourceFile(self.res_id, fpath, retry=True)
+        self.assertEqual(resp['resource_id'], self.res_id)
+        self.assertEqual(len(handler.requests), 2)
+        # The multipart body was rebuilt for the second attempt
+        first, second = handler.requests
+        self.assertIsNot(first.body, second.body)
+        self.assertEqual(first.body.len, second.body.len)
+        self.assertEqual(first.headers['Content-Type'], second.headers['Content-Type'])
+
+    def test_streamed_post_retried_whole(self):
+        self.policy.retry_non_idempotent = True
+        hs = HydroShare(prompt_auth=False, retry_policy=self.policy)
+        handler = mocks.hydroshare.sequence(mocks.hydroshare.status_response(503),
+                                            mocks.hydroshare.resourceFileCRUD)
+        with HTTMock(handler):
+            # Reached through the class, as the files sub-endpoint shadows the method on instances
+            ResourceEndpoint.files(hs.resource(self.res_id), {'file': 'mocks/data/another_resource_file.txt',
+                                                              'folder': 'target'})
+        first, second = handler.requests
+        self.assertIsNot(first.body, second.body)
+        self.assertEqual(first.body.len, second.body.len)
+
+        # A stream given as is cannot be sent twice, so it is not retried
+        handler = mocks.hydroshare.sequence(mocks.hydroshare.status_response(503),
+                                            mocks.hydroshare.resourceFileCRUD)
+        url = '{0}/resource/{1}/files/'.format(hs.url_base, self.res_id)
+        with HTTMock(handler):
+            r = hs._request('POST', url, data=io.BytesIO(b'data'))
+        self.assertEqual(r.status_code, 503)
+        self.assertEqual(len(handler.requests), 1)
+
+    def test_backoff_of_late_attempts(self):
+        self.policy.max_backoff = 30
+        self.assertEqual(self.policy.backoff(2000), 30)
+
+    def test_parse_retry_after(self):
+        self.assertEqual(parseRetryAfter('120'), 120)
+        self.assertEqual(parseRetryAfter('Wed, 21 Oct 2015 07:28:00 GMT'), 0)
+        self.assertIsNone(parseRetryAfter('soon'))
+        self.assertIsNone(parseRetryAfter(None))
+
+
+class TestResultsListPrefetch(unittest.TestCase):
+
+    def setUp(self):
+        self.resource_ids = ['c165b6f8ec64405da004bfb8890c35ae',
+                             '1a63d6c24b9b4b42b9a97abfab94f9c6',
+                             '5a6e5a992b1046ae820fd3e79ee36107',
+                             'c817e936ac1147639787c0d4688d6319',
+                             '408acb6b870d4297b8b036edcd9c3c58']
+
+    def test_prefetch_resources(self):
+        hs = HydroShare(prompt_auth=False)
+        handler = mocks.hydroshare.sequence(mocks.hydroshare.resourceList_get)
+        with HTTMock(handler):
+            res_list = hs.resources(prefetch=1)
+            first = next(res_list)
+            # Page 2 is fetched while page 1 is still being consumed
+            deadline = time.time() + 5
+            while len(handler.requests) < 2 and time.time() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(len(handler.requests), 2)
+            ids = [first['resource_id']] + [r['resource_id'] for r in res_list]
+        self.assertEqual(ids, self.resource_ids)
+
+    @with_httmock(mocks.hydroshare.resourceFileList_get)
+    def test_prefetch_file_list(self):
+        hs = HydroShare(prompt_auth=False)
+        sizes = [f['size'] for f in hs.getResourceFileList('511debf8858a4ea081f78d66870da76c', prefetch=2)]
+        self.assertEqual(sizes, [23550, 107545, 148, 267118, 128])
+
+    def test_prefetch_error_propagates(self):
+        hs = HydroShare(prompt_auth=False)
+        handler = mocks.hydroshare.sequence(mocks.hydroshare.resourceList_get,
+                                            mocks.hydroshare.status_response(403))
+        with HTTMock(handler):
+            res_list = hs.resources(prefetch=3)
+            self.assertRaises(HydroShareNotAuthorized, list, res_list)
+
+
+class TestResultsListFanOut(unittest.TestCase):
+
+    def setUp(self):
+        self.ids = ['{0:032x}'.format(i) for i in range(95)]
+
+    def test_fan_out_ordered(self):
+        hs = HydroShare(prompt_auth=False)
+        handler = mocks.hydroshare.paged_listing('/hsapi/resource/', 95, 10, delay=0.02)
+        with HTTMock(handler):
+            ids = [r['resource_id'] for r in hs.resources(page_workers=4)]
+        self.assertEqual(ids, self.ids)
+        self.assertEqual(sorted(handler.pages), list(range(1, 11)))
+        self.assertGreater(handler.max_in_flight, 1)
+
+    def test_fan_out_unordered(self):
+        hs = HydroShare(prompt_auth=False)
+        handler = mocks.hydroshare.paged_listing('/hsapi/resource/', 95, 10)
+        with HTTMock(handler):
+            ids = [r['resource_id'] for r in hs.resources(page_workers=4, ordered=False)]
+        self.assertEqual(sorted(ids), self.ids)
+
+    @with_httmock(mocks.hydroshare.resourceFileList_get)
+    def test_fan_out_file_list(self):
+        hs = HydroShare(prompt_auth=False)
+        sizes = [f['size'] for f in hs.getResourceFileList('511debf8858a4ea081f78d66870da76c', page_workers=2)]
+        self.assertEqual(sizes, [23550, 107545, 148, 267118, 128])
+
+
+class TestResultsListCursor(unittest.TestCase):
+
+    def setUp(self):
+        self.ids = ['{0:032x}'.format(i) for i in range(25)]
+
+    def test_resume_after_failure(self):
+        hs = HydroShare(prompt_auth=False)
+        listing = mocks.hydroshare.paged_listing('/hsapi/resource/', 25, 10)
+        failing = mocks.hydroshare.sequence(listing, listing, mocks.hydroshare.status_response(500))
+        seen = []
+        resources = hs.resources(owner='me')
+        with HTTMock(failing):
+            with self.assertRaises(HydroShareHTTPException):
+                for r in resources:
+                    seen.append(r['resource_id'])
+        self.assertEqual(seen, self.ids[:20])
+
+        saved = resources.cursor.toJSON()
+        cursor = PaginationCursor.fromJSON(saved)
+        self.assertTrue(cursor.url.endswith('page=3'))
+        self.assertEqual(cursor.params, {'owner': 'me'})
+        self.assertEqual(cursor.offset, 0)
+
+        with HTTMock(listing):
+            for r in hs.resources(cursor=saved):
+                seen.append(r['resource_id'])
+        self.assertEqual(seen, self.ids)
+        self.assertEqual(listing.pages, [1, 2, 3])
+
+    def test_resume_mid_page(self):
+        hs = HydroShare(prompt_auth=False)
+        listing = mocks.hydroshare.paged_listing('/hsapi/resource/', 25, 10)
+        with HTTMock(listing):
+            resources = hs.resources()
+            first = [next(resources)['resource_id'] for i in range(13)]
+            cursor = resources.cursor
+            self.assertEqual(cursor.offset, 3)
+            rest = [r['resource_id'] for r in hs.resources(cursor=cursor.toDict())]
+            self.assertIsNotNone(resources.cursor)
+            list(resources)
+            self.assertIsNone(resources.cursor)
+        self.assertEqual(first + rest, self.ids)
+
+    @with_httmock(mocks.hydroshare.resourceFileList_get)
+    def test_file_list_cursor(self):
+        hs = HydroShare(prompt_auth=False)
+        files = hs.getResourceFileList('511debf8858a4ea081f78d66870da76c')
+        next(files)
+        rest = hs.getResourceFileList('511debf8858a4ea081f78d66870da76c', cursor=files.cursor)
+        self.assertEqual([f['size'] for f in rest], [107545, 148, 267118, 128])
+
+
+class _ChunkedBody(object):
+    """ Stand-in for a streamed response that records how much of its body has been read """
+    def __init__(self, body, chunk_size):
+        self.body = body
+        self.chunk_size = chunk_size
+        self.read = 0
+        self.closed = False
+
+    def iter_content(self, chunk_size):
+        for i in range(0, len(self.body), self.chunk_size):
+            self.read = i + self.chunk_size
+            yield self.body[i:i + self.chunk_size]
+
+    def close(self):
+        self.closed = True
+
+
+@unittest.skipIf(streaming.ijson is None, "ijson is not installed")
+class TestStreamedListing(unittest.TestCase):
+
+    def test_items_decoded_incrementally(self):
+        results = [{'resource_id': '{0:032x}'.format(i), 'keywords': ['a', 'b'], 'size': i * 1.5}
+                   for i in range(20000)]
+        # 'next' after 'results' is only known once the page has been read
+        body = json.dumps({'count': 20000, 'results': results, 'next': None}).encode('utf-8')
+        response = _ChunkedBody(body, 1024)
+        page = streaming.StreamedPage(response)
+        items = page.items()
+        self.assertEqual(next(items), results[0])
+        self.assertLess(response.read, len(body) // 10)
+        self.assertEqual(list(items), results[1:])
+        self.assertEqual(page.count, 20000)
+        self.assertIsNone(page.next)
+        self.assertTrue(response.closed)
+
+    def test_resources_stream_items(self):
+        hs = HydroShare(prompt_auth=False)
+        listing = mocks.hydroshare.paged_listing('/hsapi/resource/', 25, 10)
+        with HTTMock(listing):
+            resources = hs.resources(stream_items=True)
+            ids = [r['resource_id'] for r in resources]
+        self.assertEqual(ids, ['{0:032x}'.format(i) for i in range(25)])
+        self.assertEqual(listing.pages, [1, 2, 3])
+
+    def test_stream_items_cursor(self):
+        hs = HydroShare(prompt_auth=False)
+        listing = mocks.hydroshare.paged_listing('/hsapi/resource/', 25, 10)
+        with HTTMock(listing):
+            resources = hs.resources(stream_items=True)
+            first = [next(resources)['resource_id'] for i in range(12)]
+            saved = resources.cursor.toJSON()
+            resources.close()
+            rest = [r['resource_id'] for r in hs.resources(cursor=saved, stream_items=True)]
+        self.assertEqual(first + rest, ['{0:032x}'.format(i) for i in range(25)])
+
+    @with_httmock(mocks.hydroshare.resourceFileList_get)
+    def test_files_all_stream_items(self):
+        hs = HydroShare(prompt_auth=False)
+        files = hs.resource('511debf8858a4ea081f78d66870da76c').files.all(stream_items=True)
+        self.assertEqual([f['size'] for f in files], [23550, 107545, 148, 267118, 128])
+
+    def test_stream_items_excludes_prefetch(self):
+        hs = HydroShare(prompt_auth=False)
+        with self.assertRaises(HydroShareArgumentException):
+            hs.resources(stream_items=True, prefetch=2)
+
+
+class TestRecords(unittest.TestCase):
+
+    @with_httmock(mocks.hydroshare.resourceList_get)
+    def test_resources_as_records(self):
+        hs = HydroShare(prompt_auth=False)
+        dicts = list(hs.resources())
+        records = list(hs.resources(as_records=True))
+        self.assertEqual(len(records), len(dicts))
+        for record, d in zip(records, dicts):
+            self.assertIsInstance(record, ResourceSummary)
+            self.assertFalse(hasattr(record, '__dict__'))
+            self.assertEqual(record, d)
+            self.assertEqual(record.toDict(), d)
+            self.assertEqual(record['bag_url'], d['bag_url'])
+            self.assertEqual(record.science_metadata_url, d['science_metadata_url'])
+            # URLs following the usual layout are derived, not stored
+            self.assertIsNone(record._overrides)
+        self.assertIs(records[0].resource_type, records[1].resource_type)
+        self.assertIs(records[0]._site, records[1]._site)
+        self.assertEqual(ResourceSummary.INTERNED, ('resource_type', 'creator', 'author'))
+
+    def test_unexpected_values(self):
+        d = {'resource_id': 'abc', 'resource_type': 'CompositeResource', 'color': 'blue',
+             'bag_url': 'https://example.org/bags/abc.zip',
+             'resource_url': 'https://www.hydroshare.org/resource/abc/'}
+        record = ResourceSummary.fromDict(d)
+        self.assertEqual(record.toDict(), d)
+        self.assertEqual(record.color, 'blue')
+        self.assertEqual(record.bag_url, 'https://example.org/bags/abc.zip')
+        self.assertEqual(record.resource_map_url, 'https://www.hydroshare.org/resource/abc/map/')
+        self.assertNotIn('resource_map_url', record)
+        self.assertNotIn('creator', record)
+        self.assertIsNone(record.get('creator'))
+        with self.assertRaises(KeyError):
+            record['published']
+        self.assertEqual(pickle.loads(pickle.dumps(record)), record)
+
+    @with_httmock(mocks.hydroshare.resourceFileList_get)
+    def test_file_list_as_records(self):
+        hs = HydroShare(prompt_auth=False)
+        dicts = list(hs.getResourceFileList('511debf8858a4ea081f78d66870da76c'))
+        records = list(hs.getResourceFileList('511debf8858a4ea081f78d66870da76c', as_records=True))
+        self.assertEqual(records, dicts)
+        self.assertIsInstance(records[0], ResourceFileInfo)
+        self.assertEqual(records[0].resource_id, '511debf8858a4ea081f78d66870da76c')
+        self.assertEqual(records[0].file_path, 'foo/bar.txt')
+        self.assertEqual(records[0].url, dicts[0]['url'])
+        self.assertIsNone(records[0]._overrides)
+
+
+@unittest.skipIf(columnar.pyarrow is None or columnar.numpy is None, "pyarrow and numpy are not installed")
+class TestColumnarExport(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_parse_date(self):
+        self.assertEqual(columnar.parseDate('05-20-2015'), datetime(2015, 5, 20))
+        self.assertEqual(columnar.parseDate('2015-05-20T12:30:00Z'), datetime(2015, 5, 20, 12, 30))
+        self.assertEqual(columnar.parseDate('2015-05-20T12:30:00.5+02:00'), datetime(2015, 5, 20, 10, 30, 0, 500000))
+        self.assertIsNone(columnar.parseDate(None))
+        with self.assertRaises(ValueError):
+            columnar.parseDate('yesterday')
+
+    @with_httmock(mocks.hydroshare.resourceList_get)
+    def test_to_arrow(self):
+        hs = HydroShare(prompt_auth=False)
+        dicts = list(hs.resources())
+        table = hs.resources().toArrow()
+        self.assertEqual(table.num_rows, len(dicts))
+        self.assertEqual(table.column('resource_id').to_pylist(), [d['resource_id'] for d in dicts])
+        self.assertEqual(str(table.schema.field('date_created').type), 'timestamp[us, tz=UTC]')
+        created = table.column('date_created').to_pylist()[0]
+        self.assertEqual(created.date(), columnar.parseDate(dicts[0]['date_created']).date())
+        self.assertEqual(table.column('public').to_pylist(), [d['public'] for d in dicts])
+        array = hs.resources().toNumpy()
+        self.assertEqual(list(array['resource_id']), [d['resource_id'] for d in dicts])
+
+    def test_to_parquet_page_by_page(self):
+        from pyarrow import parquet
+        hs = HydroShare(prompt_auth=False)
+        listing = mocks.hydroshare.paged_listing('/hsapi/resource/', 25, 10)
+        path = os.path.join(self.tmp_dir, 'resources.parquet')
+        with HTTMock(listing):
+            resources = hs.resources(as_records=True)
+            self.assertIsInstance(resources, ResourceList)
+            rows = resources.toParquet(path)
+        self.assertEqual(rows, 25)
+        written = parquet.ParquetFile(path)
+        self.assertEqual(written.metadata.num_row_groups, 3)
+        table = written.read()
+        self.assertEqual(table.column('resource_id').to_pylist(), ['{0:032x}'.format(i) for i in range(25)])
+        self.assertEqual(table.column('creator').null_count, 25)
+
+    @with_httmock(mocks.hydroshare.resourceFileList_get)
+    def test_to_numpy(self):
+        hs = HydroShare(prompt_auth=False)
+        array = hs.getResourceFileList('511debf8858a4ea081f78d66870da76c').toNumpy()
+        self.assertEqual(list(array['size']), [23550, 107545, 148, 267118, 128])
+        self.assertEqual(array['content_type'][0], 'text/plain')
+        self.assertEqual(array.dtype['modified_time'].str, '<M8[us]')
+
+
+class TestResponseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.pid = '511debf8858a4ea081f78d66870da76c'
+
+    def test_revalidation(self):
+        hs = HydroShare(prompt_auth=False, cache=ResponseCache())
+        handler = mocks.hydroshare.revalidating(mocks.hydroshare.resourceSysmeta_get)
+        with HTTMock(handler):
+            first = hs.getSystemMetadata(self.pid)
+            second = hs.getSystemMetadata(self.pid)
+            handler.etag = '"v2"'
+            third = hs.getSystemMetadata(self.pid)
+            fourth = hs.getSystemMetadata(self.pid)
+        self.assertEqual(handler.statuses, [200, 304, 200, 304])
+        self.assertEqual(first, second)
+        self.assertEqual(third, fourth)
+        self.assertEqual(hs.getCacheStatistics(), {'hits': 2, 'misses': 2, 'revalidations': 3})
+
+    def test_not_found_not_cached(self):
+        hs = HydroShare(prompt_auth=False, cache=ResponseCache())
+        handler = mocks.hydroshare.revalidating(mocks.hydroshare.resourceSysmeta_get)
+        with HTTMock(handler):
+            for i in range(2):
+                with self.assertRaises(HydroShareNotFound):
+                    hs.getSystemMetadata('0' * 32)
+        self.assertEqual(handler.statuses, [404, 404])
+        self.assertEqual(len(hs.cache), 0)
+
+    @with_httmock(mocks.hydroshare.revalidating(mocks.hydroshare.resourceTypes_get))
+    def test_resource_types(self):
+        cache = ResponseCache(max_entries=1)
+        hs = HydroShare(prompt_auth=False, cache=cache)
+        types = hs.getResourceTypes()
+        self.assertEqual(hs.getResourceTypes(), types)
+        self.assertEqual(cache.statistics.hits, 1)
+        cache.invalidate()
+        self.assertEqual(len(cache), 0)
+
+    def test_disabled_by_default(self):
+        hs = HydroShare(prompt_auth=False)
+        self.assertIsNone(hs.getCacheStatistics())
+        handler = mocks.hydroshare.revalidating(mocks.hydroshare.resourceSysmeta_get)
+        with HTTMock(handler):
+            hs.getSystemMetadata(self.pid)
+            hs.getSystemMetadata(self.pid)
+        self.assertEqual(handler.statuses, [200, 200])
+
+
+def _fillDiskCache(directory, worker):
+    cache = DiskResponseCache(directory)
+    for i in range(50):
+        key = 'http://www.hydroshare.org/hsapi/{0}/{1}/'.format(worker, i)
+        cache.store(key, CacheEntry(key, 200, {'ETag': '"1"'}, b'x' * 100, 'sysmeta', '{0:032x}'.format(i)))
+
+
+class TestDiskResponseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.pid = '511debf8858a4ea081f78d66870da76c'
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_shared_between_clients(self):
+        handler = mocks.hydroshare.revalidating(mocks.hydroshare.resourceSysmeta_get)
+        with HTTMock(handler):
+            first = HydroShare(prompt_auth=False, cache=DiskResponseCache(self.tmp_dir))
+            second = HydroShare(prompt_auth=False, cache=DiskResponseCache(self.tmp_dir))
+            metadata = first.getSystemMetadata(self.pid)
+            self.assertEqual(second.getSystemMetadata(self.pid), metadata)
+        self.assertEqual(handler.statuses, [200, 304])
+        self.assertEqual(second.getCacheStatistics()['hits'], 1)
+
+    def test_ttl(self):
+        handler = mocks.hydroshare.revalidating(mocks.hydroshare.resourceSysmeta_get)
+        cache = DiskResponseCache(self.tmp_dir, ttls={'sysmeta': 60})
+        hs = HydroShare(prompt_auth=False, cache=cache)
+        with HTTMock(handler):
+            hs.getSystemMetadata(self.pid)
+            hs.getSystemMetadata(self.pid)
+            cache.ttls['sysmeta'] = 0
+            hs.getSystemMetadata(self.pid)
+        self.assertEqual(handler.statuses, [200, 304])
+        self.assertEqual(hs.getCacheStatistics(), {'hits': 2, 'misses': 1, 'revalidations': 1})
+
+    def test_lru_byte_budget(self):
+        cache = DiskResponseCache(self.tmp_dir, max_bytes=250)
+        for key in ('a', 'b', 'c'):
+            cache.store(key, CacheEntry(key, 200, {'ETag': '"1"'}, b'x' * 100))
+            time.sleep(0.01)
+        self.assertIsNone(cache.lookup('a'))
+        cache.lookup('b')
+        time.sleep(0.01)
+        cache.store('d', CacheEntry('d', 200, {'ETag': '"1"'}, b'x' * 100))
+        self.assertIsNone(cache.lookup('c'))
+        self.assertEqual(cache.lookup('b').content, b'x' * 100)
+        self.assertEqual(cache.lookup('d').headers['etag'], '"1"')
+
+    def test_oversize_body_replaces_entry(self):
+        cache = DiskResponseCache(self.tmp_dir, max_bytes=250, ttls={'sysmeta': 60})
+        cache.store('a', CacheEntry('a', 200, {'ETag': '"1"'}, b'old', endpoint='sysmeta'))
+        cache.store('a', CacheEntry('a', 200, {'ETag': '"2"'}, b'x' * 300, endpoint='sysmeta'))
+        self.assertIsNone(cache.lookup('a'))
+        entry, headers, cached = cache.prepare('a', None)
+        self.assertIsNone(cached)
+
+    def test_mutation_invalidates(self):
+        cache = DiskResponseCache(self.tmp_dir)
+        hs = HydroShare(prompt_auth=False, cache=cache)
+        handler = mocks.hydroshare.revalidating(mocks.hydroshare.resourceSysmeta_get)
+        with HTTMock(handler, mocks.hydroshare.resourceFolderDelete_delete):
+            hs.getSystemMetadata(self.pid)
+            self.assertEqual(len(cache), 1)
+            hs.deleteResourceFolder(self.pid, pathname='model/initial/')
+            self.assertEqual(len(cache), 0)
+            hs.getSystemMetadata(self.pid)
+        self.assertEqual(handler.statuses, [200, 200])
+
+    def test_concurrent_processes(self):
+        context = multiprocessing.get_context('fork')
+        workers = [context.Process(target=_fillDiskCache, args=(self.tmp_dir, i)) for i in range(3)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual([w.exitcode for w in workers], [0, 0, 0])
+        self.assertEqual(len(DiskResponseCache(self.tmp_dir)), 150)
+
+
+class TestVersionKeyedCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.pids = ['{0:032x}'.format(i) for i in range(25)]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def harvest(self, hs, updated=None):
+        listing = mocks.hydroshare.paged_listing('/hsapi/resource/', 25, 10, updated=updated)
+        scimeta = mocks.hydroshare.scimeta_elements()
+        with HTTMock(scimeta, listing):
+            for resource in hs.resources():
+                hs.getScienceMetadata(resource['resource_id'])
+        return scimeta.pids
+
+    def test_only_changed_resources_fetched(self):
+        for cache in (ResponseCache(), DiskResponseCache(self.tmp_dir)):
+            hs = HydroShare(prompt_auth=False, cache=cache)
+            self.assertEqual(self.harvest(hs), self.pids)
+            self.assertEqual(self.harvest(hs), [])
+            changed = {3: '2016-01-01T00:00:00Z', 17: '2016-01-02T00:00:00Z'}
+            self.assertEqual(self.harvest(hs, updated=changed), [self.pids[3], self.pids[17]])
+            self.assertEqual(self.harvest(hs, updated=changed), [])
+
+    def test_not_observed_not_cached(self):
+        hs = HydroShare(prompt_auth=False, cache=ResponseCache())
+        scimeta = mocks.hydroshare.scimeta_elements()
+        with HTTMock(scimeta):
+            hs.getScienceMetadata(self.pids[0])
+            hs.getScienceMetadata(self.pids[0])
+        self.assertEqual(scimeta.pids, [self.pids[0]] * 2)
+
+    def test_mutation_forgets_version(self):
+        cache = ResponseCache()
+        hs = HydroShare(prompt_auth=False, cache=cache)
+        self.harvest(hs)
+        self.assertIsNotNone(cache.version(self.pids[0]))
+        cache.invalidate(self.pids[0])
+        self.assertIsNone(cache.version(self.pids[0]))
+        scimeta = mocks.hydroshare.scimeta_elements()
+        with HTTMock(scimeta):
+            hs.getScienceMetadata(self.pids[0])
+            hs.getScienceMetadata(self.pids[0])
+            hs.getScienceMetadata(self.pids[1])
+        self.assertEqual(scimeta.pids, [self.pids[0]] * 2)
+
+
+class TestNegativeCache(unittest.TestCase):
+
+    def setUp(self):
+        self.missing = '0' * 32
+
+    def test_not_found_remembered(self):
+        hs = HydroShare(prompt_auth=False, negative_cache=NegativeCache(ttl=60))
+        handler = mocks.hydroshare.sequence(mocks.hydroshare.resourceSysmeta_get)
+        with HTTMock(handler):
+            for i in range(3):
+                with self.assertRaises(HydroShareNotFound):
+                    hs.getSystemMetadata(self.missing)
+            with self.assertRaises(HydroShareNotFound):
+                hs.getSystemMetadata(self.missing, use_cache=False)
+        self.assertEqual(len(handler.requests), 2)
+        self.assertEqual(hs.negative_cache.statistics.asDict(), {'hits': 2, 'misses': 2, 'revalidations': 0})
+
+    def test_not_authorized_file(self):
+        hs = HydroShare(prompt_auth=False, negative_cache=NegativeCache())
+        handler = mocks.hydroshare.sequence(mocks.hydroshare.status_response(403))
+        with HTTMock(handler):
+            for i in range(2):
+                with self.assertRaises(HydroShareNotAuthorized):
+                    hs.getResourceFile(self.missing, 'data.csv')
+        self.assertEqual(len(handler.requests), 1)
+
+    def test_http_error_remembered(self):
+        hs = HydroShare(prompt_auth=False, negative_cache=NegativeCache())
+        handler = mocks.hydroshare.sequence(mocks.hydroshare.status_response(404))
+        with HTTMock(handler):
+            for i in range(2):
+                with self.assertRaises(HydroShareHTTPException) as context:
+                    hs.getResourceTypes()
+                self.assertEqual(context.exception.status_code, 404)
+                self.assertEqual(context.exception.method, 'GET')
+                self.assertEqual(context.exception.url, 'https://www.hydroshare.org/hsapi/resource/types')
+        self.assertEqual(len(handler.requests), 1)
+
+    def test_ttl_and_size_limit(self):
+        negative_cache = NegativeCache(ttl=0.05, max_entries=2)
+        hs = HydroShare(prompt_auth=False, negative_cache=negative_cache)
+        handler = mocks.hydroshare.sequence(mocks.hydroshare.resourceSysmeta_get)
+        with HTTMock(handler):
+            for pid in ('1' * 32, '2' * 32, '3' * 32):
+                with self.assertRaises(HydroShareNotFound):
+                    hs.getSystemMetadata(pid)
+            self.assertEqual(len(negative_cache), 2)
+            with self.assertRaises(HydroShareNotFound):
+                hs.getSystemMetadata('1' * 32)
+            self.assertEqual(len(handler.requests), 4)
+            time.sleep(0.06)
+            with self.assertRaises(HydroShareNotFound):
+                hs.getSystemMetadata('3' * 32)
+        self.assertEqual(len(handler.requests), 5)
+
+    def test_success_forgets_failure(self):
+        pid = '511debf8858a4ea081f78d66870da76c'
+        hs = HydroShare(prompt_auth=False, negative_cache=NegativeCache())
+        with HTTMock(mocks.hydroshare.status_response(404)):
+            with self.assertRaises(HydroShareNotFound):
+                hs.getSystemMetadata(pid)
+        with HTTMock(mocks.hydroshare.resourceSysmeta_get):
+            hs.getSystemMetadata(pid, use_cache=False)
+            hs.getSystemMetadata(pid)
+        self.assertEqual(len(hs.negative_cache), 0)
+
+
+class TestSegmentedDownload(unittest.TestCase):
+
+    def setUp(self):
+        self.res_id = '511debf8858a4ea081f78d66870da76c'
+        self.path = '/hsapi/resource/{0}/files/dem.tif'.format(self.res_id)
+        self.data = os.urandom(1000 * 1024 + 17)
+        self.server = mocks.server.StandInServer().start()
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.tmp_dir)
+
+    def _serve(self, ranges=True):
+        handler = lambda r: mocks.server.file_response(r, self.data, 'image/tiff', ranges=ranges)
+        self.server.add('GET', self.path, handler)
+        self.server.add('HEAD', self.path, handler)
+        return HydroShare(hostname='127.0.0.1', port=self.server.port, use_https=False, prompt_auth=False)
+
+    def _ranges(self):
+        return sorted(r.headers.get('Range') for r in self.server.requests if r.method == 'GET')
+
+    def test_segments(self):
+        hs = self._serve()
+        path = hs.getResourceFile(self.res_id, 'dem.tif', destination=self.tmp_dir, segment_workers=3,
+                                  segment_size=256 * 1024)
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+        self.assertEqual(len(self._ranges()), 4)
+        self.assertIn('bytes=786432-1024016', self._ranges())
+        self.assertEqual([r.method for r in self.server.requests].count('HEAD'), 1)
+
+    def test_fallback_without_accept_ranges(self):
+        hs = self._serve(ranges=False)
+        path = hs.getResourceFile(self.res_id, 'dem.tif', destination=self.tmp_dir, segment_workers=3,
+                                  segment_size=256 * 1024)
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+        self.assertEqual(self._ranges(), [None])
+
+    def test_single_segment_streams(self):
+        hs = self._serve()
+        hs.getResourceFile(self.res_id, 'dem.tif', destination=self.tmp_dir, segment_workers=3)
+        self.assertEqual(self._ranges(), [None])
+
+    def test_segment_failure_removes_file(self):
+        hs = self._serve()
+        hs.retry_policy = RetryPolicy(max_attempts=1)
+        self.server.add('GET', self.path, lambda r: (500, {}, b'') if r.headers.get('Range', '').startswith(
+            'bytes=524288') else mocks.server.file_response(r, self.data))
+        with self.assertRaises(HydroShareHTTPException):
+            hs.getResourceFile(self.res_id, 'dem.tif', destination=self.tmp_dir, segment_workers=2,
+                               segment_size=256 * 1024)
+        self.assertEqual(os.listdir(self.tmp_dir), [])
+
+    def test_requires_destination(self):
+        hs = HydroShare(prompt_auth=False)
+        with self.assertRaises(HydroShareArgumentException):
+            hs.getResourceFile(self.res_id, 'dem.tif', segment_workers=2)
+
+    def test_keeps_cached_metadata(self):
+        hs = self._serve()
+        hs.cache = ResponseCache(ttls={'sysmeta': 60})
+        self.server.add('GET', '/hsapi/resource/{0}/sysmeta/'.format(self.res_id),
+                        lambda r: (200, {'Content-Type': 'application/json', 'ETag': '"1"'},
+                                   b'{"resource_id": "511debf8858a4ea081f78d66870da76c"}'))
+        hs.getSystemMetadata(self.res_id)
+        hs.getResourceFile(self.res_id, 'dem.tif', destination=self.tmp_dir, segment_workers=3,
+                           segment_size=256 * 1024)
+        hs.getSystemMetadata(self.res_id)
+        self.assertEqual(hs.getCacheStatistics()['hits'], 1)
+        self.assertEqual(len(hs.cache._entries), 1)
+
+    def test_negative_cache(self):
+        hs = self._serve()
+        hs.negative_cache = NegativeCache()
+        self.server.add('HEAD', self.path, lambda r: (404, {}, b''))
+        self.server.add('GET', self.path, lambda r: (404, {}, b''))
+        for i in range(2):
+            with self.assertRaises(HydroShareNotFound):
+                hs.getResourceFile(self.res_id, 'dem.tif', destination=self.tmp_dir, segment_workers=3,
+                                   segment_size=256 * 1024)
+        self.assertEqual([r.method for r in self.server.requests], ['HEAD'])
+
+
+class TestResumableDownload(unittest.TestCase):
+
+    def setUp(self):
+        self.res_id = '511debf8858a4ea081f78d66870da76c'
+        self.path = '/hsapi/resource/{0}/files/dem.tif'.format(self.res_id)
+        self.data = os.urandom(300 * 1024 + 5)
+        self.etag = '"v1"'
+        self.server = mocks.server.StandInServer().start()
+        self.server.add('GET', self.path, lambda r: mocks.server.file_response(r, self.data, etag=self.etag))
+        self.hs = HydroShare(hostname='127.0.0.1', port=self.server.port, use_https=False, prompt_auth=False)
+        self.url = '{0}/resource/{1}/files/dem.tif'.format(self.hs.url_base, self.res_id)
+        self.tmp_dir = tempfile.mkdtemp()
+        self.filepath = os.path.join(self.tmp_dir, 'dem.tif')
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.tmp_dir)
+
+    def _interrupted(self, size):
+        # A part of the first size bytes, as left by a download that died
+        partial = PartialDownload(self.filepath)
+        with open(partial.part_path, 'wb') as f:
+            f.write(self.data[:size])
+        partial.save(self.url, len(self.data), '"v1"', None)
+
+    def _download(self):
+        return self.hs.getResourceFile(self.res_id, 'dem.tif', destination=self.tmp_dir, resume=True)
+
+    def _assertComplete(self, path):
+        self.assertEqual(path, self.filepath)
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+        self.assertEqual(os.listdir(self.tmp_dir), [os.path.basename(self.filepath)])
+
+    def test_fresh_download(self):
+        self._assertComplete(self._download())
+        self.assertIsNone(self.server.requests[0].headers.get('Range'))
+
+    def test_resumes_missing_range(self):
+        self._interrupted(100000)
+        self._assertComplete(self._download())
+        request = self.server.requests[0]
+        self.assertEqual(request.headers['Range'], 'bytes=100000-')
+        self.assertEqual(request.headers['If-Range'], '"v1"')
+
+    def test_changed_file_restarts(self):
+        self._interrupted(100000)
+        self.etag = '"v2"'
+        self.data = os.urandom(1000)
+        self._assertComplete(self._download())
+
+    def test_complete_part_is_renamed(self):
+        self._interrupted(len(self.data))
+        self._assertComplete(self._download())
+        self.assertEqual(self.server.requests, [])
+
+    def test_short_download_is_kept(self):
+        def short(headers):
+            r = requests.Response()
+            r.status_code = 200
+            r.headers['Content-Length'] = str(len(self.data))
+            r.headers['ETag'] = '"v1"'
+            r.raw = io.BytesIO(self.data[:5000])
+            return r
+        with self.assertRaises(HydroShareException):
+            resumableDownload(short, self.url, self.filepath)
+        self.assertEqual(os.path.getsize(self.filepath + '.part'), 5000)
+        self._assertComplete(self._download())
+        self.assertEqual(self.server.requests[0].headers['Range'], 'bytes=5000-')
+
+    def test_bag(self):
+        bag = os.path.join('www.hydroshare.org', 'hsapi', 'resource', self.res_id + '.zip')
+        with open(bag, 'rb') as f:
+            self.data = f.read()
+        self.server.add('GET', '/hsapi/resource/{0}/'.format(self.res_id),
+                        lambda r: mocks.server.file_response(r, self.data, 'application/zip', etag=self.etag))
+        self.filepath = os.path.join(self.tmp_dir, self.res_id + '.zip')
+        self.url = '{0}/resource/{1}/'.format(self.hs.url_base, self.res_id)
+        self._interrupted(1000)
+        self.hs.getResource(self.res_id, destination=self.tmp_dir, resume=True)
+        self._assertComplete(self.filepath)
+        self.assertEqual(self.server.requests[0].headers['Range'], 'bytes=1000-')
+
+        self._interrupted(1000)
+        self.hs.getResource(self.res_id, destination=self.tmp_dir, unzip=True, resume=True)
+        self.assertEqual(sorted(os.listdir(self.tmp_dir)), [self.res_id])
+
+class TestChecksums(unittest.TestCase):
+
+    def setUp(self):
+        self.res_id = '511debf8858a4ea081f78d66870da76c'
+        self.data = os.urandom(200 * 1024)
+        self.server = mocks.server.StandInServer().start()
+        self.hs = HydroShare(hostname='127.0.0.1', port=self.server.port, use_https=False, prompt_auth=False)
+        base = '/hsapi/resource/{0}/'.format(self.res_id)
+        self.server.add('GET', base + 'files/dem.tif',
+                        lambda r: mocks.server.file_response(r, self.data, etag='"v1"'))
+        listing = {'count': 1, 'next': None, 'results': [
+            {'url': 'http://127.0.0.1/django_irods/download/{0}/data/contents/dem.tif'.format(self.res_id),
+             'size': len(self.data), 'content_type': 'image/tiff'}]}
+        self.server.add('GET', base + 'files/', lambda r: mocks.server.json_response(json.dumps(listing)))
+        with open(os.path.join('www.hydroshare.org', 'hsapi', 'resource', self.res_id + '.zip'), 'rb') as f:
+            self.bag = f.read()
+        self.server.add('GET', base, lambda r: (200, {'Content-Type': 'application/zip'}, self.bag))
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_parse_manifest(self):
+        bagit = parseManifest('manifest-md5.txt', '9e107d9d372bb6826bd81d3542a419d6  data/contents/a b.txt\n')
+        self.assertEqual(bagit, {'data/contents/a b.txt': ('md5', bytes.fromhex('9e107d9d372bb6826bd81d3542a419d6'))})
+        irods = parseManifest('manifest-md5.txt', 'data/x.txt   sha2:A7ogTlDRJuRnTABeBNguhMITZngK8fQ71Uo3gWtqs0A=\n\x00')
+        self.assertEqual(list(irods), ['data/x.txt'])
+        self.assertEqual(irods['data/x.txt'][0], 'sha256')
+
+    def test_writer(self):
+        writer = ChecksumWriter()
+        writer.write(b'abc')
+        writer.verify('abc', size=3, checksum='900150983cd24fb0d6963f7d28e17f72')
+        with self.assertRaises(HydroShareChecksumException) as context:
+            writer.verify('abc', checksum='sha2:' + 'A' * 43 + '=')
+        self.assertEqual(context.exception.check, 'sha256')
+
+    def test_file_checked_against_listing(self):
+        path = self.hs.getResourceFile(self.res_id, 'dem.tif', destination=self.tmp_dir, verify=True)
+        self.assertEqual(os.path.getsize(path), len(self.data))
+        self.assertEqual([r.path for r in self.server.requests][0], '/hsapi/resource/{0}/files/'.format(self.res_id))
+
+    def test_mismatch_removes_file(self):
+        for listed in ({'size': len(self.data) + 1}, {'size': len(self.data), 'checksum': '0' * 64}):
+            with self.assertRaises(HydroShareChecksumException):
+                self.hs.getResourceFile(self.res_id, 'dem.tif', destination=self.tmp_dir, verify=listed)
+            self.assertEqual(os.listdir(self.tmp_dir), [])
+
+    def test_resumed_file_hashed_whole(self):
+        partial = PartialDownload(os.path.join(self.tmp_dir, 'dem.tif'))
+        with open(partial.part_path, 'wb') as f:
+            f.write(self.data[:1000])
+        partial.save(self.hs.url_base + '/resource/{0}/files/dem.tif'.format(self.res_id), len(self.data),
+                     '"v1"', None)
+        listed = {'size': len(self.data), 'checksum': hashlib.sha256(self.data).hexdigest()}
+        self.hs.getResourceFile(self.res_id, 'dem.tif', destination=self.tmp_dir, resume=True, verify=listed)
+        self.assertEqual(self.server.requests[0].headers['Range'], 'bytes=1000-')
+
+    def test_bag_checked_against_manifest(self):
+        self.hs.getResource(self.res_id, destination=self.tmp_dir, unzip=True, verify=True)
+        self.hs.getResource(self.res_id, destination=self.tmp_dir, verify=True)
+        self.assertEqual(sorted(os.listdir(self.tmp_dir)), [self.res_id, self.res_id + '.zip'])
+
+    def test_corrupt_bag(self):
+        source = ZipFile(io.BytesIO(self.bag))
+        corrupt = io.BytesIO()
+        with ZipFile(corrupt, 'w') as target:
+            for info in source.infolist():
+                content = source.read(info)
+                if info.filename.endswith('minimal_resource_file.txt'):
+                    content = content.upper()
+                target.writestr(info, content)
+        self.bag = corrupt.getvalue()
+        with self.assertRaises(HydroShareChecksumException) as context:
+            self.hs.getResource(self.res_id, destination=self.tmp_dir, verify=True)
+        self.assertTrue(context.exception.path.endswith('data/contents/minimal_resource_file.txt'))
+        self.assertEqual(os.listdir(self.tmp_dir), [])
+        with self.assertRaises(HydroShareChecksumException):
+            self.hs.getResource(self.res_id, destination=self.tmp_dir, unzip=True, verify=True)
+
+class _Unseekable(io.RawIOBase):
+    # Makes zipfile write data descriptors, as a server streaming a bag would
+    def __init__(self):
+        self.buffer = io.BytesIO()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        return self.buffer.write(data)
+
+
+class TestBagExtraction(unittest.TestCase):
+
+    def setUp(self):
+        self.res_id = '511debf8858a4ea081f78d66870da76c'
+        with open(os.path.join('www.hydroshare.org', 'hsapi', 'resource', self.res_id + '.zip'), 'rb') as f:
+            self.bag = f.read()
+        self.server = mocks.server.StandInServer().start()
+        self.server.add('GET', '/hsapi/resource/{0}/'.format(self.res_id),
+                        lambda r: (200, {'Content-Type': 'application/zip'}, self.bag))
+        self.hs = HydroShare(hostname='127.0.0.1', port=self.server.port, use_https=False, prompt_auth=False)
+        self.tmp_dir = tempfile.mkdtemp()
+        self.dirname = os.path.join(self.tmp_dir, self.res_id)
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.tmp_dir)
+
+    def _zip(self, members, seekable=True, compression=bags.zipfile.ZIP_DEFLATED):
+        target = io.BytesIO() if seekable else _Unseekable()
+        with ZipFile(target, 'w', compression) as z:
+            for name, content in members:
+                z.writestr(name, content)
+        return (target if seekable else target.buffer).getvalue()
+
+    def _assertExtracted(self, members):
+        for name, content in members:
+            with open(os.path.join(self.dirname, name), 'rb') as f:
+                self.assertEqual(f.read(), content)
+
+    def test_extracts_without_saving_archive(self):
+        self.hs.getResource(self.res_id, destination=self.tmp_dir, unzip=True, verify=True)
+        self.assertEqual(os.listdir(self.tmp_dir), [self.res_id])
+        source = ZipFile(io.BytesIO(self.bag))
+        for name in source.namelist():
+            if not name.endswith('/'):
+                with open(os.path.join(self.dirname, name), 'rb') as f:
+                    self.assertEqual(f.read(), source.read(name))
+
+    def test_data_descriptors(self):
+        members = [('data/contents/a.txt', b'a' * 100000), ('data/contents/empty.txt', b''),
+                   ('data/contents/b.bin', os.urandom(70000))]
+        self.bag = self._zip(members, seekable=False)
+        self.hs.getResource(self.res_id, destination=self.tmp_dir, unzip=True)
+        self._assertExtracted(members)
+
+    def test_large_members_on_workers(self):
+        members = [('data/contents/{0}.bin'.format(i), os.urandom(50000 + i)) for i in range(6)]
+        self.bag = self._zip(members, compression=bags.zipfile.ZIP_STORED)
+        threshold = bags.THREADED_MEMBER_SIZE
+        bags.THREADED_MEMBER_SIZE = 40000
+        try:
+            self.hs.getResource(self.res_id, destination=self.tmp_dir, unzip=True, extract_workers=3)
+        finally:
+            bags.THREADED_MEMBER_SIZE = threshold
+        self._assertExtracted(members)
+
+    def test_path_outside_destination(self):
+        self.bag = self._zip([('data/ok.txt', b'ok'), ('../evil.txt', b'evil')])
+        with self.assertRaises(HydroShareException):
+            self.hs.getResource(self.res_id, destination=self.tmp_dir, unzip=True)
+        self.assertEqual(os.listdir(self.tmp_dir), [])
+        self.assertFalse(os.path.exists(os.path.join(os.path.dirname(self.tmp_dir), 'evil.txt')))
+
+    def test_truncated_archive_raises(self):
+        self.bag = self._zip([('data/a.bin', os.urandom(100000))])[:60000]
+        with self.assertRaises(HydroShareException):
+            self.hs.getResource(self.res_id, destination=self.tmp_dir, unzip=True)
+        self.assertEqual(os.listdir(self.tmp_dir), [])
+
+    def test_not_a_zip_raises(self):
+        self.bag = b'<html>Service unavailable</html>'
+        with self.assertRaises(HydroShareException):
+            self.hs.getResource(self.res_id, destination=self.tmp_dir, unzip=True, resume=True)
+        with self.assertRaises(HydroShareException):
+            self.hs.getResource(self.res_id, destination=self.tmp_dir, unzip=True)
+
+class TestTaskTracker(unittest.TestCase):
+
+    def setUp(self):
+        self.res_id = '511debf8858a4ea081f78d66870da76c'
+        with open(os.path.join('www.hydroshare.org', 'hsapi', 'resource', self.res_id + '.zip'), 'rb') as f:
+            self.bag = f.read()
+        # task_id -> number of polls answering "not done" before the task is done
+        self.remaining = {}
+        self.polls = []
+        self.server = mocks.server.StandInServer().start()
+        self.server.add('GET', '/hsapi/resource/{0}/'.format(self.res_id), self._bag)
+        self.hs = HydroShare(hostname='127.0.0.1', port=self.server.port, use_https=False, prompt_auth=False)
+        self.hs.tasks = TaskTracker(self.hs, initial_interval=0.01, max_interval=0.04)
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.tmp_dir)
+
+    def _addTask(self, task_id, polls):
+        self.remaining[task_id] = polls
+        self.server.add('GET', '/hsapi/taskstatus/{0}/'.format(task_id), lambda r: self._status(task_id))
+
+    def _status(self, task_id):
+        self.polls.append((task_id, time.time()))
+        self.remaining[task_id] -= 1
+        return mocks.server.json_response(json.dumps({'status': self.remaining[task_id] < 0}))
+
+    def _bag(self, request):
+        if self.remaining.get('bag-task', -1) >= 0:
+            return mocks.server.json_response(json.dumps({'bag_status': 'Not ready', 'task_id': 'bag-task'}))
+        return 200, {'Content-Type': 'application/zip'}, self.bag
+
+    def test_bag_waits_with_backoff(self):
+        self._addTask('bag-task', 4)
+        started = time.time()
+        self.hs.getResource(self.res_id, destination=self.tmp_dir)
+        self.assertEqual(os.listdir(self.tmp_dir), [self.res_id + '.zip'])
+        self.assertEqual(len(self.polls), 5)
+        # Polls wait 0.01, 0.02, then max_interval 0.04 seconds
+        self.assertGreaterEqual(self.polls[-1][1] - started, 0.01 + 0.02 + 0.04 * 3)
+        self.assertEqual([r.path for r in self.server.requests].count('/hsapi/resource/{0}/'.format(self.res_id)), 2)
+
+    def test_bag_deadline(self):
+        self._addTask('bag-task', 1000)
+        started = time.time()
+        with self.assertRaises(HydroShareBagNotReadyException):
+            self.hs.getResource(self.res_id, destination=self.tmp_dir, wait_for_bag_creation=0.1)
+        self.assertLess(time.time() - started, 2)
+
+    def test_many_tasks(self):
+        done = []
+        futures = []
+        for i in range(20):
+            self._addTask('task-{0}'.format(i), i % 3)
+            futures.append(self.hs.tasks.track('task-{0}'.format(i), callback=done.append))
+        self.assertTrue(all(f.result(timeout=5) for f in futures))
+        self.assertEqual(len(done), 20)
+        self.assertEqual(len(self.polls), sum(i % 3 + 1 for i in range(20)))
+        self.assertEqual(self.hs.tasks.pending(), 0)
+
+    def test_failures(self):
+        self._addTask('slow', 1000)
+        self.server.add('GET', '/hsapi/taskstatus/broken/', lambda r: (500, {}, b''))
+        slow = self.hs.tasks.track('slow', timeout=0.05)
+        broken = self.hs.tasks.track('broken')
+        self.assertIsInstance(slow.exception(timeout=5), HydroShareTaskTimeoutException)
+        self.assertIsInstance(broken.exception(timeout=5), HydroShareHTTPException)
+
+class TestGetResources(unittest.TestCase):
+
+    def setUp(self):
+        with open(os.path.join('www.hydroshare.org', 'hsapi', 'resource',
+                               '511debf8858a4ea081f78d66870da76c.zip'), 'rb') as f:
+            self.bag = f.read()
+        # pid -> number of polls of its bag task answering "not done"
+        self.remaining = {}
+        self.events = []
+        self.server = mocks.server.StandInServer().start()
+        self.hs = HydroShare(hostname='127.0.0.1', port=self.server.port, use_https=False, prompt_auth=False)
+        self.hs.tasks = TaskTracker(self.hs, initial_interval=0.01, max_interval=0.02)
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.tmp_dir)
+
+    def _addResource(self, pid, polls=-1):
+        self.remaining[pid] = polls
+        self.server.add('GET', '/hsapi/resource/{0}/'.format(pid), lambda r: self._bag(pid))
+        self.server.add('GET', '/hsapi/taskstatus/{0}/'.format(pid), lambda r: self._status(pid))
+
+    def _bag(self, pid):
+        if self.remaining[pid] >= 0:
+            self.events.append(('started', pid))
+            return mocks.server.json_response(json.dumps({'bag_status': 'Not ready', 'task_id': pid}))
+        self.events.append(('bag', pid))
+        return 200, {'Content-Type': 'application/zip'}, self.bag
+
+    def _status(self, pid):
+        self.remaining[pid] -= 1
+        return mocks.server.json_response(json.dumps({'status': self.remaining[pid] < 0}))
+
+    def test_pipelined_downloads(self):
+        self._addResource('ready')
+        self._addResource('slow', polls=5)
+        self._addResource('quick', polls=0)
+        self.server.add('GET', '/hsapi/resource/missing/', lambda r: (404, {}, b''))
+
+        results = self.hs.getResources(['slow', 'missing', 'ready', 'quick'], self.tmp_dir, max_workers=2)
+
+        self.assertEqual([r.pid for r in results], ['slow', 'missing', 'ready', 'quick'])
+        self.assertEqual([r.ok for r in results], [True, False, True, True])
+        self.assertIsInstance(results[1].exception, HydroShareNotFound)
+        for result in (results[0], results[2], results[3]):
+            self.assertEqual(result.value, os.path.join(self.tmp_dir, result.pid + '.zip'))
+            with open(result.value, 'rb') as f:
+                self.assertEqual(f.read(), self.bag)
+            self.assertGreater(result.download_time, 0)
+        self.assertGreater(results[0].wait_time, results[2].wait_time)
+        # Creation of every bag is started before any waiting, and quick bags don't wait for slow ones
+        self.assertEqual(self.events.count(('started', 'slow')), 1)
+        self.assertLess(self.events.index(('started', 'quick')), self.events.index(('bag', 'quick')))
+        self.assertLess(self.events.index(('bag', 'quick')), self.events.index(('bag', 'slow')))
+
+    def test_ready_bag_requested_once(self):
+        self._addResource('ready')
+        self._addResource('quick', polls=0)
+        # A slow request for a ready bag holds up neither the tracking of other tasks nor their downloads
+        self.server.add('GET', '/hsapi/resource/sleepy/', lambda r: time.sleep(0.3) or self._bag('ready'))
+        results = self.hs.getResources(['sleepy', 'ready', 'quick'], self.tmp_dir, max_workers=2)
+        self.assertEqual([r.ok for r in results], [True] * 3)
+        self.assertEqual(self.events.count(('bag', 'ready')), 2)
+        self.assertEqual(self.events.index(('bag', 'quick')), 2)
+        self.assertLess(results[2].wait_time, 0.3)
+
+    def test_bag_not_ready(self):
+        self._addResource('ready')
+        self._addResource('stuck', polls=1000)
+        results = self.hs.getResources(['ready', 'stuck'], self.tmp_dir, wait_for_bag_creation=0.05)
+        self.assertTrue(results[0].ok)
+        self.assertIsInstance(results[1].exception, HydroShareBagNotReadyException)
+        self.assertGreaterEqual(results[1].wait_time, 0.05)
+
+        results = self.hs.getResources(['stuck'], self.tmp_dir, wait_for_bag_creation=False)
+        self.assertIsInstance(results[0].exception, HydroShareBagNotReadyException)
+        self.assertEqual(self.hs.tasks.pending(), 0)
+
+    def test_unzip(self):
+        self._addResource('unzipped', polls=0)
+        result, = self.hs.getResources(['unzipped'], self.tmp_dir, unzip=True)
+        self.assertEqual(result.value, os.path.join(self.tmp_dir, 'unzipped'))
+        self.assertTrue(os.listdir(result.value))
+        self.assertEqual(os.listdir(self.tmp_dir), ['unzipped'])
+
+        with self.assertRaises(HydroShareArgumentException):
+            self.hs.getResources(['unzipped'], os.path.join(self.tmp_dir, 'nowhere'))
+
+
+class TestReadChunks(unittest.TestCase):
+
+    def setUp(self):
+        self.body = os.urandom(3 * 1024 * 1024 + 17)
+        self.server = mocks.server.StandInServer().start()
+        self.server.add('GET', '/file', lambda r: (200, {'Content-Type': 'application/octet-stream'}, self.body))
+        self.session = requests.Session()
+        self.url = 'http://127.0.0.1:{0}/file'.format(self.server.port)
+
+    def tearDown(self):
+        self.session.close()
+        self.server.stop()
+
+    def test_adaptive_chunk_size(self):
+        sizes = AdaptiveChunkSize(minimum=1024, maximum=4096, interval=0.1)
+        self.assertEqual(sizes.update(1024, 0.01), 2048)
+        self.assertEqual(sizes.update(2048, 0.01), 4096)
+        self.assertEqual(sizes.update(4096, 0.01), 4096)
+        # neither fast nor slow, or a short read at the end of a body
+        self.assertEqual(sizes.update(4096, 0.1), 4096)
+        self.assertEqual(sizes.update(10, 1), 4096)
+        self.assertEqual(sizes.update(4096, 0.5), 2048)
+        self.assertEqual(sizes.update(2048, 0.5), 1024)
+        self.assertEqual(sizes.update(1024, 0.5), 1024)
+
+    def test_adaptive_chunks(self):
+        r = self.session.get(self.url, stream=True)
+        sizes = AdaptiveChunkSize(interval=10)
+        chunks = [chunk.tobytes() for chunk in readChunks(r, sizes)]
+        self.assertEqual(b''.join(chunks), self.body)
+        # Fast enough for every chunk to double the size, until the short last one
+        self.assertEqual([len(c) for c in chunks], [64 * 1024 * 2 ** i for i in range(5)] +
+                         [len(self.body) - 31 * 64 * 1024])
+        self.assertEqual(sizes.size, 2 * 1024 * 1024)
+        # The connection went back to the pool
+        self.session.get(self.url).close()
+        self.assertEqual(self.server.connections, 1)
+
+    def test_reused_buffer(self):
+        r = self.session.get(self.url, stream=True)
+        buffers = []
+        data = b''
+        for chunk in readChunks(r, 1000000):
+            self.assertIsInstance(chunk, memoryview)
+            buffers.append(chunk.obj)
+            data += chunk
+        self.assertEqual(data, self.body)
+        self.assertEqual(len(buffers), 4)
+        self.assertTrue(all(b is buffers[0] for b in buffers))
+
+        r = self.session.get(self.url, stream=True)
+        chunks = list(readChunks(r, 1000000, copy=True))
+        self.assertTrue(all(isinstance(c, bytes) for c in chunks))
+        self.assertEqual(b''.join(chunks), self.body)
+
+    def test_body_already_read(self):
+        r = self.session.get(self.url, stream=True)
+        self.assertEqual(len(r.content), len(self.body))
+        self.assertEqual(b''.join(readChunks(r)), self.body)
+
+    def test_compressed_body(self):
+        self.server.add('GET', '/gzip', lambda r: (200, {'Content-Encoding': 'gzip'}, gzip.compress(self.body)))
+        r = self.session.get(self.url.replace('/file', '/gzip'), stream=True)
+        self.assertEqual(b''.join(readChunks(r)), self.body)
+
+    def test_truncated_body(self):
+        listener = socket.socket()
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(1)
+
+        def serve():
+            connection, _ = listener.accept()
+            connection.recv(65536)
+            connection.sendall(b'HTTP/1.1 200 OK\r\nContent-Length: 100000\r\n\r\n' + self.body[:1000])
+            connection.close()
+            listener.close()
+
+        thread = threading.Thread(target=serve)
+        thread.start()
+        r = self.session.get('http://127.0.0.1:{0}/'.format(listener.getsockname()[1]), stream=True)
+        with self.assertRaises(requests.exceptions.ChunkedEncodingError):
+            list(readChunks(r))
+        thread.join()
+
+
+class TestSyncResource(unittest.TestCase):
+
+    def setUp(self):
+        self.res_id = '511debf8858a4ea081f78d66870da76c'
+        self.files = {'a.txt': b'a' * 1000, 'sub/b.bin': os.urandom(5000), 'sub/deep/c.csv': b'1,2\n' * 100,
+                      'd.txt': b'unchanged'}
+        self.broken = set()
+        self.server = mocks.server.StandInServer().start()
+        self.server.add('GET', '/hsapi/resource/{0}/files/'.format(self.res_id), self._list)
+        self.hs = HydroShare(hostname='127.0.0.1', port=self.server.port, use_https=False, prompt_auth=False)
+        self.local_dir = os.path.join(tempfile.mkdtemp(), 'mirror')
+        self._serve()
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(os.path.dirname(self.local_dir))
+
+    def _serve(self):
+        for path in self.files:
+            self.server.add('GET', '/hsapi/resource/{0}/files/{1}'.format(self.res_id, path),
+                            lambda r, path=path: self._file(r, path))
+
+    def _file(self, request, path):
+        if path in self.broken:
+            return 500, {}, b''
+        return mocks.server.file_response(request, self.files[path], etag=hashlib.md5(self.files[path]).hexdigest())
+
+    def _list(self, request):
+        results = [{'url': 'http://127.0.0.1:{0}/django_irods/download/{1}/data/contents/{2}'.format(
+                        self.server.port, self.res_id, path),
+                    'size': len(data), 'content_type': 'application/octet-stream',
+                    'checksum': hashlib.md5(data).hexdigest(), 'modified_time': '2017-01-01T00:00:00Z'}
+                   for path, data in sorted(self.files.items())]
+        return mocks.server.json_response(json.dumps({'count': len(results), 'next': None, 'previous': None,
+                                                      'results': results}))
+
+    def _downloads(self):
+        prefix = '/hsapi/resource/{0}/files/'.format(self.res_id)
+        return sorted(r.path[len(prefix):] for r in self.server.requests if r.path.startswith(prefix)
+                      and r.path != prefix)
+
+    def _assertMirrored(self):
+        for path, data in self.files.items():
+            with open(os.path.join(self.local_dir, *path.split('/')), 'rb') as f:
+                self.assertEqual(f.read(), data)
+
+    def test_sync_only_changes(self):
+        summary = self.hs.syncResource(self.res_id, self.local_dir)
+        self.assertTrue(summary.ok)
+        self.assertEqual(sorted(summary.downloaded), sorted(self.files))
+        self.assertEqual(summary.bytes_downloaded, sum(len(d) for d in self.files.values()))
+        self._assertMirrored()
+        self.assertTrue(os.path.isfile(os.path.join(self.local_dir, INDEX_NAME)))
+
+        del self.server.requests[:]
+        summary = self.hs.syncResource(self.res_id, self.local_dir)
+        self.assertEqual(summary.downloaded, [])
+        self.assertEqual(summary.bytes_saved, sum(len(d) for d in self.files.values()))
+        self.assertEqual(self._downloads(), [])
+
+        # Changed on HydroShare, edited locally, and removed locally
+        self.files['a.txt'] = b'b' * 1000
+        with open(os.path.join(self.local_dir, 'sub', 'b.bin'), 'wb') as f:
+            f.write(b'local edit')
+        os.remove(os.path.join(self.local_dir, 'sub', 'deep', 'c.csv'))
+        del self.server.requests[:]
+        summary = self.hs.syncResource(self.res_id, self.local_dir, max_workers=2)
+        self.assertEqual(sorted(summary.downloaded), ['a.txt', 'sub/b.bin', 'sub/deep/c.csv'])
+        self.assertEqual(summary.unchanged, ['d.txt'])
+        self.assertEqual(summary.bytes_saved, len(b'unchanged'))
+        self.assertEqual(self._downloads(), ['a.txt', 'sub/b.bin', 'sub/deep/c.csv'])
+        self._assertMirrored()
+
+    def test_delete(self):
+        self.hs.syncResource(self.res_id, self.local_dir)
+        with open(os.path.join(self.local_dir, 'mine.txt'), 'w') as f:
+            f.write('never synced')
+        del self.files['sub/deep/c.csv']
+
+        summary = self.hs.syncResource(self.res_id, self.local_dir)
+        self.assertEqual(summary.deleted, [])
+        self.assertTrue(os.path.exists(os.path.join(self.local_dir, 'sub', 'deep', 'c.csv')))
+
+        summary = self.hs.syncResource(self.res_id, self.local_dir, delete=True)
+        self.assertEqual(summary.deleted, ['sub/deep/c.csv'])
+        self.assertFalse(os.path.exists(os.path.join(self.local_dir, 'sub', 'deep')))
+        self.assertTrue(os.path.exists(os.path.join(self.local_dir, 'mine.txt')))
+        self.assertEqual(self.hs.syncResource(self.res_id, self.local_dir, delete=True).deleted, [])
+
+    def test_failed_download_retried(self):
+        self.broken.add('sub/b.bin')
+        summary = self.hs.syncResource(self.res_id, self.local_dir)
+        self.assertFalse(summary.ok)
+        self.assertEqual([r.args[0] for r in summary.failed], ['sub/b.bin'])
+        self.assertIsInstance(summary.failed[0].exception, HydroShareHTTPException)
+        self.assertEqual(len(summary.downloaded), 3)
+
+        self.broken.clear()
+        del self.server.requests[:]
+        summary = self.hs.syncResource(self.res_id, self.local_dir)
+        self.assertEqual(summary.downloaded, ['sub/b.bin'])
+        self._assertMirrored()
+
+    def test_refuses_paths_outside(self):
+        self.files['../escape.txt'] = b'x'
+        with self.assertRaises(HydroShareException):
+            self.hs.syncResource(self.res_id, self.local_dir)
+        self.assertEqual(self._downloads(), [])
+
+    def test_refuses_index_name(self):
+        self.hs.syncResource(self.res_id, self.local_dir)
+        with open(os.path.join(self.local_dir, INDEX_NAME), 'rb') as f:
+            index = f.read()
+        self.files[INDEX_NAME] = b'{"pid": null}'
+        self._serve()
+        del self.server.requests[:]
+        with self.assertRaises(HydroShareException):
+            self.hs.syncResource(self.res_id, self.local_dir)
+        self.assertEqual(self._downloads(), [])
+        with open(os.path.join(self.local_dir, INDEX_NAME), 'rb') as f:
+            self.assertEqual(f.read(), index)
+
+        # Only the index at the top of the mirror is reserved
+        del self.files[INDEX_NAME]
+        self.files['sub/' + INDEX_NAME] = b'{}'
+        self._serve()
+        self.assertEqual(self.hs.syncResource(self.res_id, self.local_dir).downloaded, ['sub/' + INDEX_NAME])
+
+
+class TestFileCache(unittest.TestCase):
+
+    def setUp(self):
+        self.files = {}
+        self.server = mocks.server.StandInServer().start()
+        self.hs = HydroShare(hostname='127.0.0.1', port=self.server.port, use_https=False, prompt_auth=False)
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache = FileCache(os.path.join(self.tmp_dir, 'cache'), max_bytes=25000)
+        self.hs.file_cache = self.cache
+        self.destination = os.path.join(self.tmp_dir, 'files')
+        os.mkdir(self.destination)
+
+    def tearDown(self):
+        self.server.stop()
+        self.cache.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def _serve(self, pid, name, data):
+        self.files[(pid, name)] = data
+        self.server.add('GET', '/hsapi/resource/{0}/files/{1}'.format(pid, name),
+                        lambda r: self._file(r, pid, name))
+
+    def _file(self, request, pid, name):
+        data = self.files[(pid, name)]
+        etag = '"{0}"'.format(hashlib.md5(data).hexdigest())
+        if request.headers.get('If-None-Match') == etag:
+            return 304, {'ETag': etag}, b''
+        return 200, {'ETag': etag, 'Content-Type': 'application/octet-stream'}, data
+
+    def _get(self, pid, name, **kwargs):
+        path = self.hs.getResourceFile(pid, name, destination=self.destination, **kwargs)
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def _statuses(self):
+        return [r.headers.get('If-None-Match') is not None for r in self.server.requests]
+
+    def test_revalidated(self):
+        data = os.urandom(10000)
+        self._serve('a' * 32, 'data.bin', data)
+        self.assertEqual(self._get('a' * 32, 'data.bin'), data)
+        self.assertEqual(len(self.cache), 1)
+        self.assertEqual(self._get('a' * 32, 'data.bin'), data)
+        self.assertEqual(self._statuses(), [False, True])
+        self.assertEqual(self.cache.statistics.asDict(), {'hits': 1, 'misses': 1, 'revalidations': 1})
+
+        # Changed on the server: downloaded by the conditional request itself
+        self.files[('a' * 32, 'data.bin')] = data[::-1]
+        self.assertEqual(self._get('a' * 32, 'data.bin'), data[::-1])
+        self.assertEqual(self._statuses(), [False, True, True])
+
+        # Not served from the cache without use_cache, but still cached
+        self.assertEqual(self._get('a' * 32, 'data.bin', use_cache=False), data[::-1])
+        self.assertEqual(self._statuses(), [False, True, True, False])
+
+    def test_linked_copies_not_overwritten(self):
+        pid = 'a' * 32
+        first, second = os.path.join(self.tmp_dir, 'A'), os.path.join(self.tmp_dir, 'B')
+        os.mkdir(first)
+        os.mkdir(second)
+        self._serve(pid, 'x.csv', b'version-1')
+        self.hs.getResourceFile(pid, 'x.csv', destination=first)
+        self.hs.getResourceFile(pid, 'x.csv', destination=second)
+
+        # A new version downloaded to one destination leaves the other copy, and the cached one, alone
+        self.files[(pid, 'x.csv')] = b'version-2'
+        self.hs.getResourceFile(pid, 'x.csv', destination=first)
+        with open(os.path.join(first, 'x.csv'), 'rb') as f:
+            self.assertEqual(f.read(), b'version-2')
+        with open(os.path.join(second, 'x.csv'), 'rb') as f:
+            self.assertEqual(f.read(), b'version-1')
+        self.assertEqual(sorted(os.listdir(first)), ['x.csv'])
+        self.files[(pid, 'x.csv')] = b'version-1'
+        self.assertEqual(self._get(pid, 'x.csv'), b'version-1')
+
+    def test_shared_content_stored_once(self):
+        data = os.urandom(10000)
+        self._serve('a' * 32, 'data.bin', data)
+        self._serve('b' * 32, 'copy.bin', data)
+        self._get('a' * 32, 'data.bin')
+        self._get('b' * 32, 'copy.bin')
+        self.assertEqual(len(self.cache), 1)
+
+        # A listing giving the checksum serves the content of any resource without a request
+        del self.server.requests[:]
+        self._serve('c' * 32, 'version.bin', data)
+        listed = {'size': len(data), 'checksum': hashlib.md5(data).hexdigest()}
+        self.assertEqual(self._get('c' * 32, 'version.bin', verify=listed), data)
+        self.assertEqual(self.server.requests, [])
+
+    def test_lru_eviction(self):
+        blobs = [os.urandom(10000) for i in range(3)]
+        for i, data in enumerate(blobs):
+            self._serve('a' * 32, 'f{0}'.format(i), data)
+        self._get('a' * 32, 'f0')
+        self._get('a' * 32, 'f1')
+        self._get('a' * 32, 'f0')
+        # Over the 25000 byte budget: f1, used least recently, goes
+        self._get('a' * 32, 'f2')
+        self.assertEqual(len(self.cache), 2)
+        self.assertIsNone(self.cache.lookup('a' * 32, 'f1'))
+        self.assertIsNotNone(self.cache.lookup('a' * 32, 'f0'))
+        self.assertFalse(os.path.exists(self.cache.blobPath(hashlib.sha256(blobs[1]).hexdigest())))
+
+        # Larger than the whole budget: not cached
+        self._serve('a' * 32, 'big', os.urandom(30000))
+        self._get('a' * 32, 'big')
+        self.assertIsNone(self.cache.lookup('a' * 32, 'big'))
+
+    def test_modified_copy_not_served(self):
+        data = os.urandom(10000)
+        self._serve('a' * 32, 'data.bin', data)
+        path = self.hs.getResourceFile('a' * 32, 'data.bin', destination=self.destination)
+        # Edited in place, which changes the cached bytes too if the file is a hard link to them
+        time.sleep(0.01)
+        with open(path, 'ab') as f:
+            f.write(b'edit')
+        self.assertEqual(self._get('a' * 32, 'data.bin'), data)
+        with open(self.cache.blobPath(hashlib.sha256(data).hexdigest()), 'rb') as f:
+            self.assertEqual(f.read(), data)
+
+class TestAddResourceFiles(unittest.TestCase):
+
+    def setUp(self):
+        self.res_id = '511debf8858a4ea081f78d66870da76c'
+        self.active = 0
+        self.most_active = 0
+        self.lock = threading.Lock()
+        self.uploads = []
+        self.server = mocks.server.StandInServer().start()
+        self.server.add('POST', '/hsapi/resource/{0}/files/'.format(self.res_id), self._upload)
+        self.hs = HydroShare(hostname='127.0.0.1', port=self.server.port, use_https=False, prompt_auth=False)
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.tmp_dir)
+
+    def _upload(self, request):
+        with self.lock:
+            self.active += 1
+            self.most_active = max(self.most_active, self.active)
+        time.sleep(0.05)
+        with self.lock:
+            self.active -= 1
+        body = request.body.decode('latin-1')
+        name = re.search(r'filename="([^"]*)"', body).group(1)
+        folder = re.search(r'name="folder"\r\n\r\n([^\r]*)\r\n', body).group(1)
+        self.uploads.append((folder, name))
+        if name == 'broken.txt':
+            return 500, {}, b''
+        return mocks.server.json_response(json.dumps({'resource_id': self.res_id, 'file_name': name}), 201)
+
+    def _file(self, name, size):
+        path = os.path.join(self.tmp_dir, name)
+        with open(path, 'wb') as f:
+            f.write(os.urandom(size))
+        return path
+
+    def test_upload_many(self):
+        paths = [self._file('out{0}.nc'.format(i), 1000 * i) for i in range(6)]
+        updates = []
+        files = paths[:4] + [(paths[4], 'outputs'), (io.BytesIO(b'{"a": 1}'), 'model/config', 'params.json'),
+                             (self._file('broken.txt', 10), None), os.path.join(self.tmp_dir, 'missing.nc')]
+        results = self.hs.addResourceFiles(self.res_id, files, max_workers=4,
+                                           progress_callback=lambda p: updates.append(
+                                               (p.bytes_sent, p.total_bytes, p.files_done, p.files_failed)))
+
+        self.assertEqual([r.ok for r in results], [True] * 6 + [False, False])
+        self.assertEqual(results[5].value['file_name'], 'params.json')
+        self.assertIsInstance(results[6].exception, HydroShareHTTPException)
+        self.assertIsInstance(results[7].exception, HydroShareArgumentException)
+        self.assertEqual(sorted(self.uploads), sorted([('', 'out{0}.nc'.format(i)) for i in range(4)] +
+                                                      [('outputs', 'out4.nc'), ('model/config', 'params.json'),
+                                                       ('', 'broken.txt')]))
+        self.assertGreater(self.most_active, 1)
+
+        bytes_sent, total_bytes, files_done, files_failed = updates[-1]
+        self.assertEqual((files_done, files_failed), (6, 2))
+        self.assertEqual(bytes_sent, total_bytes)
+        self.assertGreater(total_bytes, sum(os.path.getsize(p) for p in paths[:5]))
+
+    def test_single_file_items(self):
+        path = self._file('run.nc', 100)
+        with open(self._file('opened.csv', 10), 'rb') as opened:
+            results = self.hs.addResourceFiles(self.res_id, [pathlib.Path(path), opened,
+                                                             (pathlib.Path(path), 'outputs')])
+        self.assertEqual([r.ok for r in results], [True] * 3)
+        self.assertEqual(sorted(self.uploads), [('', 'opened.csv'), ('', 'run.nc'), ('outputs', 'run.nc')])
+
+    def test_invalid_item(self):
+        for item in (42, (), ('a', 'b', 'c', 'd')):
+            with self.assertRaises(HydroShareArgumentException):
+                self.hs.addResourceFiles(self.res_id, [self._file('ok.txt', 1), item])
+        self.assertEqual(self.uploads, [])
+
+
+class TestChunkedUpload(unittest.TestCase):
+
+    def setUp(self):
+        self.res_id = '511debf8858a4ea081f78d66870da76c'
+        self.uploads = {}
+        self.patches = []
+        # index of a PATCH request -> number of its bytes kept before answering 503
+        self.failures = {}
+        self.server = mocks.server.StandInServer().start()
+        self.server.add('POST', '/hsapi/resource/{0}/files/uploads/'.format(self.res_id), self._create)
+        self.hs = self._client()
+        self.tmp_dir = tempfile.mkdtemp()
+        self.journal_dir = os.path.join(self.tmp_dir, 'journal')
+        self.strategy = ChunkedUpload(part_size=64 * 1024, journal_dir=self.journal_dir)
+        self.data = os.urandom(300 * 1024 + 11)
+        self.path = os.path.join(self.tmp_dir, 'big.bin')
+        with open(self.path, 'wb') as f:
+            f.write(self.data)
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.tmp_dir)
+
+    def _client(self):
+        return HydroShare(hostname='127.0.0.1', port=self.server.port, use_https=False, prompt_auth=False,
+                          retry_policy=RetryPolicy(sleep=lambda delay: None))
+
+    def _create(self, request):
+        upload_id = str(len(self.uploads))
+        metadata = dict((name, base64.b64decode(value).decode('utf-8')) for name, value in
+                        (item.split(' ') for item in request.headers['Upload-Metadata'].split(',')))
+        self.uploads[upload_id] = {'length': int(request.headers['Upload-Length']), 'data': bytearray(),
+                                   'metadata': metadata}
+        path = '/hsapi/resource/{0}/files/uploads/{1}'.format(self.res_id, upload_id)
+        self.server.add('PATCH', path, lambda r: self._patch(r, upload_id))
+        self.server.add('HEAD', path, lambda r: self._head(upload_id))
+        return 201, {'Location': path, 'Tus-Resumable': '1.0.0'}, b''
+
+    def _patch(self, request, upload_id):
+        upload = self.uploads[upload_id]
+        offset = int(request.headers['Upload-Offset'])
+        if offset != len(upload['data']):
+            return 409, {}, b''
+        index = len(self.patches)
+        self.patches.append(offset)
+        if index in self.failures:
+            upload['data'].extend(request.body[:self.failures[index]])
+            return 503, {}, b''
+        upload['data'].extend(request.body)
+        if len(upload['data']) == upload['length']:
+            return mocks.server.json_response(json.dumps({'resource_id': self.res_id,
+                                                          'file_name': upload['metadata']['filename']}))
+        return 204, {'Upload-Offset': str(len(upload['data'])), 'Tus-Resumable': '1.0.0'}, b''
+
+    def _head(self, upload_id):
+        upload = self.uploads[upload_id]
+        return 200, {'Upload-Offset': str(len(upload['data'])), 'Upload-Length': str(upload['length']),
+                     'Cache-Control': 'no-store'}, b''
+
+    def test_failed_parts_retried(self):
+        self.failures = {1: 1000}
+        progress = []
+        response = self.hs.addResourceFile(self.res_id, self.path, folder='outputs', strategy=self.strategy,
+                                           progress_callback=lambda m: progress.append((m.bytes_read, m.len)))
+        self.assertEqual(response, {'resource_id': self.res_id, 'file_name': 'big.bin'})
+        upload = self.uploads['0']
+        self.assertEqual(bytes(upload['data']), self.data)
+        self.assertEqual(upload['metadata'], {'filename': 'big.bin', 'folder': 'outputs',
+                                              'filetype': 'application/octet-stream'})
+        # Only the part of the failed request that did not arrive was sent again
+        self.assertEqual(self.patches[:3], [0, 64 * 1024, 64 * 1024 + 1000])
+        self.assertEqual(len(self.patches), 6)
+        self.assertEqual(progress[-1], (len(self.data), len(self.data)))
+        self.assertEqual(os.listdir(self.journal_dir), [])
+
+    def test_resumed_from_journal(self):
+        self.failures = {2: 500, 3: 0}
+        self.strategy.max_part_attempts = 2
+        with self.assertRaises(HydroShareHTTPException):
+            self.hs.addResourceFile(self.res_id, self.path, strategy=self.strategy)
+        self.assertEqual(len(os.listdir(self.journal_dir)), 1)
+        received = len(self.uploads['0']['data'])
+        self.assertEqual(received, 2 * 64 * 1024 + 500)
+
+        # A new process picks the upload up where the server has it
+        del self.patches[:]
+        self.failures = {}
+        hs = self._client()
+        hs.upload_strategy = ChunkedUpload(part_size=64 * 1024, journal_dir=self.journal_dir)
+        hs.addResourceFile(self.res_id, self.path)
+        self.assertEqual(list(self.uploads), ['0'])
+        self.assertEqual(self.patches[0], received)
+        self.assertEqual(bytes(self.uploads['0']['data']), self.data)
+        self.assertEqual(os.listdir(self.journal_dir), [])
+
+    def test_persistent_conflict(self):
+        path = '/hsapi/resource/{0}/files/uploads/stuck'.format(self.res_id)
+        conflicts = []
+        self.server.add('POST', '/hsapi/resource/{0}/files/uploads/'.format(self.res_id),
+                        lambda r: (201, {'Location': path}, b''))
+        self.server.add('PATCH', path, lambda r: conflicts.append(r) or (409, {}, b''))
+        self.server.add('HEAD', path, lambda r: (200, {'Upload-Offset': '0', 'Cache-Control': 'no-store'}, b''))
+        self.strategy.max_part_attempts = 3
+        with self.assertRaises(HydroShareHTTPException) as context:
+            self.hs.addResourceFile(self.res_id, self.path, strategy=self.strategy)
+        self.assertEqual(context.exception.status_code, 409)
+        self.assertEqual(len(conflicts), 3)
+
+    def test_file_like_object(self):
+        response = self.hs.addResourceFile(self.res_id, io.BytesIO(self.data), 'model/run.bin',
+                                           strategy=self.strategy)
+        self.assertEqual(response['file_name'], 'model/run.bin')
+        self.assertEqual(self.uploads['0']['metadata']['folder'], 'model')
+        self.assertEqual(bytes(self.uploads['0']['data']), self.data)
+        self.assertFalse(os.path.exists(self.journal_dir))
+
+    def test_create_resource(self):
+        self.assertIsInstance(self.hs.upload_strategy, SinglePostUpload)
+        self.assertRaises(TypeError, UploadStrategy)
+        created = []
+        self.server.add('POST', '/hsapi/resource/', lambda r: created.append(r.body) or mocks.server.json_response(
+            json.dumps({'resource_id': self.res_id}), 201))
+        self.hs._resource_types = ['CompositeResource']
+        self.hs.upload_strategy = self.strategy
+        pid = self.hs.createResource('CompositeResource', 'Big', resource_file=self.path)
+        self.assertEqual(pid, self.res_id)
+        self.assertNotIn(b'filename=', created[0])
+        self.assertEqual(bytes(self.uploads['0']['data']), self.data)
+
+    def test_create_resource_failed_upload(self):
+        created, deleted = [], []
+        self.server.add('POST', '/hsapi/resource/', lambda r: created.append(r) or mocks.server.json_response(
+            json.dumps({'resource_id': self.res_id}), 201))
+        self.server.add('DELETE', '/hsapi/resource/{0}/'.format(self.res_id),
+                        lambda r: deleted.append(r) or (204, {}, b''))
+        self.hs._resource_types = ['CompositeResource']
+        self.failures = dict((i, 0) for i in range(10))
+        self.strategy.max_part_attempts = 2
+        with self.assertRaises(HydroShareHTTPException):
+            self.hs.createResource('CompositeResource', 'Big', resource_file=self.path, strategy=self.strategy)
+        self.assertEqual((len(created), len(deleted)), (1, 1))
+
+        # A file that cannot be uploaded separately is refused before the resource is created
+        read_end, write_end = os.pipe()
+        os.close(write_end)
+        with os.fdopen(read_end, 'rb') as pipe:
+            with self.assertRaises(HydroShareArgumentException):
+                self.hs.createResource('CompositeResource', 'Piped', resource_file=pipe, resource_filename='a.bin',
+                                       strategy=self.strategy)
+        self.assertEqual(len(created), 1)
+
+
+@unittest.skipIf(aio.aiohttp is None, "aiohttp is not installed")
+class TestAsyncHydroShare(unittest.TestCase):
+
+    def setUp(self):
+        self.res_id = '511debf8858a4ea081f78d66870da76c'
+        self.res_path = 'www.hydroshare.org/hsapi/resource/' + self.res_id
+        self.server = mocks.server.StandInServer()
+
+        def fixture(path):
+            with open(path, 'rb') as f:
+                return f.read()
+
+        def file_list(request):
+            page = request.query.get('page', ['1'])[0]
+            content = fixture(self.res_path + '/files/file_list-' + page)
+            # Point the 'next' link at the stand-in server
+            content = content.replace(b'http://www.hydroshare.org/hsapi', self.server.url_base.encode())
+            return mocks.server.json_response(content)
+
+        base = '/hsapi/resource/' + self.res_id
+        self.server.add('GET', base + '/sysmeta/',
+                        lambda r: mocks.server.json_response(fixture(self.res_path + '/sysmeta/' + self.res_id)))
+        self.server.add('GET', base + '/scimeta/elements',
+                        lambda r: mocks.server.json_response(fixture(self.res_path + '/scimeta/elements/scimeta-get-response')))
+        self.server.add('GET', base + '/files/', file_list)
+        self.server.add('GET', base + '/files/another_resource_file.txt',
+                        lambda r: (200, {}, fixture('mocks/data/another_resource_file.txt')))
+        self.server.add('POST', base + '/files/',
+                        lambda r: mocks.server.json_response(fixture(self.res_path + '/files/add-response'), 201))
+        self.server.add('POST', base + '/copy/', lambda r: mocks.server.json_response('{}', 202))
+        self.server.start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def _run(self, coro_fn):
+        async def runner():
+            async with aio.AsyncHydroShare(hostname='127.0.0.1', port=self.server.port, use_https=False) as hs:
+                return await coro_fn(hs)
+        return asyncio.run(runner())
+
+    def test_concurrent_metadata(self):
+        async def fetch(hs):
+            return await asyncio.gather(hs.getSystemMetadata(self.res_id),
+                                        hs.getScienceMetadata(self.res_id),
+                                        *[hs.getSystemMetadata(self.res_id) for i in range(20)])
+        results = self._run(fetch)
+        self.assertEqual(results[0]['resource_id'], self.res_id)
+        self.assertEqual(results[1]['title'], 'Great Salt Lake Level and Volume')
+        self.assertEqual(len(results), 22)
+
+    def test_not_found(self):
+        async def fetch(hs):
+            return await hs.getSystemMetadata('0' * 32)
+        self.assertRaises(HydroShareNotFound, self._run, fetch)
+
+    def test_file_list_and_download(self):
+        tmpdir = tempfile.mkdtemp()
+
+        async def fetch(hs):
+            files = [f async for f in hs.getResourceFileList(self.res_id)]
+            path = await hs.getResourceFile(self.res_id, 'another_resource_file.txt', destination=tmpdir)
+            return files, path
+        files, path = self._run(fetch)
+        self.assertEqual([f['size'] for f in files], [23550, 107545, 148, 267118, 128])
+        self.assertTrue(filecmp.cmp(path, 'mocks/data/another_resource_file.txt', shallow=False))
+        shutil.rmtree(tmpdir)
+
+    def test_add_file_and_endpoint(self):
+        async def fetch(hs):
+            added = await hs.addResourceFile(self.res_id, 'mocks/data/another_resource_file.txt')
+            copied = await hs.resource(self.res_id).copy()
+            return added, copied
+        added, copied = self._run(fetch)
+        self.assertEqual(added['resource_id'], self.res_id)
+        self.assertEqual(copied.status_code, 202)
+        upload = [r for r in self.server.requests if r.method == 'POST' and r.path.endswith('/files/')][0]
+        self.assertIn(b'another_resource_file.txt', upload.body)
+
+    def test_text_metadata(self):
+        rdf = '<rdf:RDF>Gr\u00e9at Salt Lake</rdf:RDF>'
+        self.server.add('GET', '/hsapi/scimeta/{0}/'.format(self.res_id),
+                        lambda r: (200, {'Content-Type': 'application/xml'}, rdf.encode('utf-8')))
+        self.server.add('GET', '/hsapi/resource/{0}/map/'.format(self.res_id),
+                        lambda r: (200, {'Content-Type': 'application/xml'}, b'<map/>'))
+
+        async def fetch(hs):
+            return await hs.getScienceMetadataRDF(self.res_id), await hs.getResourceMap(self.res_id)
+        self.assertEqual(self._run(fetch), (rdf, '<map/>'))
+
+    def test_unsupported_options(self):
+        async def fetch(hs):
+            listing = hs.resources(prefetch=0, ordered=True)
+            with self.assertRaises(HydroShareArgumentException):
+                hs.resources(page_workers=4)
+            with self.assertRaises(HydroShareArgumentException):
+                hs.resource(self.res_id).files.all(stream_items=True)
+            files = await hs.resource(self.res_id).files.all()
+            return listing, files
+        listing, files = self._run(fetch)
+        self.assertTrue(hasattr(listing, '__aiter__'))
+        self.assertEqual(files.status_code, 200)
+
+
 if __name__ == '__main__':
     unittest.main()